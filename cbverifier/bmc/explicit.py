@@ -0,0 +1,316 @@
+""" Explicit-state reachability of the verification problem.
+
+The trace, the alphabet and the automata of the ground specifications
+are finite and usually small, so the reachable states of the system
+can often be explored explicitly.
+
+The engine visits (in breadth-first order) the states of the system
+encoded by TSEncoder, without using a SAT solver. A state is a tuple:
+  - the value of the pc of the callbacks;
+  - the tuple of the values of the pcs of the automata;
+  - the enabled status of the messages (an integer used as a bitset).
+
+The transitions are read from the structures of the encoder: the
+graph of the pc of the callbacks (TSEncoder.pc_graph), the steps of
+the deterministic automata on the letters and the effects of the
+ground specifications. The semantic is the one of the symbolic
+transition system (TSEncoder.get_ts_encoding), so the engine finds the
+same errors of BMC and, since it explores all the reachable states,
+it also proves that the system is SAFE.
+
+The engine also simulates a concrete trace (see simulate): the
+automata are deterministic, so the simulation executes the trace
+in linear time.
+
+The counterexamples are in the format of BMC (a list of assignments
+to the state and input variables of the transition system), so they
+can be printed with CexPrinter.
+
+"""
+
+import logging
+
+from cbverifier.encoding.encoder import TSEncoder
+
+
+class ExplicitReachability:
+    """ Explicit-state breadth-first search of the error states of
+    the encoding of TSEncoder.
+    """
+
+    SAFE = "SAFE"
+    UNSAFE = "UNSAFE"
+    UNKNOWN = "UNKNOWN"
+
+    def __init__(self, ts_enc):
+        if ts_enc.large_block:
+            raise Exception("The explicit engine does not support " \
+                            "the large block encoding")
+        self.ts_enc = ts_enc
+        self.ts = ts_enc.get_ts_encoding()
+
+        (self.auto_pcs, effects) = ts_enc._get_spec_effects()
+        auto_index = dict((auto_pc, i) for (i, auto_pc)
+                          in enumerate(self.auto_pcs))
+
+        # bit of the enabled status of each message
+        self.keys = sorted(set(ts_enc.state_msgs).union(effects.keys()))
+        self.key2bit = dict((key, i) for (i, key) in enumerate(self.keys))
+
+        # list of (bit, list of (automaton index, final states, is_enable))
+        self.effects = []
+        for key in sorted(effects.keys()):
+            key_effects = [(auto_index[auto_pc], final_states, is_enable)
+                           for (auto_pc, final_states, is_enable)
+                           in effects[key]]
+            self.effects.append((self.key2bit[key], key_effects))
+
+        # memo of the steps of all the automata on a letter
+        self.letter_steps = {}
+
+    def find_bug(self, max_depth=None):
+        """ Explores the reachable states of the system, up to
+        max_depth steps (all the reachable states if None).
+
+        Returns a pair (result, cex): result is SAFE, UNSAFE or
+        UNKNOWN (if max_depth is reached) and cex is a counterexample
+        (None if result is not UNSAFE).
+        """
+        init = self._get_initial_state()
+        if init is None:
+            # no initial states
+            return (ExplicitReachability.SAFE, None)
+
+        # map from a visited state to its predecessor and the letter
+        # read to reach the state
+        parents = {init : None}
+        frontier = [init]
+        depth = 0
+        while (len(frontier) > 0):
+            for state in frontier:
+                if state[0] == self.ts_enc.pc_error_state:
+                    logging.info("Explicit search: error found at " \
+                                 "depth %d (%d states)" % (depth,
+                                                           len(parents)))
+                    return (ExplicitReachability.UNSAFE,
+                            self._build_cex(state, parents))
+
+            if max_depth is not None and depth >= max_depth:
+                logging.info("Explicit search: reached depth %d " \
+                             "(%d states)" % (depth, len(parents)))
+                return (ExplicitReachability.UNKNOWN, None)
+
+            next_frontier = []
+            for state in frontier:
+                for (letter, succ) in self._get_successors(state):
+                    if succ not in parents:
+                        parents[succ] = (state, letter)
+                        next_frontier.append(succ)
+            frontier = next_frontier
+            depth += 1
+            logging.debug("Explicit search: depth %d, %d states" % (depth,
+                                                                     len(parents)))
+
+        logging.info("Explicit search: visited all the %d reachable " \
+                     "states" % len(parents))
+        return (ExplicitReachability.SAFE, None)
+
+    def simulate(self, trace_steps):
+        """ Simulates the sequence of transitions of the pc of the
+        callbacks trace_steps (see TSEncoder.get_trace_steps).
+
+        Returns the same result of BMC.simulate: a tuple (step,
+        trace, last_trace), where step is the number of simulated
+        steps (the first step that cannot be simulated if trace is
+        None), trace is the simulated trace (None if the simulation
+        gets stuck) and last_trace is the last trace that can be
+        simulated (only computed in debug mode, as in BMC.simulate).
+        """
+        logging.info("Simulating a trace with %d messages" % len(trace_steps))
+
+        debug = logging.getLogger().getEffectiveLevel() == logging.DEBUG
+
+        init = self._get_initial_state()
+        if init is None:
+            return (0, None, None)
+
+        # levels[i] maps the states reached after i steps to their
+        # predecessor and the letter read to reach them
+        levels = [{init : None}]
+        last_trace = None
+        for i in range(len(trace_steps)):
+            if debug:
+                last_trace = self._build_levels_cex(levels)
+
+            (msg_key, current_state, next_state) = trace_steps[i]
+            logging.debug("Simulating step %d/%d" % (i + 1, len(trace_steps)))
+
+            next_level = {}
+            for state in levels[-1]:
+                # progress only if the message is enabled
+                if (state[0] != current_state or
+                    not self._is_enabled(state[2], msg_key)):
+                    continue
+                for (letter, succ) in self._get_successors(state):
+                    if succ[0] == next_state and succ not in next_level:
+                        next_level[succ] = (state, letter)
+
+            if len(next_level) == 0:
+                return (i + 1, None, last_trace)
+            levels.append(next_level)
+
+        trace = self._build_levels_cex(levels)
+        if debug:
+            last_trace = trace
+        return (len(trace_steps), trace, last_trace)
+
+    def _get_initial_state(self):
+        """ Returns the initial state, None if the initial states
+        are inconsistent """
+        autos = []
+        for auto_pc in self.auto_pcs:
+            (auto, auto2ts_map) = self.ts_enc.pc2auto[auto_pc]
+            # the automata are deterministic
+            assert len(auto.initial_states) == 1
+            for a_init in auto.initial_states:
+                autos.append(auto2ts_map[a_init])
+        autos = tuple(autos)
+
+        # the messages are enabled if a specification does not
+        # disable them (see TSEncoder._encode_initial_conditions)
+        all_enabled = (1 << len(self.keys)) - 1
+        enabled = self._apply_effects(autos, all_enabled)
+        if enabled is None:
+            return None
+        return (0, autos, enabled)
+
+    def _get_steps(self, letter):
+        """ Returns the list of the steps of the automata on letter """
+        steps = self.letter_steps.get(letter)
+        if steps is None:
+            steps = [self.ts_enc._get_auto_step(auto_pc, letter)
+                     for auto_pc in self.auto_pcs]
+            self.letter_steps[letter] = steps
+        return steps
+
+    def _apply_effects(self, autos, enabled):
+        """ Returns the enabled status after the automata reach the
+        states autos, None if a message is both enabled and disabled.
+        """
+        for (bit, key_effects) in self.effects:
+            enable = False
+            disable = False
+            for (i, final_states, is_enable) in key_effects:
+                if autos[i] in final_states:
+                    if is_enable:
+                        enable = True
+                    else:
+                        disable = True
+            if enable and disable:
+                return None
+            elif enable:
+                enabled = enabled | (1 << bit)
+            elif disable:
+                enabled = enabled & ~(1 << bit)
+        return enabled
+
+    def _is_enabled(self, enabled, key):
+        bit = self.key2bit.get(key)
+        if bit is None:
+            # the message is always enabled
+            return True
+        return ((enabled >> bit) & 1) == 1
+
+    def _get_successors(self, state):
+        """ Returns the list of (letter, successor) of state """
+        (pc, autos, enabled) = state
+        successors = []
+        for (next_pc, letter, guard_key, guard_value) in self.ts_enc.pc_graph.get(pc, []):
+            if (guard_key is not None and
+                self._is_enabled(enabled, guard_key) != guard_value):
+                continue
+
+            next_autos = []
+            for (i, step) in enumerate(self._get_steps(letter)):
+                a_next = step[autos[i]]
+                if a_next is None:
+                    # the automaton cannot read the letter
+                    break
+                next_autos.append(a_next)
+            else:
+                next_autos = tuple(next_autos)
+                next_enabled = self._apply_effects(next_autos, enabled)
+                if next_enabled is not None:
+                    successors.append((letter,
+                                       (next_pc, next_autos, next_enabled)))
+        return successors
+
+    def _build_cex(self, state, parents):
+        """ Builds the counterexample that reaches state """
+        # walking back, the parent of a state is paired with the
+        # letter read from the parent
+        path = []
+        letter = None
+        while state is not None:
+            path.append((state, letter))
+            parent = parents[state]
+            if parent is None:
+                state = None
+            else:
+                (state, letter) = parent
+        path.reverse()
+        return self._get_path_cex(path)
+
+    def _build_levels_cex(self, levels):
+        """ Builds the counterexample that reaches a state in the
+        last level of levels (see simulate) """
+        # any state of the last level
+        state = next(iter(levels[-1]))
+        path = []
+        letter = None
+        for i in reversed(range(len(levels))):
+            path.append((state, letter))
+            parent = levels[i][state]
+            if parent is not None:
+                (state, letter) = parent
+        path.reverse()
+        return self._get_path_cex(path)
+
+    def _get_path_cex(self, path):
+        """ Returns the counterexample of path, a list of (state,
+        letter read in the transition from the state), where the
+        letter of the last state is None """
+        return [self._get_assignment(state, letter)
+                for (state, letter) in path]
+
+    def _get_assignment(self, state, letter):
+        """ Returns the assignment to the variables of the transition
+        system for state and the input letter (if not None).
+        """
+        (pc, autos, enabled) = state
+        cenc = self.ts_enc.cenc
+
+        values = {}
+        values.update(cenc.get_val_assignment(TSEncoder._get_pc_name(), pc))
+        for (auto_pc, a_s) in zip(self.auto_pcs, autos):
+            values.update(cenc.get_val_assignment(auto_pc, a_s))
+        if letter is not None:
+            values.update(self.ts_enc.r2a.get_msg_assignment(letter))
+
+        assignment = {}
+        for var in self.ts.state_vars:
+            if var in values:
+                assignment[var] = values[var].is_true()
+            else:
+                assignment[var] = False
+        for key in self.keys:
+            var = TSEncoder._get_state_var(key)
+            if var in self.ts.state_vars:
+                assignment[var] = self._is_enabled(enabled, key)
+        if letter is not None:
+            for var in self.ts.input_vars:
+                if var in values:
+                    assignment[var] = values[var].is_true()
+                else:
+                    assignment[var] = False
+        return assignment
@@ -0,0 +1,336 @@
+""" IC3 (Property Directed Reachability)
+
+Proves that the error states of a transition system are not reachable
+without an external model checker (see NuXmvDriver.ic3).
+
+The engine works on the Boolean transition system (state variables,
+input variables, initial condition and transition relation over the
+state variables and their next version) built by TSEncoder.
+
+The frames are stored as in the "delta" encoding of PDR: a lemma (a
+clause over the state variables) is kept only in the highest frame
+where it holds, so that the frame F_i is the conjunction of the lemmas
+of the frames F_i, F_i+1, ..., F_k.
+
+All the queries are solved by a single incremental solver:
+  - the initial condition, the transition relation, the error and the
+    lemmas of each frame are guarded by activation literals, that are
+    enabled with assumptions;
+  - the (temporary) negation of a cube in the relative induction
+    queries is asserted with push/pop.
+
+The engine can be seeded with invariants (e.g. the lemmas learned on a
+less precise set of specifications, see get_lemmas): each invariant
+is added to the first frame if it holds in the initial states and
+in their successors, and it is discarded otherwise.
+"""
+
+import heapq
+import logging
+
+from pysmt.logics import QF_BOOL
+from pysmt.typing import BOOL
+from pysmt.shortcuts import Solver
+from pysmt.shortcuts import Symbol
+from pysmt.shortcuts import Not, And, Or, Implies
+
+from cbverifier.helpers import Helper
+
+
+class IC3:
+    """ IC3 on the transition system ts """
+
+    SAFE = "SAFE"
+    UNSAFE = "UNSAFE"
+    UNKNOWN = "UNKNOWN"
+
+    def __init__(self, helper, ts, error, invariants=None):
+        self.helper = helper
+        self.ts = ts
+        self.error = error
+        self.invariants = [] if invariants is None else list(invariants)
+
+        self.state_vars = sorted(ts.state_vars, key=lambda v: v.symbol_name())
+        mgr = self.helper.env.formula_manager
+        self.next_vars = dict((v, Helper.get_next_var(v, mgr))
+                              for v in self.state_vars)
+
+        self.solver = None
+        # frames[i] is the list of the lemmas of the frame i
+        # (frames[0] is not used, F_0 is the initial condition)
+        self.frames = []
+        self.frame_lits = []
+        self.inductive_frame = None
+
+        self.stats = {}
+
+    def prove(self, max_frames):
+        """ Tries to prove that the error is not reachable using
+        IC3, exploring at most max_frames frames.
+
+        Returns a pair (result, cex): result is SAFE, UNSAFE or
+        UNKNOWN (max_frames is reached) and cex is a counterexample
+        in the format of BMC (None if result is not UNSAFE).
+        """
+        self._init_solver()
+
+        # error in the initial states
+        if self._solve([self.init_lit, self.error_lit]):
+            (state, _) = self._get_model_state(False)
+            logging.info("IC3: the initial states are not safe")
+            return (IC3.UNSAFE, [self._get_assignment(state, None)])
+
+        self._add_frame()
+        self._add_frame()
+        self._add_invariants()
+
+        k = 1
+        while (k <= max_frames):
+            logging.info("IC3: blocking the error at frame %d..." % k)
+            while (self._solve(self._get_frame_lits(k) + [self.error_lit])):
+                (state, _) = self._get_model_state(False)
+                cex = self._block(state, k)
+                if cex is not None:
+                    logging.info("IC3: found a counterexample of " \
+                                 "length %d" % len(cex))
+                    return (IC3.UNSAFE, cex)
+
+            self._add_frame()
+            if self._propagate(k):
+                logging.info("IC3: frame %d is inductive" % self.inductive_frame)
+                return (IC3.SAFE, None)
+            k = k + 1
+
+        logging.info("IC3: explored %d frames" % max_frames)
+        return (IC3.UNKNOWN, None)
+
+    def get_lemmas(self):
+        """ Returns the list of the lemmas of the inductive invariant
+        (if the system is SAFE) or of the first frame (the lemmas
+        learned so far).
+
+        The lemmas can seed the invariants of another instance of IC3.
+        """
+        if self.inductive_frame is not None:
+            first = self.inductive_frame
+        else:
+            first = 1
+        lemmas = []
+        for i in range(first, len(self.frames)):
+            lemmas.extend(self.frames[i])
+        return lemmas
+
+    def get_stats(self):
+        """ Returns the statistics of the last run: the number of
+        frames, of lemmas, of lemmas in each frame, of proof
+        obligations, of solver queries and of accepted invariants.
+        """
+        stats = dict(self.stats)
+        stats["frames"] = max(len(self.frames) - 1, 0)
+        stats["frame_lemmas"] = [len(f) for f in self.frames[1:]]
+        stats["lemmas"] = sum(stats["frame_lemmas"])
+        return stats
+
+    def _init_solver(self):
+        self.solver = Solver(name='z3', logic=QF_BOOL)
+        self.frames = []
+        self.frame_lits = []
+        self.inductive_frame = None
+        self.stats = {"obligations" : 0,
+                      "queries" : 0,
+                      "invariants" : 0}
+
+        self.init_lit = Symbol("__ic3_init__", BOOL)
+        self.trans_lit = Symbol("__ic3_trans__", BOOL)
+        self.error_lit = Symbol("__ic3_error__", BOOL)
+        self.solver.add_assertion(Implies(self.init_lit, self.ts.init))
+        self.solver.add_assertion(Implies(self.trans_lit, self.ts.trans))
+        self.solver.add_assertion(Implies(self.error_lit, self.error))
+
+    def _solve(self, assumptions):
+        self.stats["queries"] += 1
+        return self.solver.solve(assumptions)
+
+    def _add_frame(self):
+        i = len(self.frames)
+        self.frames.append([])
+        self.frame_lits.append(Symbol("__ic3_frame_%d__" % i, BOOL))
+
+    def _get_frame_lits(self, i):
+        """ Returns the assumptions that enable the frame i """
+        if i == 0:
+            return [self.init_lit]
+        return self.frame_lits[i:]
+
+    def _add_lemma(self, lemma, i):
+        self.frames[i].append(lemma)
+        self.solver.add_assertion(Or(Not(self.frame_lits[i]), lemma))
+
+    def _add_invariants(self):
+        """ Adds the invariants that hold in the initial states and
+        in their successors to the first frame """
+        state_vars = set(self.state_vars)
+        for invar in self.invariants:
+            if (not invar.get_free_variables().issubset(state_vars) or
+                self._is_falsified(invar, [self.init_lit]) or
+                self._is_falsified(self._get_next(invar),
+                                   [self.init_lit, self.trans_lit])):
+                logging.debug("IC3: discarded the invariant %s" % invar)
+            else:
+                self._add_lemma(invar, 1)
+                self.stats["invariants"] += 1
+        logging.info("IC3: added %d invariants out of %d" %
+                     (self.stats["invariants"], len(self.invariants)))
+
+    def _is_falsified(self, formula, assumptions):
+        """ True if formula is false in some model of assumptions """
+        self.solver.push()
+        self.solver.add_assertion(Not(formula))
+        res = self._solve(assumptions)
+        self.solver.pop()
+        return res
+
+    def _block(self, state, k):
+        """ Blocks the state at frame k.
+
+        Returns a counterexample if the state is reachable, None
+        otherwise.
+        """
+        # queue of proof obligations (frame, id, obligation), where the
+        # obligation is a tuple (state, inputs to reach the successor,
+        # obligation of the successor)
+        queue = []
+        count = 0
+        heapq.heappush(queue, (k, count, (state, None, None)))
+
+        while (len(queue) > 0):
+            (i, _, obligation) = heapq.heappop(queue)
+            self.stats["obligations"] += 1
+            state = obligation[0]
+
+            if (self._is_blocked(state, i)):
+                continue
+
+            pred = self._get_predecessor(state, i)
+            if pred is not None:
+                (pred_state, pred_inputs) = pred
+                pred_obligation = (pred_state, pred_inputs, obligation)
+                if (i == 1 or self._is_initial(pred_state)):
+                    return self._build_cex(pred_obligation)
+                count = count + 1
+                heapq.heappush(queue, (i - 1, count, pred_obligation))
+                count = count + 1
+                heapq.heappush(queue, (i, count, obligation))
+            else:
+                cube = self._generalize(state, i)
+                j = i
+                while (j < k and self._is_relative_inductive(cube, j + 1)):
+                    j = j + 1
+                self._add_lemma(Not(And(self._get_lits(cube, False))), j)
+                logging.debug("IC3: blocked a cube of %d literals at " \
+                              "frame %d" % (len(cube), j))
+                if (j < k):
+                    count = count + 1
+                    heapq.heappush(queue, (j + 1, count, obligation))
+        return None
+
+    def _is_blocked(self, cube, i):
+        """ True if the cube is not in the frame i """
+        return not self._solve(self._get_frame_lits(i) +
+                               self._get_lits(cube, False))
+
+    def _is_initial(self, cube):
+        """ True if the cube intersects the initial states """
+        return self._solve([self.init_lit] + self._get_lits(cube, False))
+
+    def _get_predecessor(self, cube, i):
+        """ Returns a predecessor (state, inputs) of the cube in the
+        frame i - 1 outside the cube, None if the cube is inductive
+        relative to the frame i - 1.
+        """
+        self.solver.push()
+        self.solver.add_assertion(Not(And(self._get_lits(cube, False))))
+        res = self._solve(self._get_frame_lits(i - 1) + [self.trans_lit] +
+                          self._get_lits(cube, True))
+        if res:
+            pred = self._get_model_state(True)
+        else:
+            pred = None
+        self.solver.pop()
+        return pred
+
+    def _is_relative_inductive(self, cube, i):
+        """ True if the cube does not intersect the initial states
+        and it is inductive relative to the frame i - 1 """
+        return (not self._is_initial(cube) and
+                self._get_predecessor(cube, i) is None)
+
+    def _generalize(self, cube, i):
+        """ Removes the literals of the cube, while the cube is
+        inductive relative to the frame i - 1 """
+        cube = list(cube)
+        for lit in list(cube):
+            if len(cube) == 1:
+                break
+            candidate = [l for l in cube if l != lit]
+            if self._is_relative_inductive(candidate, i):
+                cube = candidate
+        return cube
+
+    def _propagate(self, k):
+        """ Pushes the lemmas of the frames 1..k to the next frame.
+
+        Returns True if a frame is inductive.
+        """
+        for i in range(1, k + 1):
+            for lemma in list(self.frames[i]):
+                if not self._is_falsified(self._get_next(lemma),
+                                          self._get_frame_lits(i) +
+                                          [self.trans_lit]):
+                    self.frames[i].remove(lemma)
+                    self._add_lemma(lemma, i + 1)
+            if len(self.frames[i]) == 0:
+                self.inductive_frame = i
+                return True
+        return False
+
+    def _get_next(self, formula):
+        return self.helper.get_next_formula(self.state_vars, formula)
+
+    def _get_lits(self, cube, is_next):
+        """ Returns the literals of the cube (a list of (var, value))
+        on the current or next state variables """
+        lits = []
+        for (var, value) in cube:
+            if is_next:
+                var = self.next_vars[var]
+            lits.append(var if value else Not(var))
+        return lits
+
+    def _get_model_state(self, with_inputs):
+        """ Returns the (state, inputs) of the model of the last query,
+        where state is a cube on all the state variables """
+        model = self.solver.get_model()
+        state = tuple((var, model.get_py_value(var, True))
+                      for var in self.state_vars)
+        inputs = None
+        if with_inputs:
+            inputs = dict((var, model.get_py_value(var, True))
+                          for var in self.ts.input_vars)
+        return (state, inputs)
+
+    def _build_cex(self, obligation):
+        """ Builds the counterexample from the obligation of an
+        initial state """
+        cex = []
+        while obligation is not None:
+            (state, inputs, succ) = obligation
+            cex.append(self._get_assignment(state, inputs))
+            obligation = succ
+        return cex
+
+    def _get_assignment(self, state, inputs):
+        assignment = dict(state)
+        if inputs is not None:
+            assignment.update(inputs)
+        return assignment
@@ -0,0 +1,93 @@
+""" K-induction
+
+Proves that the error states of a transition system are not reachable
+without an external model checker.
+
+The base case and the step case are checked with the same (incremental)
+solver, on the same unrolling of the transition relation:
+  - the initial condition at time 0 is enabled with an assumption
+    (it is only used in the base case);
+  - the error at step k is enabled with an assumption;
+  - after checking the step k, the error is not reachable in k steps,
+    and its negation is asserted at step k.
+
+Both the cases are restricted to simple paths (the states of the path
+are pairwise different), so that the induction is complete on finite
+systems.
+"""
+
+import logging
+
+from pysmt.typing import BOOL
+from pysmt.shortcuts import Symbol
+from pysmt.shortcuts import Not, Or, Implies, Iff
+
+from cbverifier.bmc.bmc import BMC
+
+
+class KInduction(BMC):
+    """ K-induction on the transition system ts """
+
+    SAFE = "SAFE"
+    UNSAFE = "UNSAFE"
+    UNKNOWN = "UNKNOWN"
+
+    def prove(self, k):
+        """ Tries to prove that the error is not reachable using
+        k-induction, up to k steps.
+
+        Returns a pair (result, cex): result is SAFE, UNSAFE or
+        UNKNOWN (the property is not k-inductive) and cex is a
+        counterexample (None if result is not UNSAFE).
+        """
+        solver = self._get_solver()
+
+        # the initial condition holds in the base case
+        init_lit = Symbol("__kind_init__", BOOL)
+        init_at_0 = self.helper.get_formula_at_i(self.all_vars,
+                                                 self.ts.init, 0)
+        solver.add_assertion(Implies(init_lit, init_at_0))
+
+        for i in range(k + 1):
+            if (i > 0):
+                trans_at_i = self.helper.get_formula_at_i(self.all_vars,
+                                                          self.ts.trans,
+                                                          i - 1)
+                solver.add_assertion(trans_at_i)
+                # simple path
+                for j in range(i):
+                    solver.add_assertion(self._get_diff_states(j, i))
+
+            error_at_i = self.helper.get_formula_at_i(self.all_vars,
+                                                      self.error, i)
+            error_lit = Symbol("__kind_error_%d__" % i, BOOL)
+            solver.add_assertion(Implies(error_lit, error_at_i))
+
+            # base case: the error is reachable in i steps
+            logging.info("K-induction: base case at step %d..." % i)
+            if (solver.solve([init_lit, error_lit])):
+                logging.debug("The base case is satisfiable...")
+                model = solver.get_model()
+                return (KInduction.UNSAFE, self._build_trace(model, i))
+
+            # step case: i steps without errors cannot reach an error
+            logging.info("K-induction: step case at step %d..." % i)
+            if (not solver.solve([error_lit])):
+                logging.info("The property is %d-inductive" % i)
+                return (KInduction.SAFE, None)
+
+            # the error is not reachable in i steps
+            solver.add_assertion(Not(error_at_i))
+
+        logging.info("The property is not %d-inductive" % k)
+        return (KInduction.UNKNOWN, None)
+
+    def _get_diff_states(self, i, j):
+        """ Returns the formula that is true if the states at time i
+        and j are different """
+        diff = []
+        for var in self.ts.state_vars:
+            var_i = self.helper.get_formula_at_i(self.all_vars, var, i)
+            var_j = self.helper.get_formula_at_i(self.all_vars, var, j)
+            diff.append(Not(Iff(var_i, var_j)))
+        return Or(diff)
@@ -5,15 +5,25 @@ import sys
 import os
 import optparse
 import logging
+import multiprocessing
+import signal
+from cStringIO import StringIO
 
 
 from cbverifier.traces.ctrace import CTraceSerializer, CCallin
 from cbverifier.traces.ctrace import CCallback, MessageFilter
 from cbverifier.traces.ctrace import MalformedTraceException, TraceEndsInErrorException
+from cbverifier.traces.trace_cache import TraceCache
 from cbverifier.specs.spec import Spec
 from cbverifier.encoding.encoder import TSEncoder
+from cbverifier.encoding.encoding_cache import EncodingCache, CachedEncoding
+from cbverifier.encoding.grounding import GroundSpecs
+from cbverifier.encoding.automata import AutoEnv
 from cbverifier.encoding.cex_printer import CexPrinter
 from cbverifier.bmc.bmc import BMC
+from cbverifier.bmc.explicit import ExplicitReachability
+from cbverifier.bmc.kind import KInduction
+from cbverifier.bmc.ic3 import IC3
 
 from cbverifier.utils.stats import Stats
 
@@ -21,6 +31,16 @@ from smv.tosmv import SmvTranslator, NuXmvDriver
 from pysmt.shortcuts import Not
 
 class DriverOptions:
+    # Engines used to simulate the trace
+    EXPLICIT_SIMULATION = "explicit"
+    SAT_SIMULATION = "sat"
+    SIMULATION_ENGINES = [EXPLICIT_SIMULATION, SAT_SIMULATION]
+
+    # Implementations of IC3
+    NUXMV_IC3 = "nuxmv"
+    NATIVE_IC3 = "native"
+    IC3_ENGINES = [NUXMV_IC3, NATIVE_IC3]
+
     def __init__(self,
                  tracefile,
                  traceformat,
@@ -28,7 +48,18 @@ class DriverOptions:
                  simplify_trace,
                  debug,
                  filter_msgs,
-                 allow_exception=True):
+                 allow_exception=True,
+                 trace_cache_dir=None,
+                 grounding_engine=GroundSpecs.SAT_ENGINE,
+                 grounding_jobs=1,
+                 enc_coi=False,
+                 enc_large_block=False,
+                 enc_labels=AutoEnv.SAT_LABELS,
+                 enc_merge=False,
+                 enc_merge_max_states=TSEncoder.MERGE_MAX_STATES,
+                 encoding_cache_dir=None,
+                 simulation_engine=SAT_SIMULATION,
+                 ic3_engine=NUXMV_IC3):
         self.tracefile = tracefile
         self.traceformat = traceformat
         self.spec_file_list = spec_file_list
@@ -36,6 +67,17 @@ class DriverOptions:
         self.debug = debug
         self.filter_msgs = filter_msgs
         self.allow_exception = allow_exception
+        self.trace_cache_dir = trace_cache_dir
+        self.grounding_engine = grounding_engine
+        self.grounding_jobs = grounding_jobs
+        self.enc_coi = enc_coi
+        self.enc_large_block = enc_large_block
+        self.enc_labels = enc_labels
+        self.enc_merge = enc_merge
+        self.enc_merge_max_states = enc_merge_max_states
+        self.encoding_cache_dir = encoding_cache_dir
+        self.simulation_engine = simulation_engine
+        self.ic3_engine = ic3_engine
 
 class NoDisableException(Exception):
     def __init__(self,*args,**kwargs):
@@ -49,14 +91,32 @@ class Driver:
         self.stats = Stats()
         self.stats.enable()
 
+        if self.opts.trace_cache_dir is not None:
+            trace_cache = TraceCache(self.opts.trace_cache_dir)
+        else:
+            trace_cache = TraceCache.get_default()
+
+        if self.opts.encoding_cache_dir is not None:
+            self.encoding_cache = EncodingCache(self.opts.encoding_cache_dir)
+        else:
+            self.encoding_cache = EncodingCache.get_default()
+
+        # lemmas learned by the last run of the native ic3
+        self.ic3_lemmas = None
+
         # Parse the trace
         try:
             self.stats.start_timer(Stats.PARSING_TIME)
             self.trace = CTraceSerializer.read_trace_file_name(self.opts.tracefile,
                                                                self.opts.traceformat == "json",
-                                                               self.opts.allow_exception)
+                                                               self.opts.allow_exception,
+                                                               trace_cache,
+                                                               self.stats)
             self.stats.stop_timer(Stats.PARSING_TIME)
             self.stats.write_times(sys.stdout, Stats.PARSING_TIME)
+            if trace_cache is not None:
+                self.stats.write_counter(sys.stdout, Stats.TRACE_CACHE_HITS)
+                self.stats.write_counter(sys.stdout, Stats.TRACE_CACHE_MISSES)
         except MalformedTraceException as e:
             raise
         except TraceEndsInErrorException as e:
@@ -87,16 +147,69 @@ class Driver:
         stream.write("\n")
 
     def get_ground_specs(self, get_map = False):
-        ts_enc = TSEncoder(self.trace, self.spec_list, False, self.stats)
+        ts_enc = TSEncoder(self.trace, self.spec_list, False, self.stats,
+                           self.opts.grounding_engine,
+                           self.opts.grounding_jobs)
         if not get_map:
             ground_specs = ts_enc.get_ground_spec()
         else:
             ground_specs = ts_enc.get_orig_ground_spec()
         return ground_specs
 
+    def _get_ts_encoder(self):
+        return TSEncoder(self.trace, self.spec_list,
+                         self.opts.simplify_trace,
+                         self.stats,
+                         self.opts.grounding_engine,
+                         self.opts.grounding_jobs,
+                         self.opts.enc_coi,
+                         self.opts.enc_large_block,
+                         self.opts.enc_labels,
+                         self.opts.enc_merge,
+                         self.opts.enc_merge_max_states)
+
+    def _get_encoding(self, with_trace_encoding=False):
+        """ Returns the encoding of the trace and the specifications
+        (a TSEncoder, or a CachedEncoding if the encodings are cached).
+
+        with_trace_encoding must be True if the encoding of the whole
+        trace is needed (e.g. to simulate the trace).
+        """
+        if self.encoding_cache is None:
+            return self._get_ts_encoder()
+
+        options = [self.opts.traceformat,
+                   self.opts.allow_exception,
+                   self.opts.simplify_trace,
+                   self.opts.grounding_engine,
+                   self.opts.enc_coi,
+                   self.opts.enc_large_block,
+                   self.opts.enc_labels,
+                   self.opts.enc_merge,
+                   self.opts.enc_merge_max_states]
+        key = EncodingCache.get_key(self.opts.tracefile,
+                                    self.opts.spec_file_list,
+                                    options)
+        encoding = self.encoding_cache.load(key)
+        if (encoding is not None and
+            (encoding.trace_encoding is not None or not with_trace_encoding)):
+            self.stats.inc_counter(Stats.ENCODING_CACHE_HITS)
+        else:
+            self.stats.inc_counter(Stats.ENCODING_CACHE_MISSES)
+            ts_enc = self._get_ts_encoder()
+            if with_trace_encoding:
+                trace_encoding = ts_enc.get_trace_encoding()
+            else:
+                trace_encoding = None
+            encoding = CachedEncoding.from_encoder(ts_enc, trace_encoding)
+            self.encoding_cache.store(key, encoding)
+
+        self.stats.write_counter(sys.stdout, Stats.ENCODING_CACHE_HITS)
+        self.stats.write_counter(sys.stdout, Stats.ENCODING_CACHE_MISSES)
+        return encoding
+
     def run_bmc(self, depth, inc=False):
-        ts_enc = TSEncoder(self.trace, self.spec_list, self.opts.simplify_trace,
-                           self.stats)
+        ts_enc = self._get_encoding()
 
         self.stats.start_timer(Stats.VERIFICATION_TIME)
 
@@ -113,9 +226,7 @@ class Driver:
         return (cex, ts_enc.mapback)
 
     def to_smv(self, smv_file_name):
-        ts_enc = TSEncoder(self.trace, self.spec_list,
-                           self.opts.simplify_trace,
-                           self.stats)
+        ts_enc = self._get_encoding()
         ts = ts_enc.get_ts_encoding()
         ts2smv = SmvTranslator(ts_enc.pysmt_env,
                                ts.state_vars,
@@ -128,10 +239,17 @@ class Driver:
             ts2smv.to_smv(f)
             f.close()
 
-    def run_ic3(self, nuxmv_path, ic3_frames):
-        ts_enc = TSEncoder(self.trace, self.spec_list,
-                           self.opts.simplify_trace,
-                           self.stats)
+    def run_ic3(self, nuxmv_path, ic3_frames, invariants=None):
+        """ Runs ic3 on the system, with nuXmv or with the native
+        implementation (see DriverOptions.ic3_engine).
+
+        The native engine is seeded with the list of invariants (if
+        not None), and stores the lemmas it learns in ic3_lemmas.
+        """
+        if self.opts.ic3_engine == DriverOptions.NATIVE_IC3:
+            return self._run_native_ic3(ic3_frames, invariants)
+
+        ts_enc = self._get_encoding()
         ts = ts_enc.get_ts_encoding()
 
         self.stats.start_timer(Stats.VERIFICATION_TIME,True)
@@ -145,10 +263,326 @@ class Driver:
 
         return (result, trace, ts_enc.mapback)
 
+    def _run_native_ic3(self, ic3_frames, invariants):
+        ts_enc = self._get_encoding()
+
+        self.stats.start_timer(Stats.VERIFICATION_TIME)
+
+        ic3 = IC3(ts_enc.helper,
+                  ts_enc.get_ts_encoding(),
+                  ts_enc.error_prop,
+                  invariants)
+        (result, cex) = ic3.prove(ic3_frames)
+        self.ic3_lemmas = ic3.get_lemmas()
+
+        self.stats.stop_timer(Stats.VERIFICATION_TIME)
+        self.stats.write_times(sys.stdout, Stats.VERIFICATION_TIME)
+
+        ic3_stats = ic3.get_stats()
+        self.stats.inc_counter(Stats.IC3_FRAMES, ic3_stats["frames"])
+        self.stats.inc_counter(Stats.IC3_LEMMAS, ic3_stats["lemmas"])
+        self.stats.write_counter(sys.stdout, Stats.IC3_FRAMES)
+        self.stats.write_counter(sys.stdout, Stats.IC3_LEMMAS)
+
+        return (result, cex, ts_enc.mapback)
+
+    def run_kind(self, depth):
+        """ Proves the absence of errors with k-induction, up to
+        depth steps (see KInduction) """
+        ts_enc = self._get_encoding()
+
+        self.stats.start_timer(Stats.VERIFICATION_TIME)
+
+        kind = KInduction(ts_enc.helper,
+                          ts_enc.get_ts_encoding(),
+                          ts_enc.error_prop)
+        (result, cex) = kind.prove(depth)
+
+        self.stats.stop_timer(Stats.VERIFICATION_TIME)
+        self.stats.write_times(sys.stdout, Stats.VERIFICATION_TIME)
+
+        return (result, cex, ts_enc.mapback)
+
+    def run_explicit(self):
+        """ Explores explicitly the reachable states of the system
+        (see ExplicitReachability) """
+        ts_enc = self._get_ts_encoder()
+        engine = ExplicitReachability(ts_enc)
+
+        self.stats.start_timer(Stats.VERIFICATION_TIME)
+
+        (result, cex) = engine.find_bug()
+
+        self.stats.stop_timer(Stats.VERIFICATION_TIME)
+        self.stats.write_times(sys.stdout, Stats.VERIFICATION_TIME)
+
+        return (result, cex, ts_enc.mapback)
+
+    def run_bmc_split(self, depth, inc=False, jobs=1,
+                      print_orig_spec=False):
+        """ Runs bmc on the error of each message that can be
+        disallowed (see _run_split).
+
+        The verdict is UNKNOWN if there are no bugs up to depth.
+        """
+        def check(ts_enc):
+            bmc = BMC(ts_enc.helper,
+                      ts_enc.get_ts_encoding(),
+                      ts_enc.error_prop)
+            cex = bmc.find_bug(depth, inc)
+            if cex is None:
+                return (NuXmvDriver.UNKNOWN, None)
+            else:
+                return (NuXmvDriver.UNSAFE, cex)
+
+        return self._run_split(check, jobs, print_orig_spec)
+
+    def run_ic3_split(self, nuxmv_path, ic3_frames, jobs=1,
+                      print_orig_spec=False):
+        """ Runs ic3 on the error of each message that can be
+        disallowed (see _run_split) """
+        native = self.opts.ic3_engine == DriverOptions.NATIVE_IC3
+        def check(ts_enc):
+            ts = ts_enc.get_ts_encoding()
+            if native:
+                ic3 = IC3(ts_enc.helper, ts, ts_enc.error_prop)
+                return ic3.prove(ic3_frames)
+            nuxmv_driver = NuXmvDriver(ts_enc.pysmt_env, ts, nuxmv_path)
+            return nuxmv_driver.ic3(Not(ts_enc.error_prop), ic3_frames)
+
+        return self._run_split(check, jobs, print_orig_spec)
+
+    def _run_split(self, check, jobs, print_orig_spec):
+        """ Checks the error of each message that can be disallowed
+        as an independent property.
+
+        The specifications are grounded (and the cone of influence
+        is computed) once. Then, for each message, the system is
+        encoded with the error transitions of the message only and
+        check(ts_enc) returns the verdict and the counterexample.
+
+        With jobs > 1 the properties are checked in a pool of jobs
+        processes (jobs = 0 uses a process for each cpu).
+
+        Returns the list of (key, verdict, cex) for each message key,
+        where verdict is NuXmvDriver.SAFE, UNSAFE or UNKNOWN (None if
+        the check failed) and cex is the printed counterexample (or
+        None).
+        """
+        global _split_data
+
+        ts_enc = self._get_ts_encoder()
+        error_keys = ts_enc.get_error_keys()
+
+        self.stats.start_timer(Stats.VERIFICATION_TIME)
+
+        if jobs == 0:
+            jobs = multiprocessing.cpu_count()
+        jobs = min(jobs, len(error_keys))
+
+        if jobs <= 1:
+            results = [Driver._check_error_key(ts_enc, key, check,
+                                               print_orig_spec)
+                       for key in error_keys]
+        else:
+            logging.debug("Checking %d properties with %d processes" % (len(error_keys),
+                                                                         jobs))
+            # The workers are forked after setting _split_data, so
+            # they share the grounded specifications
+            _split_data = (ts_enc, error_keys, check, print_orig_spec)
+            pool = multiprocessing.Pool(jobs)
+            try:
+                # map keeps the order of the keys
+                results = pool.map(_split_worker, range(len(error_keys)),
+                                   chunksize=1)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+                _split_data = None
+
+        self.stats.stop_timer(Stats.VERIFICATION_TIME)
+        self.stats.write_times(sys.stdout, Stats.VERIFICATION_TIME)
+
+        return results
+
+    def run_portfolio(self, depth, ic3_frames, nuxmv_path=None,
+                      print_orig_spec=False):
+        """ Runs the verification engines in parallel, stopping at
+        the first conclusive verdict.
+
+        The system is encoded once, then each engine runs in its own
+        process: bmc (incremental, up to depth), k-induction (up to
+        depth), the native ic3 (up to ic3_frames), the explicit
+        search (if the encoding supports it) and the ic3 of nuXmv (if
+        nuxmv_path is not None). The first engine that finds the
+        system SAFE or UNSAFE wins and the other processes are
+        terminated.
+
+        Returns a tuple (engine, verdict, cex), where engine is the
+        name of the winning engine (None if no engine is
+        conclusive), verdict is NuXmvDriver.SAFE, UNSAFE or UNKNOWN
+        and cex is the printed counterexample (or None).
+        """
+        ts_enc = self._get_encoding()
+        # encode the transition system before forking the workers
+        ts_enc.get_ts_encoding()
+
+        def run_bmc(ts_enc):
+            bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                      ts_enc.error_prop)
+            cex = bmc.find_bug(depth, True)
+            if cex is None:
+                return (NuXmvDriver.UNKNOWN, None)
+            else:
+                return (NuXmvDriver.UNSAFE, cex)
+
+        def run_kind(ts_enc):
+            kind = KInduction(ts_enc.helper, ts_enc.get_ts_encoding(),
+                              ts_enc.error_prop)
+            return kind.prove(depth)
+
+        def run_ic3(ts_enc):
+            ic3 = IC3(ts_enc.helper, ts_enc.get_ts_encoding(),
+                      ts_enc.error_prop)
+            return ic3.prove(ic3_frames)
+
+        def run_explicit(ts_enc):
+            return ExplicitReachability(ts_enc).find_bug()
+
+        def run_nuxmv(ts_enc):
+            nuxmv_driver = NuXmvDriver(ts_enc.pysmt_env,
+                                       ts_enc.get_ts_encoding(),
+                                       nuxmv_path)
+            return nuxmv_driver.ic3(Not(ts_enc.error_prop), ic3_frames)
+
+        # list of (name, check, True if the engine runs a subprocess)
+        engines = [("bmc", run_bmc, False),
+                   ("kind", run_kind, False),
+                   ("ic3", run_ic3, False)]
+        if (isinstance(ts_enc, TSEncoder) and
+            not self.opts.enc_large_block):
+            engines.append(("explicit", run_explicit, False))
+        if nuxmv_path is not None:
+            engines.append(("nuxmv", run_nuxmv, True))
+
+        return self._run_portfolio(ts_enc, engines, print_orig_spec)
+
+    def _run_portfolio(self, ts_enc, engines, print_orig_spec):
+        """ Runs the engines, a list of (name, check, is_sub), in
+        parallel up to the first SAFE or UNSAFE verdict (see
+        run_portfolio).
+
+        check(ts_enc) returns the verdict and the counterexample,
+        is_sub is True if check runs a subprocess, which is killed
+        when the engine is stopped.
+        """
+        global _portfolio_data
+
+        self.stats.start_timer(Stats.VERIFICATION_TIME)
+
+        logging.debug("Running %d engines" % len(engines))
+        winner = (None, NuXmvDriver.UNKNOWN, None)
+        running = set()
+        # The workers are forked after setting _portfolio_data, so
+        # they share the encoding
+        _portfolio_data = (ts_enc, engines, print_orig_spec)
+        pool = multiprocessing.Pool(len(engines))
+        try:
+            for (name, check, is_sub) in engines:
+                self.stats.start_timer(Driver._get_engine_timer(name))
+                running.add(name)
+            for result in pool.imap_unordered(_portfolio_worker,
+                                              range(len(engines))):
+                (name, verdict, cex) = result
+                self.stats.stop_timer(Driver._get_engine_timer(name))
+                running.remove(name)
+                if verdict is None:
+                    verdict = "ERROR"
+                logging.info("Engine %s: %s" % (name, verdict))
+                if verdict in [NuXmvDriver.SAFE, NuXmvDriver.UNSAFE]:
+                    winner = (name, verdict, cex)
+                    break
+            # stop the engines that are still running
+            pool.terminate()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _portfolio_data = None
+            for name in running:
+                self.stats.stop_timer(Driver._get_engine_timer(name))
+
+        self.stats.stop_timer(Stats.VERIFICATION_TIME)
+        self.stats.write_times(sys.stdout, Stats.VERIFICATION_TIME)
+        for (name, check, is_sub) in engines:
+            if name in running:
+                logging.info("Engine %s: stopped" % name)
+            self.stats.write_elapsed_time(sys.stdout,
+                                          Driver._get_engine_timer(name))
+
+        return winner
+
+    @staticmethod
+    def _get_engine_timer(name):
+        return "%s_%s" % (Stats.VERIFICATION_TIME, name)
+
+    @staticmethod
+    def _run_engine(ts_enc, name, check, is_sub, print_orig_spec):
+        """ Runs an engine of run_portfolio, returning its name, the
+        verdict (None if the engine fails) and the printed
+        counterexample.
+
+        If is_sub is True, the engine exits on SIGTERM unwinding its
+        stack, so that its subprocess is killed and its temporary
+        files are removed (see NuXmvDriver._call_sub).
+
+        A failure of the engine (also printing its counterexample)
+        is an inconclusive result, and does not stop the other engines.
+        """
+        if is_sub:
+            old_handler = signal.signal(signal.SIGTERM, _portfolio_terminate)
+        try:
+            (verdict, cex) = check(ts_enc)
+            if cex is not None:
+                stream = StringIO()
+                printer = CexPrinter(ts_enc.mapback, cex, stream,
+                                     print_orig_spec)
+                printer.print_cex()
+                cex = stream.getvalue()
+        except Exception as e:
+            logging.error("Engine %s failed: %s" % (name, repr(e)))
+            return (name, None, None)
+        finally:
+            if is_sub:
+                signal.signal(signal.SIGTERM, old_handler)
+
+        return (name, verdict, cex)
+
+    @staticmethod
+    def _check_error_key(ts_enc, key, check, print_orig_spec):
+        ts_enc.set_error_keys(set([key]))
+        (verdict, cex) = check(ts_enc)
+        if cex is not None:
+            stream = StringIO()
+            printer = CexPrinter(ts_enc.mapback, cex, stream, print_orig_spec)
+            printer.print_cex()
+            cex = stream.getvalue()
+        return (key, verdict, cex)
+
     def run_simulation(self, cb_sequence = None): 
-        ts_enc = TSEncoder(self.trace, self.spec_list,
-                           self.opts.simplify_trace,
-                           self.stats)
+        if (self.opts.simulation_engine == DriverOptions.EXPLICIT_SIMULATION and
+            not self.opts.enc_large_block):
+            return self._run_explicit_simulation(cb_sequence)
+
+        if cb_sequence is None:
+            ts_enc = self._get_encoding(True)
+        else:
+            # only the encoding of the whole trace is cached
+            ts_enc = self._get_ts_encoder()
 
         self.stats.start_timer(Stats.SIMULATION_TIME)
 
@@ -164,6 +598,22 @@ class Driver:
 
         return (step, trace, last_trace, ts_enc.mapback)
 
+    def _run_explicit_simulation(self, cb_sequence):
+        """ Simulates the trace executing the automata of the
+        specifications (see ExplicitReachability.simulate) """
+        ts_enc = self._get_ts_encoder()
+        engine = ExplicitReachability(ts_enc)
+        trace_steps = ts_enc.get_trace_steps(cb_sequence)
+
+        self.stats.start_timer(Stats.SIMULATION_TIME)
+
+        (step, trace, last_trace) = engine.simulate(trace_steps)
+
+        self.stats.stop_timer(Stats.SIMULATION_TIME)
+        self.stats.write_times(sys.stdout, Stats.SIMULATION_TIME)
+
+        return (step, trace, last_trace, ts_enc.mapback)
+
     def slice(self, object_id, stream):
         if object_id is not None:
             sliced = i_slice(self.trace,object_id)
@@ -172,6 +622,29 @@ class Driver:
         else:
             raise Exception("object id cannot be none")
 
+# (TSEncoder, list of error keys, check function, print_orig_spec)
+# used by the workers of Driver._run_split
+_split_data = None
+
+def _split_worker(key_index):
+    """ Check a property in a worker of Driver._run_split """
+    (ts_enc, error_keys, check, print_orig_spec) = _split_data
+    return Driver._check_error_key(ts_enc, error_keys[key_index], check,
+                                   print_orig_spec)
+
+_portfolio_data = None
+
+def _portfolio_worker(engine_index):
+    """ Run an engine in a worker of Driver.run_portfolio """
+    (ts_enc, engines, print_orig_spec) = _portfolio_data
+    (name, check, is_sub) = engines[engine_index]
+    return Driver._run_engine(ts_enc, name, check, is_sub, print_orig_spec)
+
+def _portfolio_terminate(signum, frame):
+    """ Handler of SIGTERM in the workers of Driver.run_portfolio """
+    # SystemExit is not caught by the workers of the pool
+    raise SystemExit(1)
+
 def i_slice(c_obj, object_id):
     new_children = []
     for item in c_obj.children:
@@ -223,6 +696,18 @@ def print_ground_spec_map(ground_spec_map, out=sys.stdout):
             out.write("\n")
         out.write("----\n")
 
+def print_split_results(results, out=sys.stdout):
+    """ Prints the verdicts of Driver.run_bmc_split and
+    Driver.run_ic3_split """
+    for (key, verdict, cex) in results:
+        if verdict is None:
+            verdict = "ERROR"
+        out.write("%s: %s\n" % (key, verdict))
+    for (key, verdict, cex) in results:
+        if cex is not None:
+            out.write("\nCounterexample for %s:\n" % key)
+            out.write(cex)
+
 def check_disable(ground_specs):
     has_disable = False
     for spec in ground_specs:
@@ -253,6 +738,20 @@ def main(input_args=None):
     p.add_option('-c', '--enc_coi', action="store_true",
                  default=False, help="Apply cone of influence")
 
+    p.add_option('-b', '--enc_large_block', action="store_true",
+                 default=False, help="Encode each top-level callback " \
+                 "in a single transition (large block encoding)")
+
+    p.add_option('--enc_merge', action="store_true",
+                 default=False, help="Encode a single automaton for " \
+                 "the specifications with the same rhs and effect")
+
+    p.add_option('--merge_max_states', type='int',
+                 default=TSEncoder.MERGE_MAX_STATES,
+                 help="Maximum number of states of a merged automaton " \
+                 "(larger unions are encoded with separate automata, " \
+                 "default %d)" % TSEncoder.MERGE_MAX_STATES)
+
     p.add_option('-z', '--simplify_trace', action="store_true",
                  default=False, help="Simplify the trace (possibly unsound)")
 
@@ -268,9 +767,12 @@ def main(input_args=None):
             string = string + "".join([" " for i in range(length - current)])
         return string
     p.add_option('-m', '--mode', type='choice',
-                 choices= ["bmc","ic3","check-files","to-smv","show-ground-specs","simulate","check-trace-relevance","slice"],
+                 choices= ["bmc","ic3","kind","explicit","portfolio","check-files","to-smv","show-ground-specs","simulate","check-trace-relevance","slice"],
                  help=(get_len('bmc: run bmc on the trace;', 53) +
                        get_len('ic3: run ic3 on the trace;', 53) +
+                       get_len('kind: run k-induction on the trace;', 53) +
+                       get_len('explicit: explore explicitly the states of the trace;', 53) +
+                       get_len('portfolio: run the engines in parallel;', 53) +
                        get_len('check-files: check if the input files are well formed and prints them; ', 53) +
                        get_len('show-ground-specs: shows the specifications instantiateed by the given trace; ', 53) +
                        get_len('simulate: simulate the given trace with the existing specification; ', 53) +
@@ -292,6 +794,13 @@ def main(input_args=None):
     p.add_option('-n', '--nuxmv_path', help="Path to the nuXmv executable")
     p.add_option('-q', '--ic3_frames', help="Maximum number of frames explored by IC3")
 
+    p.add_option('--ic3_engine', type='choice',
+                 choices=DriverOptions.IC3_ENGINES,
+                 default=DriverOptions.NUXMV_IC3,
+                 help="Implementation of IC3: nuxmv runs the nuXmv " \
+                 "model checker, native runs IC3 in the verifier " \
+                 "(default nuxmv)")
+
     # simulation options
     p.add_option("-w", '--cb_sequence', help="Sequence of callbacks " \
                  "(message ids) to be simulated.")
@@ -307,6 +816,52 @@ def main(input_args=None):
 
     p.add_option('-j', '--object_id', help="When running slice this is a concrete object to target")
 
+    p.add_option('--trace_cache', help="Directory used to cache the " \
+                 "parsed traces (default: the %s environment " \
+                 "variable, if set)" % TraceCache.CACHE_DIR_ENV)
+
+    p.add_option('--encoding_cache', help="Directory used to cache " \
+                 "the encodings of the trace and the specifications " \
+                 "(default: the %s environment variable, if set)" % \
+                 EncodingCache.CACHE_DIR_ENV)
+
+    p.add_option('--grounding', type='choice',
+                 choices=GroundSpecs.ENGINES,
+                 default=GroundSpecs.SAT_ENGINE,
+                 help="Algorithm used to ground the specifications: " \
+                 "sat enumerates the models of the bindings with the SAT " \
+                 "solver, join joins the assignments found in the trace " \
+                 "(default sat)")
+
+    p.add_option('--grounding_jobs', type='int', default=1,
+                 help="Number of processes used to ground the " \
+                 "specifications (0 uses all the cpus, default 1)")
+
+    p.add_option('--simulation_engine', type='choice',
+                 choices=DriverOptions.SIMULATION_ENGINES,
+                 default=DriverOptions.SAT_SIMULATION,
+                 help="Algorithm used to simulate the trace: explicit " \
+                 "executes the automata of the specifications, sat " \
+                 "unrolls the transition system with the SAT solver " \
+                 "(default sat, sat is also used with the large block " \
+                 "encoding)")
+
+    p.add_option('--split_errors', action="store_true",
+                 default=False, help="Check the error of each " \
+                 "callin that can be disallowed independently " \
+                 "(bmc and ic3 modes)")
+
+    p.add_option('--split_jobs', type='int', default=1,
+                 help="Number of processes used to check the errors " \
+                 "with --split_errors (0 uses all the cpus, default 1)")
+
+    p.add_option('--labels', type='choice',
+                 choices=AutoEnv.LABELS,
+                 default=AutoEnv.SAT_LABELS,
+                 help="Representation of the labels of the automata: " \
+                 "sat uses formulas and a SAT solver, bdd uses BDDs, " \
+                 "explicit uses sets of messages (default sat)")
+
 
     def usage(msg=""):
         if msg: print "----%s----\n" % msg
@@ -327,13 +882,23 @@ def main(input_args=None):
         if (not os.path.exists(f)):
             usage("Specification file %s does not exists!" % f)
 
-    if (opts.mode == "bmc"):
+    if (opts.grounding_jobs < 0):
+        usage("%d must be positive!" % opts.grounding_jobs)
+
+    if (opts.split_jobs < 0):
+        usage("%d must be positive!" % opts.split_jobs)
+    if (opts.split_errors and opts.mode not in ["bmc", "ic3"]):
+        usage("--split_errors options cannot use in mode %s\n" % opts.mode)
+
+    if (opts.mode in ["bmc", "kind", "portfolio"]):
         if (not opts.bmc_depth): usage("Missing BMC depth")
         try:
             depth = int(opts.bmc_depth)
         except:
             usage("%s must be a natural number!" % opts.bmc_depth)
         if (depth < 0): usage("%s must be positive!" % opts.bmc_depth)
+        if (opts.mode in ["kind", "portfolio"] and opts.bmc_inc):
+            usage("--bmc_inc options cannot use in mode %s\n" % opts.mode)
     else:
         bmc_opt = [(opts.bmc_depth, "--bmc_depth"),
                    (opts.bmc_inc, "--bmc_inc")]
@@ -355,10 +920,12 @@ def main(input_args=None):
         if opts.smv_file:
             usage("%s options cannot use in mode " % ("", opts.mode))
 
-    if (opts.mode == "ic3"):
-        if (not opts.nuxmv_path):
+    if (opts.mode == "ic3" or opts.mode == "portfolio"):
+        if (opts.mode == "ic3" and
+            opts.ic3_engine == DriverOptions.NUXMV_IC3 and
+            not opts.nuxmv_path):
             usage("Path to the nuXmv executable not provided!")
-        if (not os.path.isfile(opts.nuxmv_path)):
+        if (opts.nuxmv_path and not os.path.isfile(opts.nuxmv_path)):
             usage("%s is not a valid path tp the nuXmv executable!" % opts.nuxmv_path)
 
         if (not opts.ic3_frames): usage("Missing IC3 frames (--ic3_frames)")
@@ -368,6 +935,9 @@ def main(input_args=None):
             usage("%s must be a natural number!" % opts.ic3_frames)
         if (ic3_frames < 0): usage("%s must be positive!" % opts.ic3_frames)
 
+    if (opts.mode == "explicit" and opts.enc_large_block):
+        usage("--enc_large_block options cannot use in mode %s\n" % opts.mode)
+
 
     if (opts.debug):
         logging.basicConfig(level=logging.DEBUG)
@@ -385,7 +955,18 @@ def main(input_args=None):
                                 opts.simplify_trace,
                                 opts.debug,
                                 opts.filter,
-                                opts.mode != "check-trace-relevance")
+                                opts.mode != "check-trace-relevance",
+                                opts.trace_cache,
+                                opts.grounding,
+                                opts.grounding_jobs,
+                                opts.enc_coi,
+                                opts.enc_large_block,
+                                opts.labels,
+                                opts.enc_merge,
+                                opts.merge_max_states,
+                                opts.encoding_cache,
+                                opts.simulation_engine,
+                                opts.ic3_engine)
 
     driver = Driver(driver_opts)
 
@@ -400,6 +981,11 @@ def main(input_args=None):
             ground_specs = driver.get_ground_specs()
             print_ground_spec(ground_specs)
 
+    elif (opts.mode == "bmc" and opts.split_errors):
+        results = driver.run_bmc_split(depth, opts.bmc_inc,
+                                       opts.split_jobs, print_orig_spec)
+        print_split_results(results)
+        return 0
     elif (opts.mode == "bmc"):
         (cex, mapback) = driver.run_bmc(depth, opts.bmc_inc)
 
@@ -438,8 +1024,13 @@ def main(input_args=None):
     elif (opts.mode == "to-smv"):
         driver.to_smv(opts.smv_file)
         return 0
+    elif (opts.mode == "ic3" and opts.split_errors):
+        results = driver.run_ic3_split(opts.nuxmv_path, ic3_frames,
+                                       opts.split_jobs, print_orig_spec)
+        print_split_results(results)
+        return 0
     elif (opts.mode == "ic3"):
-        (res, cex, mapback) = driver.run_ic3(opts.nuxmv_path, opts.ic3_frames)
+        (res, cex, mapback) = driver.run_ic3(opts.nuxmv_path, ic3_frames)
 
         if res is None:
             print("An error occurred invoking ic3")
@@ -456,6 +1047,46 @@ def main(input_args=None):
                 printer.print_cex()
 
 
+        return 0
+    elif (opts.mode == "portfolio"):
+        (engine, res, cex) = driver.run_portfolio(depth, ic3_frames,
+                                                  opts.nuxmv_path,
+                                                  print_orig_spec)
+        if engine is None:
+            print("The result is still unknown (e.g try to increment " +
+                  "the depth or the number of frames).")
+        else:
+            print("Verdict found by the %s engine" % engine)
+            if res == NuXmvDriver.SAFE:
+                print("The trace is SAFE")
+            else:
+                print("The system can reach an error state.")
+                if (cex is not None):
+                    sys.stdout.write(cex)
+        return 0
+    elif (opts.mode == "kind"):
+        (res, cex, mapback) = driver.run_kind(depth)
+
+        if res == KInduction.SAFE:
+            print("The trace is SAFE")
+        elif res == KInduction.UNSAFE:
+            print("The system can reach an error state.")
+            printer = CexPrinter(mapback, cex, sys.stdout, print_orig_spec)
+            printer.print_cex()
+        else:
+            print("The result is still unknown (e.g try to increment " +
+                  "the depth).")
+        return 0
+    elif (opts.mode == "explicit"):
+        (res, cex, mapback) = driver.run_explicit()
+
+        if res == ExplicitReachability.SAFE:
+            print("The trace is SAFE")
+        elif res == ExplicitReachability.UNSAFE:
+            print("The system can reach an error state.")
+            printer = CexPrinter(mapback, cex, sys.stdout, print_orig_spec)
+            printer.print_cex()
+
         return 0
     elif(opts.mode == "slice"):
         driver.slice(opts.object_id.split(':'), sys.stdout)
@@ -43,18 +43,33 @@ class AutoEnv(object):
     It hides the implementation details (e.g. SAT or BDD labels?)
     It keeps a unique environment for formulas.
 
+    The labels can be:
+      - SAT_LABELS: propositional formulas, checked with a SAT solver
+      - BDD_LABELS: BDDs
+      - EXPLICIT_LABELS: sets of letters of a finite alphabet (see
+        set_alphabet), represented as bitsets.
     """
 
+    SAT_LABELS = "sat"
+    BDD_LABELS = "bdd"
+    EXPLICIT_LABELS = "explicit"
+    LABELS = [SAT_LABELS, BDD_LABELS, EXPLICIT_LABELS]
+
     auto_env = None
 
-    def __init__(self, pysmt_env = None, use_bdds = False):
+    def __init__(self, pysmt_env = None, use_bdds = False, labels = None):
 
         if pysmt_env is None:
             self.pysmt_env = get_env()
         else:
             self.pysmt_env = pysmt_env
 
-        self.use_bdds = use_bdds
+        if labels is None:
+            labels = AutoEnv.BDD_LABELS if use_bdds else AutoEnv.SAT_LABELS
+        assert labels in AutoEnv.LABELS
+        self.labels = labels
+        self.use_bdds = labels == AutoEnv.BDD_LABELS
+        self.use_explicit = labels == AutoEnv.EXPLICIT_LABELS
 
         if (not self.use_bdds):
             # sat solver instance
@@ -63,12 +78,84 @@ class AutoEnv(object):
                                                             name="z3",
                                                             logic=QF_BOOL)
         else:
-            self.bdd_solver = Solver(self.pysmt_env, name='bdd')
+            # all the labels share the same BDD manager (the solver
+            # can also be shared with the CounterEnc, see
+            # set_variable_order)
+            self.bdd_solver = Solver(env=self.pysmt_env,
+                                     logic=BOOL_LOGIC,
+                                     name='bdd')
+
+        if (self.use_explicit):
+            self.set_alphabet([])
+
+    def set_variable_order(self, variables):
+        """ Declare the variables in the BDD manager in the given
+        order (the first variable is the top of the BDDs).
+
+        The variables already declared keep their position, so the
+        order must be set before creating the labels on the variables.
+        """
+        assert self.use_bdds
+        for var in variables:
+            self.bdd_solver.declare_variable(var)
+
+    def set_alphabet(self, letters):
+        """ Set the alphabet of the explicit labels.
 
+        letters is a list of mutually exclusive formulas, the i-th
+        formula represents the i-th letter of the alphabet (the i-th
+        bit of the labels).
+
+        The labels created before are not valid anymore.
+        """
+        assert self.use_explicit
+        self.letters = list(letters)
+        self.letter_to_bit = {}
+        for i in range(len(self.letters)):
+            self.letter_to_bit[self.letters[i]] = 1 << i
+        self.all_letters = (1 << len(self.letters)) - 1
+
+    def get_letters(self, formula):
+        """ Returns the bitset of the letters where formula holds """
+        assert self.use_explicit
+        if formula in self.letter_to_bit:
+            return self.letter_to_bit[formula]
+        elif formula.is_true():
+            return self.all_letters
+        elif formula.is_false():
+            return 0
+        else:
+            letters = 0
+            for i in range(len(self.letters)):
+                others = self.letters[:i] + self.letters[i+1:]
+                if self.sat_solver.is_sat(And([formula, self.letters[i],
+                                               Not(Or(others))])):
+                    letters = letters | (1 << i)
+            return letters
+
+    def get_letters_formula(self, letters):
+        """ Returns the formula that holds in the letters of the
+        bitset letters """
+        assert self.use_explicit
+        if letters == 0:
+            return FALSE()
+        elif letters == self.all_letters:
+            return TRUE()
+
+        negate = bin(letters).count("1") > len(self.letters) / 2
+        if negate:
+            letters = self.all_letters & ~letters
+        formula = Or([self.letters[i] for i in range(len(self.letters))
+                      if (letters >> i) & 1 == 1])
+        if negate:
+            formula = Not(formula)
+        return formula
 
     def new_label(self, formula):
         if (self.use_bdds):
             return BddLabel(formula, self)
+        elif (self.use_explicit):
+            return ExplicitLabel(self.get_letters(formula), self)
         else:
             # assume SAT labels
             # Here we can do memoization baed on the formula
@@ -238,7 +325,7 @@ class Automaton(object):
 
             # copy the transitions
             for (dst, label) in self.trans[s]:
-                if (dst not in visited):
+                if (dst not in self_to_new):
                     new_dst = new_auto._add_new_state(self.is_initial(dst), False)
                     self_to_new[dst] = new_dst
                     stack.append(dst)
@@ -593,6 +680,8 @@ class Automaton(object):
 
         if (self.env.use_bdds):
             return self._sc_enum_trans_bdd(q_set)
+        elif (self.env.use_explicit):
+            return self._sc_enum_trans_explicit(q_set)
         else:
             return self._sc_enum_trans_sat(q_set)
 
@@ -687,6 +776,43 @@ class Automaton(object):
 
         return results
 
+    def _sc_enum_trans_explicit(self, q_set):
+        """ Given a set of NFA states, the function returns a list of
+        possible successors in the DFA.
+
+        The labels are sets of letters: the function partitions the
+        alphabet by the set of states reached reading each letter.
+        """
+        assert self.env.use_explicit
+
+        # list of pairs (letters, set of destination states)
+        partition = [(self.env.all_letters, frozenset())]
+        for q_nfa in q_set:
+            for (dst_state, label) in self.trans[q_nfa]:
+                assert label.env.use_explicit
+                new_partition = []
+                for (letters, states) in partition:
+                    inside = letters & label.letters
+                    if inside != 0:
+                        new_partition.append((inside, states.union([dst_state])))
+                    outside = letters & ~label.letters
+                    if outside != 0:
+                        new_partition.append((outside, states))
+                partition = new_partition
+
+        # merge the letters that reach the same states
+        states_to_letters = {}
+        for (letters, states) in partition:
+            states_to_letters[states] = states_to_letters.get(states, 0) | letters
+
+        results = []
+        for (states, letters) in states_to_letters.iteritems():
+            results.append((states, ExplicitLabel(letters, self.env)))
+        if (0 == len(results)):
+            # empty alphabet
+            results.append((frozenset(), ExplicitLabel(0, self.env)))
+        return results
+
     def _sc_enum_trans_bdd(self, q_set):
         """ Given a set of NFA states, the function returns a list of
         possible successors in the DFA.
@@ -713,6 +839,16 @@ class Automaton(object):
             Automaton._sc_enum_bdd_rec(ls_set_list, results,
                                        (None, None))
 
+            # merge the labels of the same set of states (different
+            # transitions of the NFA may reach the same states)
+            states_to_label = {}
+            for (states, label) in results:
+                if states in states_to_label:
+                    states_to_label[states] = states_to_label[states].union(label)
+                else:
+                    states_to_label[states] = label
+            results = states_to_label.items()
+
         return results
 
     @staticmethod
@@ -758,6 +894,253 @@ class Automaton(object):
         """
         return (((self.reverse()).determinize()).reverse()).determinize()
 
+    def is_deterministic(self):
+        """ Returns true if self has a single initial state and the
+        labels of the transitions leaving a state are disjoint.
+        """
+        if (len(self.initial_states) != 1):
+            return False
+
+        for s in self.states:
+            trans = self.trans[s]
+            for i in range(len(trans)):
+                for j in range(i + 1, len(trans)):
+                    if (trans[i][1].is_intersecting(trans[j][1])):
+                        return False
+        return True
+
+    def minimize_dfa(self):
+        """ Minimize a DETERMINISTIC automaton with the Moore's
+        partition refinement algorithm.
+
+        The alphabet is split in the minterms of the labels (the
+        minimal non-empty intersections of the labels and their
+        complements), so that the refinement compares the states
+        without calling the solver.
+
+        The result is a complete DFA, as the result of minimize.
+        The result of minimize may have more states, since the sink
+        state added by determinize is an explicit state of the subsets.
+        """
+        (res, state_map) = self._minimize_dfa_aux(None)
+        return res
+
+    def _minimize_dfa_aux(self, classes):
+        """ Moore's algorithm (see minimize_dfa).
+
+        classes maps the states of self to the classes of the initial
+        partition (the states not in classes, e.g. the sink added to
+        complete the automaton, are in the class frozenset()).
+        The classes must refine the final states.
+        If classes is None the initial partition separates the final and
+        the non-final states.
+
+        Returns the minimized automaton and the map from the reachable
+        states of self to the states of the minimized automaton.
+        """
+
+        complete_auto = self.copy_reachable(None, 0, True)
+
+        # Minterms of the labels: each minterm is represented by the
+        # set of the indexes of the labels that contain it
+        label_to_index = {}
+        for s in complete_auto.states:
+            for (dst, label) in complete_auto.trans[s]:
+                if label not in label_to_index:
+                    label_to_index[label] = len(label_to_index)
+
+        minterms = [(self.env.new_label(TRUE()), frozenset())]
+        for (label, index) in label_to_index.iteritems():
+            new_minterms = []
+            neg_label = label.complement()
+            for (m_label, m_indexes) in minterms:
+                in_label = m_label.intersect(label)
+                if (in_label.is_sat()):
+                    new_minterms.append((in_label, m_indexes.union([index])))
+                out_label = m_label.intersect(neg_label)
+                if (out_label.is_sat()):
+                    new_minterms.append((out_label, m_indexes))
+            minterms = new_minterms
+
+        # labels that are not empty
+        used_indexes = set()
+        for (m_label, m_indexes) in minterms:
+            used_indexes.update(m_indexes)
+
+        # states reachable with non-empty labels (e.g. the completion
+        # may add a sink reachable only with an empty label)
+        reachable = set(complete_auto.initial_states)
+        stack = list(reachable)
+        while (len(stack) > 0):
+            s = stack.pop()
+            for (dst, label) in complete_auto.trans[s]:
+                if (dst not in reachable and
+                    label_to_index[label] in used_indexes):
+                    reachable.add(dst)
+                    stack.append(dst)
+
+        # successor of each state on each minterm
+        states = sorted(reachable)
+        delta = {}
+        for s in states:
+            index_to_dst = {}
+            for (dst, label) in complete_auto.trans[s]:
+                index_to_dst[label_to_index[label]] = dst
+            succ = []
+            for (m_label, m_indexes) in minterms:
+                dst = None
+                for index in m_indexes:
+                    if index in index_to_dst:
+                        dst = index_to_dst[index]
+                        break
+                # the automaton is complete
+                assert dst is not None
+                succ.append(dst)
+            delta[s] = succ
+
+        # Moore's refinement, starting from final and non-final states
+        block = {}
+        class_to_block = {}
+        for s in states:
+            if classes is None:
+                s_class = complete_auto.is_final(s)
+            else:
+                s_class = classes.get(s, frozenset())
+            if s_class not in class_to_block:
+                class_to_block[s_class] = len(class_to_block)
+            block[s] = class_to_block[s_class]
+        blocks_count = len(set(block.values()))
+        while True:
+            signature_to_block = {}
+            new_block = {}
+            for s in states:
+                signature = (block[s], tuple([block[dst] for dst in delta[s]]))
+                if signature not in signature_to_block:
+                    signature_to_block[signature] = len(signature_to_block)
+                new_block[s] = signature_to_block[signature]
+            block = new_block
+            if (len(signature_to_block) == blocks_count):
+                break
+            blocks_count = len(signature_to_block)
+
+        # Build the quotient automaton
+        res = Automaton(self.env)
+        block_to_state = {}
+        for s in states:
+            if block[s] not in block_to_state:
+                block_to_state[block[s]] = res._add_new_state(complete_auto.is_initial(s),
+                                                              complete_auto.is_final(s))
+            elif complete_auto.is_initial(s):
+                res.initial_states.add(block_to_state[block[s]])
+
+        visited = set()
+        for s in states:
+            if block[s] in visited:
+                continue
+            visited.add(block[s])
+
+            # union the labels of the transitions to the same block
+            dst_to_label = {}
+            for (dst, label) in complete_auto.trans[s]:
+                if label_to_index[label] not in used_indexes:
+                    # empty label
+                    continue
+                res_dst = block_to_state[block[dst]]
+                if res_dst in dst_to_label:
+                    dst_to_label[res_dst] = dst_to_label[res_dst].union(label)
+                else:
+                    dst_to_label[res_dst] = label
+            res_src = block_to_state[block[s]]
+            for (res_dst, label) in dst_to_label.iteritems():
+                res._add_trans(res_src, res_dst, label)
+
+        state_map = {}
+        for s in states:
+            if s in self.states:
+                state_map[s] = block_to_state[block[s]]
+
+        return (res, state_map)
+
+    @staticmethod
+    def get_union_dfa(autos, max_states=None):
+        """ Builds the synchronous product of the DETERMINISTIC
+        automata in autos, that recognizes the union of their languages.
+
+        Returns a pair (res, accepting), where res is the minimized
+        product and accepting maps each state of res to the frozenset of
+        the indexes (in autos) of the automata that accept in the state.
+
+        Returns None if the product has more than max_states states.
+        """
+        assert len(autos) > 0
+        env = autos[0].env
+
+        # the components are complete, so that the product accepts
+        # the union of the languages
+        complete_autos = []
+        inits = []
+        for auto in autos:
+            assert len(auto.initial_states) == 1
+            complete_auto = auto.copy_reachable(None, 0, True)
+            complete_autos.append(complete_auto)
+            inits.append(iter(complete_auto.initial_states).next())
+
+        product = Automaton(env)
+        tuple_to_state = {}
+        classes = {}
+
+        def get_state(states_tuple, is_initial):
+            if states_tuple in tuple_to_state:
+                return (tuple_to_state[states_tuple], False)
+            accepting = frozenset([i for i in range(len(complete_autos))
+                                   if complete_autos[i].is_final(states_tuple[i])])
+            state = product._add_new_state(is_initial, len(accepting) > 0)
+            tuple_to_state[states_tuple] = state
+            classes[state] = accepting
+            return (state, True)
+
+        init_tuple = tuple(inits)
+        get_state(init_tuple, True)
+        stack = [init_tuple]
+        while (len(stack) > 0):
+            states_tuple = stack.pop()
+            src = tuple_to_state[states_tuple]
+
+            # intersect the labels of the components, pruning the
+            # empty intersections as soon as possible
+            combined = [(None, ())]
+            for i in range(len(complete_autos)):
+                new_combined = []
+                for (label, dsts) in combined:
+                    for (dst, dst_label) in complete_autos[i].trans[states_tuple[i]]:
+                        if label is None:
+                            new_label = dst_label
+                        else:
+                            new_label = label.intersect(dst_label)
+                        if (new_label.is_sat()):
+                            new_combined.append((new_label, dsts + (dst,)))
+                combined = new_combined
+
+            for (label, dst_tuple) in combined:
+                if (dst_tuple not in tuple_to_state and
+                    max_states is not None and
+                    len(tuple_to_state) >= max_states):
+                    return None
+                (dst, is_new) = get_state(dst_tuple, False)
+                if is_new:
+                    stack.append(dst_tuple)
+                product._add_trans(src, dst, label)
+
+        (res, state_map) = product._minimize_dfa_aux(classes)
+        accepting = {}
+        for (s, res_s) in state_map.iteritems():
+            accepting[res_s] = classes[s]
+        for res_s in res.states:
+            if res_s not in accepting:
+                accepting[res_s] = frozenset()
+
+        return (res, accepting)
+
     def to_dot(self, stream):
         stream.write("digraph {\n  " \
                      "center=true;\n" \
@@ -917,7 +1300,7 @@ class BddLabel(Label):
 
     def is_contained(self, other):
         # self -> other
-        implies = self.ddmanager.Or(self.bdd.Not(), other.bdd)
+        implies = self.ddmanager.Or(self.ddmanager.Not(self.bdd), other.bdd)
         return implies == self.ddmanager.One()
 
     def is_intersecting(self, other):
@@ -937,6 +1320,55 @@ class BddLabel(Label):
         return self.bdd == other.bdd
 
 
+class ExplicitLabel(Label):
+    """ Represent a label as the set of letters of a finite alphabet.
+
+    The set is a bitset (an integer), where the i-th bit is the i-th
+    letter of the alphabet of the environment (see
+    AutoEnv.set_alphabet), so the operations on the labels are
+    bitwise operations.
+    """
+    def __init__(self, letters, env=None):
+        if env is None:
+            env = AutoEnv.get_global_auto_env()
+        self.env = env
+        assert(self.env.use_explicit)
+        self.letters = letters
+
+    def intersect(self, other):
+        return ExplicitLabel(self.letters & other.letters, self.env)
+
+    def complement(self):
+        return ExplicitLabel(self.env.all_letters & ~self.letters, self.env)
+
+    def union(self, other):
+        return ExplicitLabel(self.letters | other.letters, self.env)
+
+    def is_sat(self):
+        return self.letters != 0
+
+    def is_valid(self):
+        return self.letters == self.env.all_letters
+
+    def is_contained(self, other):
+        return (self.letters & ~other.letters) == 0
+
+    def is_intersecting(self, other):
+        return (self.letters & other.letters) != 0
+
+    def get_formula(self):
+        return self.env.get_letters_formula(self.letters)
+
+    def __repr__(self):
+        return str(self.get_formula())
+
+    def __hash__(self):
+        return hash(self.letters)
+
+    def __eq__(self, other):
+        return self.letters == other.letters
+
+
 class SubsConsMap:
     def __init__(self):
         # Map from a set of states of the NFA to a single state of the
@@ -86,24 +86,29 @@ class CexPrinter:
                 self._print_step_header(i)
                 val = self._mapback.get_fired_trace_msg(prev_step, step)
 
-                if (type(val) == tuple):
-                    (is_entry, trace_msg) = val
+                if (type(val) == list):
+                    # large block encoding, all the messages of a
+                    # top-level callback
+                    block = val
+                elif (type(val) == tuple):
+                    block = [val]
                 else:
-                    is_entry = None
-                    trace_msg = val
+                    block = [(None, val)]
 
-                assert trace_msg is not None
                 msg = self._mapback.get_trans_label(prev_step)
                 assert msg is not None
 
-                #self.out_stream.write("%d) msg: %s\n" % (i, msg))
-                if (isinstance(trace_msg, str)):
-                    self.out_stream.write("[-] %s transition ---\n" % trace_msg)
-                else:
-                   if (is_entry == TSEncoder.ENTRY):
-                       trace_msg._print_entry(self.out_stream, "", False)
-                   else:
-                       trace_msg._print_exit(self.out_stream, "", False)
+                for (is_entry, trace_msg) in block:
+                    assert trace_msg is not None
+
+                    #self.out_stream.write("%d) msg: %s\n" % (i, msg))
+                    if (isinstance(trace_msg, str)):
+                        self.out_stream.write("[-] %s transition ---\n" % trace_msg)
+                    else:
+                       if (is_entry == TSEncoder.ENTRY):
+                           trace_msg._print_entry(self.out_stream, "", False)
+                       else:
+                           trace_msg._print_exit(self.out_stream, "", False)
 
                 # trace_desc = trace_msg.to_str()
                 # self.out_stream.write("From trace: %s\n" % trace_desc)
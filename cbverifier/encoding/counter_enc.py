@@ -21,14 +21,19 @@ class CounterEnc():
     """ Class used to encode program counters with Boolean variables.
 
     """
-    def __init__(self, pysmt_env, use_bdds = False):
+    def __init__(self, pysmt_env, use_bdds = False, bdd_solver = None):
         """
         pysmt_env: environment used to create the bdd package
+        bdd_solver: BDD solver to use (e.g. to share the BDD manager
+        with the labels of the automata, see AutoEnv), a new
+        solver is created if None
         """
         self.use_bdds = use_bdds
         if (use_bdds):
-            self.bdd_solver = Solver(env=pysmt_env, logic=pysmt.logics.BOOL,
-                                     name='bdd')
+            if bdd_solver is None:
+                bdd_solver = Solver(env=pysmt_env, logic=pysmt.logics.BOOL,
+                                    name='bdd')
+            self.bdd_solver = bdd_solver
             self.bdd_converter = self.bdd_solver.converter
         else:
             self.bdd_solver = None
@@ -58,6 +63,12 @@ class CounterEnc():
         assert var_name not in self.vars2bound
         self.vars2bound[var_name] = upper_bound
 
+    def remove_var(self, var_name):
+        """ Removes var_name, if it exists (e.g. to add it again with
+        a different upper bound) """
+        if var_name in self.vars2bound:
+            del self.vars2bound[var_name]
+
 
     def eq_val(self, var_name, value, unsafe=False):
         """ Given a variable and a natural number value, produce the
@@ -110,6 +121,25 @@ class CounterEnc():
         return bit_val
 
 
+    def get_val_assignment(self, var_name, value):
+        """ Returns the assignment to the Boolean variables of
+        var_name (a map from the variables to TRUE/FALSE) that encodes
+        var_name = value
+        """
+        assert var_name in self.vars2bound
+        max_size = self.vars2bound[var_name]
+        assert max_size >= value
+        bitsize = CounterEnc._get_bitsize(max_size)
+
+        assignment = {}
+        for i in range(bitsize):
+            bit_var = self._get_bitvar(var_name, i)
+            if ((value >> i) & 1) == 1:
+                assignment[bit_var] = TRUE()
+            else:
+                assignment[bit_var] = FALSE()
+        return assignment
+
     def get_mask(self, var_name):
         """ Returns the bitmask needed to ignore the additional unused
         bits used to encode the counter var_name.
@@ -157,6 +187,19 @@ class CounterEnc():
 
         return counter_vars
 
+    def get_counter_bits(self, var_name):
+        """ Returns the list of the Boolean variables used to encode
+        var_name, from the most significant to the least significant
+        bit (e.g. a variable order for the BDDs, where consecutive
+        values share the top of the BDD)
+        """
+        assert var_name in self.vars2bound
+        max_value = self.vars2bound[var_name]
+        bitsize = CounterEnc._get_bitsize(max_value)
+
+        return [self._get_bitvar(var_name, i)
+                for i in reversed(range(bitsize))]
+
     def get_counter_value(self, var_name, model, python_model=True):
         """ Return the value assigned to var_name in the model """
 
@@ -130,6 +130,7 @@ The module defines the following classes:
 
 import logging
 from cStringIO import StringIO
+from collections import OrderedDict
 import copy
 
 from pysmt.logics import QF_BOOL
@@ -140,7 +141,7 @@ from pysmt.shortcuts import Solver
 from pysmt.shortcuts import TRUE as TRUE_PYSMT
 from pysmt.shortcuts import FALSE as FALSE_PYSMT
 from pysmt.shortcuts import Not, And, Or, Implies, Iff, ExactlyOne
-from pysmt.shortcuts import simplify
+from pysmt.shortcuts import simplify, substitute
 
 from cbverifier.specs.spec import Spec
 from cbverifier.specs.spec_ast import *
@@ -210,19 +211,42 @@ class TSEncoder:
     ENTRY = "ENTRY"
     EXIT = "EXIT"
 
+    # Maximum number of states of the product of the automata of a
+    # group of specifications (see _get_merged_ts)
+    MERGE_MAX_STATES = 1000
 
-    def __init__(self, trace, specs, ignore_msgs = False, stats = None):
+
+    def __init__(self, trace, specs, ignore_msgs = False, stats = None,
+                 grounding_engine = GroundSpecs.SAT_ENGINE,
+                 grounding_jobs = 1, coi = False, large_block = False,
+                 labels = AutoEnv.SAT_LABELS, merge_automata = False,
+                 merge_max_states = MERGE_MAX_STATES, error_keys = None):
         # copy the trace removing the top-level exception
         self.trace = trace.copy(True)
         self.specs = specs
         self.ts = None
         self.error_prop = None
         self.stats = stats
+        # Encode each top-level callback in a single transition
+        self.large_block = large_block
+        # Encode a single automaton for the specifications with the
+        # same rhs and the same effect
+        self.merge_automata = merge_automata
+        self.merge_max_states = merge_max_states
+        # Keys of the messages whose disallowing is an error (all the
+        # messages if None, see set_error_keys)
+        self.error_keys = error_keys
+        # Memoize the ENTRY and EXIT keys of the trace messages
+        self.msg_keys = {}
+        self.ignore_msgs = ignore_msgs
+        self.coi = coi
+        self.grounding_jobs = grounding_jobs
 
         logging.info("Total number of specs (before grounding): %d" % (len(specs)))
-        self.gs = GroundSpecs(self.trace)
+        self.gs = GroundSpecs(self.trace, engine=grounding_engine)
         self.ground_specs = TSEncoder._compute_ground_spec(self.gs, self.specs,
-                                                           self.stats)
+                                                           self.stats,
+                                                           grounding_jobs)
         logging.info("Total specs after grounding: %d" % (len(self.ground_specs)))
 
         # Remove all the messages in the trace that do not
@@ -241,7 +265,8 @@ class TSEncoder:
             (trace_length, msgs, fmwk_contr, app_contr) = self.get_trace_stats()
 
             self.trace = TSEncoder._simplify_trace(self.trace,
-                                                   self.spec_msgs)
+                                                   self.spec_msgs,
+                                                   self.get_msg_key)
             self._is_msg_visible = self._is_msg_visible_simpl
             print("\n---Simplified Trace---")
             self.trace.print_trace(sys.stdout)
@@ -249,6 +274,135 @@ class TSEncoder:
         else:
             self._is_msg_visible = self._is_msg_visible_all
 
+        self._set_trace_stats()
+
+        # ground specifications encoded in the transition system
+        self.encoded_specs = self.ground_specs
+        # messages that have a state variable (the other messages are
+        # always enabled)
+        self.state_msgs = self.msgs
+
+        self.pysmt_env = get_env()
+        self.helper = Helper(self.pysmt_env)
+        # Representation of the labels of the automata (see AutoEnv)
+        self.auto_env = AutoEnv(self.pysmt_env, labels=labels)
+
+        self.error_label = "_error_"
+        self._init_alphabet()
+
+        if (coi):
+            self._apply_coi()
+
+        # Parts of the encoding reused when new specifications are
+        # added (see add_specs and _encode)
+        self.vars_ts = None
+        # automata and effects of the encoded specifications
+        self.specs_ts = None
+        self.accepting = None
+        self.disabled_msg = None
+        # map from the key of a message to its frame condition
+        self.frame_conds = None
+        self.cb_ts = None
+        self.cb_errors = None
+        # messages that can be disallowed in cb_ts
+        self.cb_error_msgs = None
+        # explicit graph of the pc of the callbacks (see _encode_cbs,
+        # not computed with the large block encoding)
+        self.pc_graph = None
+        self.pc_error_state = None
+        # number of specifications of self.encoded_specs in specs_ts
+        self.specs_ts_count = 0
+        self.next_spec_id = 0
+        # hits and misses of the automata cache already reported
+        self.reported_cache_stats = (0, 0)
+
+    def add_specs(self, specs):
+        """ Adds the specifications specs to the verification problem.
+
+        Only specs are grounded (the ground specifications already
+        in the problem are skipped). If the transition system was
+        already encoded, the next call to get_ts_encoding only encodes
+        the automata and the effects of the new ground specifications
+        and the frame conditions of their rhs, and it encodes again
+        the callbacks only if the new specifications disallow new
+        messages (with the large block encoding the callbacks are
+        always encoded again). The rest of the encoding is reused.
+
+        This allows to check the same trace with increasing sets of
+        specifications (e.g. adding the enable/disable rules of more
+        precise models to the same allow/disallow rules).
+
+        The cone of influence reduction and the simplification of the
+        trace depend on the specifications, and they cannot be used
+        with add_specs.
+
+        Returns the list of the new ground specifications.
+        """
+        if self.coi or self.ignore_msgs:
+            raise Exception("Cannot add specifications to an encoding " \
+                            "with the cone of influence reduction or " \
+                            "the simplification of the trace")
+
+        logging.info("Adding specs (before grounding): %d" % (len(specs)))
+        ground_specs = TSEncoder._compute_ground_spec(self.gs, specs,
+                                                      self.stats,
+                                                      self.grounding_jobs)
+        known_specs = set(self.ground_specs)
+        new_specs = []
+        for ground_spec in ground_specs:
+            if ground_spec not in known_specs:
+                known_specs.add(ground_spec)
+                new_specs.append(ground_spec)
+        logging.info("New specs after grounding: %d" % (len(new_specs)))
+
+        self.specs = self.specs + specs
+        self.ground_specs = self.ground_specs + new_specs
+        self.encoded_specs = self.ground_specs
+
+        # encode the new specs in the next call to get_ts_encoding
+        self.ts = None
+        self.error_prop = None
+        # the unrolling memoized in the helper is on the old variables
+        self.helper = Helper(self.pysmt_env)
+        return new_specs
+
+    def get_error_keys(self):
+        """ Returns the (sorted) list of the keys of the messages that
+        can be disallowed by the encoded specifications.
+        """
+        error_keys = set()
+        for ground_spec in self.encoded_specs:
+            if ground_spec.is_disable():
+                key = TSEncoder.get_key_from_call(get_spec_rhs(ground_spec.ast))
+                if key in self.app_contr:
+                    error_keys.add(key)
+        return sorted(error_keys)
+
+    def set_error_keys(self, error_keys):
+        """ Only the messages in error_keys (all the messages if
+        error_keys is None) are errors when disallowed.
+
+        The specifications still disable all the messages, so that
+        the reachable states of the system do not change. Only the
+        encoding of the callbacks, which contains the error
+        transitions, is computed again in the next call to
+        get_ts_encoding.
+        """
+        self.error_keys = error_keys
+        self.ts = None
+        self.error_prop = None
+        # the unrolling memoized in the helper is on the old variables
+        self.helper = Helper(self.pysmt_env)
+
+    def _get_error_msgs(self):
+        """ Returns the messages that can be disallowed and that are
+        errors (see set_error_keys) """
+        if self.error_keys is None:
+            return set(self.disabled_msg)
+        return set([key for key in self.disabled_msg
+                    if key in self.error_keys])
+
+    def _set_trace_stats(self):
         (trace_length, msgs, fmwk_contr, app_contr) = self.get_trace_stats()
         self.trace_length = trace_length
         self.msgs = msgs
@@ -257,22 +411,180 @@ class TSEncoder:
         # set of messages controlled by the app
         self.app_contr = app_contr
 
-        self.pysmt_env = get_env()
-        self.helper = Helper(self.pysmt_env)
-        # With True we use BDDs
-        self.auto_env = AutoEnv(self.pysmt_env, False)
-        self.cenc = CounterEnc(self.pysmt_env)
+    def _init_alphabet(self):
+        """ Creates the encoding of the alphabet (the messages in
+        self.msgs and the error label)
+        """
+        if self.auto_env.use_bdds:
+            # share the BDD manager with the labels of the automata
+            self.cenc = CounterEnc(self.pysmt_env, True,
+                                   self.auto_env.bdd_solver)
+        else:
+            self.cenc = CounterEnc(self.pysmt_env)
         self.mapback = TSMapback(self.pysmt_env, None, None)
 
-        self.error_label = "_error_"
         letters = set([self.error_label])
         letters.update(self.msgs)
         self.r2a = RegExpToAuto(self.cenc, letters,
                                 self.mapback, self.auto_env)
 
-
         # Map from regular expression to the correspondent automata, pc and final states
         self.regexp2ts = {}
+        # Map from the encoded ground specifications to the pc of their
+        # automaton and its final states for the specification
+        self.spec2ts = {}
+        # Map from the pc of an automaton to the automaton and the
+        # map from its states to the values of the pc
+        self.pc2auto = {}
+        # Memo of the steps of the automata on the letters (see
+        # _get_auto_step)
+        self.auto_steps = {}
+
+    def _apply_coi(self):
+        """ Cone of influence reduction.
+
+        The error depends on the enabled status of the disallowed
+        callins, and the system can only progress on enabled messages.
+        The only messages that can be disabled are the rhs of the
+        disable specifications (the "guards"), so:
+
+        - the state variables of the other messages are always true
+        and they are removed;
+
+        - only the specifications that change a guard are encoded
+        (the others only enable messages that are always enabled);
+
+        - a message that is not a guard and that does not change the
+        effects of the automata of these specifications (see
+        _is_stuttering) is a stuttering step for the system.
+        The message is removed from the trace and from the alphabet.
+
+        The reduction preserves the reachability of the error.
+        """
+        guards = set()
+        for ground_spec in self.ground_specs:
+            if ground_spec.is_disable():
+                rhs = get_spec_rhs(ground_spec.ast)
+                guards.add(TSEncoder.get_key_from_call(rhs))
+
+        coi_specs = []
+        for ground_spec in self.ground_specs:
+            rhs = get_spec_rhs(ground_spec.ast)
+            if TSEncoder.get_key_from_call(rhs) in guards:
+                coi_specs.append(ground_spec)
+
+        # find the messages that are stuttering steps for all the
+        # automata
+        to_remove = set([msg for msg in self.msgs if msg not in guards])
+        solver = self.pysmt_env.factory.Solver(quantified=False,
+                                               name="z3",
+                                               logic=QF_BOOL)
+        valid_letters = self.cenc.get_mask(self.r2a.get_counter_var())
+        visited_regexps = set()
+        for ground_spec in coi_specs:
+            regexp = get_regexp_node(ground_spec.ast)
+            if regexp in visited_regexps:
+                continue
+            visited_regexps.add(regexp)
+
+            if (len(to_remove) == 0):
+                break
+
+            auto = self.r2a.get_from_regexp(regexp)
+            equiv_memo = {}
+            for msg in list(to_remove):
+                if not self._is_stuttering(auto, msg, solver,
+                                           valid_letters, equiv_memo):
+                    to_remove.remove(msg)
+
+        logging.info("Cone of influence: %d specs out of %d, " \
+                     "%d messages out of %d" % (len(coi_specs),
+                                               len(self.ground_specs),
+                                               len(self.msgs) - len(to_remove),
+                                               len(self.msgs)))
+
+        self.coi_msgs = set([msg for msg in self.msgs if msg not in to_remove])
+        self.trace = TSEncoder._simplify_trace(self.trace,
+                                               self.coi_msgs,
+                                               self.get_msg_key)
+        self._is_msg_visible = self._is_msg_visible_coi
+        self._set_trace_stats()
+
+        self.encoded_specs = coi_specs
+        self.state_msgs = set([msg for msg in self.msgs if msg in guards])
+
+        # encode the automata on the reduced alphabet
+        self._init_alphabet()
+
+    def _is_stuttering(self, auto, msg, solver, valid_letters, equiv_memo):
+        """ True if reading msg never changes the effects of the
+        (deterministic) automaton auto, now and in the future.
+
+        This is the case if, for all the states s of auto, msg moves
+        to a state t such that:
+          - t is not final or s is final (msg does not trigger the
+            effect of the specification);
+          - t and s move to the same state on all the letters.
+        """
+        assignment = self.r2a.get_msg_assignment(msg)
+        for a_s in auto.states:
+            targets = TSEncoder._get_targets(auto, a_s, assignment)
+            if targets is None or len(targets) != 1:
+                return False
+            a_t = targets[0]
+
+            if a_t == a_s:
+                continue
+            if auto.is_final(a_t) and not auto.is_final(a_s):
+                return False
+
+            if (a_s, a_t) not in equiv_memo:
+                equiv_memo[(a_s, a_t)] = TSEncoder._same_successors(auto,
+                                                                    a_s, a_t,
+                                                                    solver,
+                                                                    valid_letters)
+            if not equiv_memo[(a_s, a_t)]:
+                return False
+        return True
+
+    @staticmethod
+    def _get_targets(auto, a_s, assignment):
+        """ Returns the list of states reached from a_s reading the
+        letter encoded by assignment, None if a label of a_s does not
+        only depend on the letter.
+        """
+        targets = []
+        for (a_dst, label) in auto.trans[a_s]:
+            label_val = simplify(substitute(label.get_formula(),
+                                            assignment))
+            if label_val.is_true():
+                targets.append(a_dst)
+            elif not label_val.is_false():
+                return None
+        return targets
+
+    @staticmethod
+    def _same_successors(auto, a_s, a_t, solver, valid_letters):
+        """ True if a_s and a_t move to the same state on all the
+        letters in valid_letters """
+        def get_dst_labels(a_state):
+            dst_labels = {}
+            for (a_dst, label) in auto.trans[a_state]:
+                if a_dst in dst_labels:
+                    dst_labels[a_dst] = Or(dst_labels[a_dst],
+                                           label.get_formula())
+                else:
+                    dst_labels[a_dst] = label.get_formula()
+            return dst_labels
+
+        s_labels = get_dst_labels(a_s)
+        t_labels = get_dst_labels(a_t)
+        differ = FALSE_PYSMT()
+        for a_dst in set(s_labels.keys()).union(t_labels.keys()):
+            s_label = s_labels.get(a_dst, FALSE_PYSMT())
+            t_label = t_labels.get(a_dst, FALSE_PYSMT())
+            differ = Or(differ, Not(Iff(s_label, t_label)))
+        return not solver.is_sat(And(valid_letters, differ))
 
     def get_ts_encoding(self):
         """ Returns the transition system encoding of the dynamic
@@ -287,6 +599,75 @@ class TSEncoder:
         # the ts encoding should be built
         self.get_ts_encoding()
 
+        tl_cbs = self._get_trace_cbs(tl_cb_ids)
+
+        if self.large_block:
+            # one transition for each top-level callback
+            trace_encoding = []
+            s1 = self.cenc.eq_val(TSEncoder._get_pc_name(), 0)
+            for tl_cb in tl_cbs:
+                if tl_cb not in self.cb2block:
+                    continue
+                s0 = self.cenc.eq_val(self.mapback.msg_ivar,
+                                      self.cb2block[tl_cb])
+                trace_encoding.append((s0,s1))
+            return trace_encoding
+
+        # encode each callback
+        # No trace constraints in the initial state
+        trace_encoding = []
+        pc_name = TSEncoder._get_pc_name()
+        for (entry_type, msg, msg_key,
+             current_state, next_state) in self._get_trace_msgs(tl_cbs):
+            s0 = self.cenc.eq_val(pc_name, current_state)
+            # strengthen s0 - progress only if the message is enabled
+            msg_enabled = self._get_enabled_var(msg_key)
+            s0 = And(s0, msg_enabled)
+            s1 = self.cenc.eq_val(pc_name, next_state)
+
+            current_step = str(len(trace_encoding) + 1)
+            logging.info("SIMULATION: step %s on %s" % (current_step, msg_key))
+            logging.debug("Simulation debug - transition from %s -> %s" % (current_state,next_state))
+            try:
+                msg_error_enc = self.mapback.get_trans2pc((entry_type, msg, self.error_label))
+                info_msg = """SIMULATION - transition at step %s could not happen if %s is not allowed (%s -> %s in the encoding).
+Simulation only executes the nominal trace and disregards errors.
+If simulation iterrupts here, it could be due to the bug""" % (current_step, msg_key, str(current_state), str(next_state))
+                logging.info(info_msg)
+                # if msg_error_enc is not None:
+                #     # this is a possible error state
+                #     msg_key = TSEncoder.get_key_from_msg(msg, entry_type)
+                #     msg_enabled = TSEncoder._get_state_var(msg_key)
+                #     # progress only if the message is enabled
+                #     s0 = And(s0, msg_enabled)
+            except KeyError:
+                pass
+            trace_encoding.append((s0,s1))
+
+        return trace_encoding
+
+    def get_trace_steps(self, tl_cb_ids = None):
+        """ Returns the sequence of the transitions of the pc of the
+        callbacks of the trace formed by the callbacks, a list of
+        (msg_key, current_state, next_state).
+
+        It is the concrete version of get_trace_encoding (the
+        message msg_key must be enabled in current_state), and it is
+        not available with the large block encoding.
+        """
+        assert not self.large_block
+
+        # the ts encoding should be built
+        self.get_ts_encoding()
+
+        tl_cbs = self._get_trace_cbs(tl_cb_ids)
+        return [(msg_key, current_state, next_state)
+                for (entry_type, msg, msg_key,
+                     current_state, next_state) in self._get_trace_msgs(tl_cbs)]
+
+    def _get_trace_cbs(self, tl_cb_ids):
+        """ Returns the top-level callbacks with the message ids
+        tl_cb_ids (all the top-level callbacks if None) """
         tl_cbs = []
         if tl_cb_ids is not None:
             for message_id in tl_cb_ids:
@@ -295,19 +676,30 @@ class TSEncoder:
                 if cb is None:
                     raise Exception("Message id %s not found in the trace" % message_id)
 
+                if self.large_block:
+                    if cb not in self.cb2block:
+                        raise Exception("Message id %s not found in the (simplified) trace" % message_id)
+                    tl_cbs.append(cb)
+                    continue
+
                 msg_enc = self.mapback.get_trans2pc((TSEncoder.ENTRY, cb))
-                key = TSEncoder.get_key_from_msg(cb, TSEncoder.ENTRY)
+                key = self.get_msg_key(cb, TSEncoder.ENTRY)
                 if not self._is_msg_visible(key):
                     raise Exception("Message id %s not found in the (simplified) trace" % message_id)
 
                 tl_cbs.append(cb)
         else:
             tl_cbs = self.trace.children
-
-        # encode each callback
-        # No trace constraints in the initial state
-        trace_encoding = []
-        pc_name = TSEncoder._get_pc_name()
+        return tl_cbs
+
+    def _get_trace_msgs(self, tl_cbs):
+        """ Returns the list of the visible messages executed by the
+        top-level callbacks tl_cbs, (entry_type, msg, msg_key,
+        current_state, next_state) where current_state and
+        next_state are the values of the pc before and after the
+        message.
+        """
+        trace_msgs = []
         for tl_cb in tl_cbs:
             stack = [(TSEncoder.EXIT, tl_cb),(TSEncoder.ENTRY, tl_cb)]
 
@@ -320,7 +712,7 @@ class TSEncoder:
                         stack.append((TSEncoder.EXIT, msg.children[i]))
                         stack.append((TSEncoder.ENTRY, msg.children[i]))
 
-                msg_key = TSEncoder.get_key_from_msg(msg, entry_type)
+                msg_key = self.get_msg_key(msg, entry_type)
                 if not self._is_msg_visible(msg_key):
                     continue
 
@@ -328,32 +720,9 @@ class TSEncoder:
                 assert(msg_enc is not None)
 
                 (current_state, next_state) = msg_enc
-                s0 = self.cenc.eq_val(pc_name, current_state)
-                # strengthen s0 - progress only if the message is enabled
-                msg_enabled = TSEncoder._get_state_var(msg_key)
-                s0 = And(s0, msg_enabled)
-                s1 = self.cenc.eq_val(pc_name, next_state)
-
-                current_step = str(len(trace_encoding) + 1)
-                logging.info("SIMULATION: step %s on %s" % (current_step, msg_key))
-                logging.debug("Simulation debug - transition from %s -> %s" % (current_state,next_state))
-                try:
-                    msg_error_enc = self.mapback.get_trans2pc((entry_type, msg, self.error_label))
-                    info_msg = """SIMULATION - transition at step %s could not happen if %s is not allowed (%s -> %s in the encoding).
-Simulation only executes the nominal trace and disregards errors.
-If simulation iterrupts here, it could be due to the bug""" % (current_step, msg_key, str(current_state), str(next_state))
-                    logging.info(info_msg)
-                    # if msg_error_enc is not None:
-                    #     # this is a possible error state
-                    #     msg_key = TSEncoder.get_key_from_msg(msg, entry_type)
-                    #     msg_enabled = TSEncoder._get_state_var(msg_key)
-                    #     # progress only if the message is enabled
-                    #     s0 = And(s0, msg_enabled)
-                except KeyError:
-                    pass
-                trace_encoding.append((s0,s1))
-
-        return trace_encoding
+                trace_msgs.append((entry_type, msg, msg_key,
+                                   current_state, next_state))
+        return trace_msgs
 
 
     def get_ground_spec(self):
@@ -385,27 +754,29 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
 
 
     @staticmethod
-    def _compute_ground_spec(gs, specs, stats = None):
+    def _compute_ground_spec(gs, specs, stats = None, jobs = 1):
         """ Computes all the ground specifications from the
         specifications with free variables in self.spec and the
         concrete trace self.trace
 
-        Return a list of ground specifications.
+        The specifications are grounded in jobs processes.
+
+        Return a list of ground specifications (in the order of specs).
         """
 
         if stats is not None:
             stats.start_timer(stats.SPEC_GROUNDING_TIME)
 
-        ground_specs = set()
-        for spec in specs:
-            logging.debug("Grounding spec: %s" % str(spec))
-            tmp = gs.ground_spec(spec)
-            logging.debug("Found %d concrete specs" % len(tmp))
-            ground_specs.update(set(tmp))
+        pruned_specs = gs.pruned_specs
+        ground_specs = gs.ground_spec_list(specs, jobs)
+        pruned_specs = gs.pruned_specs - pruned_specs
+        logging.info("Specs pruned before grounding: %d" % pruned_specs)
 
         if stats is not None:
             stats.stop_timer(stats.SPEC_GROUNDING_TIME)
             stats.write_times(sys.stdout, stats.SPEC_GROUNDING_TIME)
+            stats.inc_counter(stats.PRUNED_SPECS, pruned_specs)
+            stats.write_counter(sys.stdout, stats.PRUNED_SPECS)
 
         return ground_specs
 
@@ -416,8 +787,18 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
     def _is_msg_visible_simpl(self, msg_key):
         return msg_key in self.spec_msgs
 
+    def _is_msg_visible_coi(self, msg_key):
+        return msg_key in self.coi_msgs
+
+    def _get_enabled_var(self, msg_key):
+        """ Returns the formula that is true when msg_key is enabled """
+        if msg_key in self.state_msgs:
+            return TSEncoder._get_state_var(msg_key)
+        else:
+            return TRUE_PYSMT()
+
     @staticmethod
-    def _simplify_trace(trace, spec_msgs):
+    def _simplify_trace(trace, spec_msgs, get_msg_key = None):
         """ Collect all the symbols appearing in the ground
         specifications
 
@@ -434,10 +815,13 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
 
         The result is a new trace.
         """
+        if get_msg_key is None:
+            get_msg_key = TSEncoder.get_key_from_msg
+
         def simplify_msg(parent, trace_msg, spec_msg):
             for child in trace_msg.children:
-                if (TSEncoder.get_key_from_msg(child, TSEncoder.ENTRY) in spec_msg or
-                    TSEncoder.get_key_from_msg(child, TSEncoder.EXIT) in spec_msg):
+                if (get_msg_key(child, TSEncoder.ENTRY) in spec_msg or
+                    get_msg_key(child, TSEncoder.EXIT) in spec_msg):
                     # Keep both entry and exit for now
                     new_parent = copy.copy(child)
                     new_parent.children = []
@@ -455,8 +839,8 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
             simplify_msg(parent, cb, spec_msgs)
 
             # always add the ENTRY of the tl callback
-            if ((TSEncoder.get_key_from_msg(cb, TSEncoder.ENTRY) in spec_msgs or
-                 TSEncoder.get_key_from_msg(cb, TSEncoder.EXIT) in spec_msgs) or
+            if ((get_msg_key(cb, TSEncoder.ENTRY) in spec_msgs or
+                 get_msg_key(cb, TSEncoder.EXIT) in spec_msgs) or
                 len(parent.children) > 0):
                 new_trace.add_msg(parent)
 
@@ -465,10 +849,10 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
                 # print TSEncoder.get_key_from_msg(cb, TSEncoder.EXIT) in spec_msgs
                 # print len(parent.children) > 0
 
-                if ( ( not TSEncoder.get_key_from_msg(cb, TSEncoder.ENTRY) in spec_msgs) and
+                if ( ( not get_msg_key(cb, TSEncoder.ENTRY) in spec_msgs) and
                      len(parent.children) > 0):
                     # CB included by its children
-                    msg_key = TSEncoder.get_key_from_msg(cb, TSEncoder.ENTRY)
+                    msg_key = get_msg_key(cb, TSEncoder.ENTRY)
                     spec_msgs.add(msg_key)
 
         return new_trace
@@ -483,6 +867,16 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
         2. Encode the effects of the specifications
         3. Encode the execution of the top-level callbacks and the
         error conditions
+
+        With the large block encoding, the transitions of the
+        automata and the effects of the specifications are encoded
+        in the transitions of the top-level callbacks (see
+        _encode_blocks).
+
+        The encoding of the variables, of the specifications and of
+        the callbacks is kept: when new specifications are added
+        (see add_specs) only the parts that depend on them are
+        encoded again.
         """
         if self.stats is not None:
             self.stats.start_timer(self.stats.ENCODING_TIME)
@@ -492,23 +886,60 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
         self.ts = TransitionSystem()
 
         # 1. Encode all the variables of the system
-        logging.info("Encoding the variables...")
-        vars_ts = self._encode_vars()
-        self.ts.product(vars_ts)
-        logging.info("Done encoding the variables.")
+        if self.vars_ts is None:
+            logging.info("Encoding the variables...")
+            self.vars_ts = self._encode_vars()
+            self.specs_ts = TransitionSystem()
+            self.accepting = {}
+            self.disabled_msg = set()
+            self.frame_conds = OrderedDict()
+            logging.info("Done encoding the variables.")
+        self.ts.product(self.vars_ts)
 
         # 2. Specs ts
+        # Only encodes the specifications added after the last
+        # encoding (see add_specs)
         logging.info("Encoding the specification...")
-        (spec_ts, disabled_msg, accepting) = self._encode_ground_specs()
+        new_specs = self.encoded_specs[self.specs_ts_count:]
+        self.next_spec_id = self._encode_specs(new_specs,
+                                               self.next_spec_id,
+                                               self.specs_ts,
+                                               self.accepting,
+                                               self.disabled_msg)
+        self.specs_ts_count = len(self.encoded_specs)
+        changed_keys = set([TSEncoder.get_key_from_call(get_spec_rhs(gs.ast))
+                            for gs in new_specs])
+        self._update_frame_conditions(self.frame_conds,
+                                      self.specs_ts.state_vars,
+                                      self.accepting,
+                                      changed_keys)
+
+        spec_ts = TransitionSystem()
+        spec_ts.product(self.specs_ts)
+        if self.large_block:
+            # The steps of the automata, the effects of the
+            # specifications and the constraints on the enabled
+            # messages are composed in the transitions of the blocks
+            self.ts.input_vars = set()
+            self.ts.trans = TRUE_PYSMT()
+            spec_ts.trans = TRUE_PYSMT()
+        else:
+            spec_ts.trans = And([spec_ts.trans] + self.frame_conds.values())
         self.ts.product(spec_ts)
         logging.info("Done encoding the specification.")
 
         # 3. Encode the execution of the top-level callbacks
         logging.info("Encoding the trace...")
-        (cb_ts, errors) = self._encode_cbs(disabled_msg)
-        self.ts.product(cb_ts)
+        error_msgs = self._get_error_msgs()
+        if self.large_block:
+            (self.cb_ts, self.cb_errors) = self._encode_blocks(error_msgs)
+        elif (self.cb_ts is None or error_msgs != self.cb_error_msgs):
+            # the error transitions depend on the disabled messages
+            (self.cb_ts, self.cb_errors) = self._encode_cbs(error_msgs)
+        self.cb_error_msgs = error_msgs
+        self.ts.product(self.cb_ts)
         self.error_prop = FALSE_PYSMT()
-        for e in errors:
+        for e in self.cb_errors:
             self.error_prop = Or(self.error_prop, e)
         self.mapback.set_error_condition(self.error_prop)
         logging.info("Done encoding the trace.")
@@ -529,6 +960,18 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
             self.stats.stop_timer(self.stats.ENCODING_TIME)
             self.stats.write_times(sys.stdout, self.stats.ENCODING_TIME)
 
+            (hits, misses) = self.r2a.get_cache_stats()
+            (old_hits, old_misses) = self.reported_cache_stats
+            self.reported_cache_stats = (hits, misses)
+            self.stats.inc_counter(Stats.AUTOMATA_CACHE_HITS, hits - old_hits)
+            self.stats.inc_counter(Stats.AUTOMATA_CACHE_MISSES,
+                                   misses - old_misses)
+            self.stats.write_counter(sys.stdout, Stats.AUTOMATA_CACHE_HITS)
+            self.stats.write_counter(sys.stdout, Stats.AUTOMATA_CACHE_MISSES)
+            self.stats.write_hit_rate(sys.stdout,
+                                      Stats.AUTOMATA_CACHE_HITS,
+                                      Stats.AUTOMATA_CACHE_MISSES)
+
 
     def _encode_ground_specs(self):
         """ Encode the set of ground specifications.
@@ -547,8 +990,36 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
         # In practice, these are the accepting states of the automaton.
         accepting = {}
         disabled_msg = set()
-        spec_id = 0
-        for ground_spec in self.ground_specs:
+        self._encode_specs(self.encoded_specs, 0, ts, accepting,
+                           disabled_msg)
+
+        frame_conds = OrderedDict()
+        self._update_frame_conditions(frame_conds, ts.state_vars,
+                                      accepting, accepting.keys())
+        for fc in frame_conds.values():
+            ts.trans = And(ts.trans, fc)
+        return (ts, disabled_msg, accepting)
+
+    def _encode_specs(self, specs, spec_id, ts, accepting, disabled_msg):
+        """ Encodes in ts the automata and the effects of the ground
+        specifications in specs, using the program counters from
+        spec_id.
+
+        It has side effects on ts, accepting and disabled_msg (see
+        _encode_ground_specs).
+
+        Returns the next free spec_id.
+        """
+        merged_specs = set()
+        if self.merge_automata:
+            for group in self._get_spec_groups(specs):
+                gs_ts = self._get_merged_ts(group, spec_id, accepting)
+                if gs_ts is not None:
+                    ts.product(gs_ts)
+                    merged_specs.update(group)
+                    spec_id = spec_id + 1
+
+        for ground_spec in specs:
             msg = get_spec_rhs(ground_spec.ast)
             key = TSEncoder.get_key_from_call(msg)
 
@@ -557,12 +1028,24 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
                     disabled_msg.add(key)
 
             if key not in accepting: accepting[key] = []
+            if ground_spec in merged_specs:
+                continue
             gs_ts = self._get_ground_spec_ts(ground_spec,
                                              spec_id,
                                              accepting[key])
             ts.product(gs_ts)
             spec_id = spec_id + 1
+        return spec_id
 
+    def _update_frame_conditions(self, frame_conds, auto_vars, accepting,
+                                 changed_keys):
+        """ Encodes in frame_conds the frame conditions of the
+        messages in changed_keys and of the messages that do not have
+        a frame condition yet.
+
+        auto_vars are the variables of the automata of the
+        specifications.
+        """
         # encodes the frame conditions when there are no accepting
         # the frame conditions must be encoded globally
         #
@@ -572,7 +1055,7 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
         # On the negation of the disjunction of these formulas
         # the variable do not change, so we must encode the frame
         # condition
-        for (msg_key, accepting_for_var) in accepting.iteritems():
+        for msg_key in changed_keys:
             msg_enabled = TSEncoder._get_state_var(msg_key)
 
             # msg_enabled <-> msg_enabled'
@@ -586,24 +1069,22 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
             # Note: the changes is encoded on the next state (the
             # accepting one)
             changes = FALSE_PYSMT()
-            for u in accepting_for_var:
+            for u in accepting[msg_key]:
                 changes = Or(changes, u)
             not_change = Not(changes)
-            not_change_next = self.helper.get_next_formula(ts.state_vars, not_change)
-            fc = Implies(not_change_next, fc_msg)
-            ts.trans = And(ts.trans, fc)
+            not_change_next = self.helper.get_next_formula(auto_vars, not_change)
+            frame_conds[msg_key] = Implies(not_change_next, fc_msg)
 
         # If a message is not in the msg_key, then its value do not change.
         # This applies to all the messages that are not changed by a
         # specification
-        for msg in self.msgs:
+        for msg in self.state_msgs:
             if msg not in accepting:
                 msg_enabled = TSEncoder._get_state_var(msg)
                 fc_msg = Iff(msg_enabled,
                              Helper.get_next_var(msg_enabled,
                                                  self.pysmt_env.formula_manager))
-                ts.trans = And(ts.trans, fc_msg)
-        return (ts, disabled_msg, accepting)
+                frame_conds[msg] = fc_msg
 
     def _get_regexp_ts(self, regexp, spec_id):
         """ Builds the ts for the automaton.
@@ -619,6 +1100,35 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
             pc = s -> ( \bigvee{(dst,label) \in trans(s)} label and (pc' = dst) )
         This allow to re-use the same automaton across the same regexp.
         """
+        auto = self.r2a.get_from_regexp(regexp)
+
+        # program counter of the automaton
+        auto_pc = "spec_pc_%d" % spec_id
+
+        # Rude debugging of the automaton encoding
+        # Leave it here for now.
+        if DEBUG_AUTO:
+            pretty_print(regexp, sys.stdout)
+
+        (auto2ts_map, ts) = self._get_auto_ts(auto, auto_pc)
+
+        final_states_ts = []
+        for a_s in auto.final_states:
+            ts_s = auto2ts_map[a_s]
+            final_states_ts.append(ts_s)
+
+            if DEBUG_AUTO:
+                print "FINAL - %s: %d\n" % (auto_pc, ts_s)
+
+        return (auto_pc, final_states_ts, ts)
+
+    def _get_auto_ts(self, auto, auto_pc):
+        """ Builds the ts for the automaton auto, using the program
+        counter auto_pc (see _get_regexp_ts).
+
+        Returns the map from the states of auto to the values of the
+        pc and the ts.
+        """
         def _get_pc_value(auto2ts_map, current_pc_val, auto_state):
             if not auto_state in auto2ts_map:
                 current_pc_val += 1
@@ -634,17 +1144,12 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
         # counter for the transition system
         auto2ts_map = {}
 
-        auto = self.r2a.get_from_regexp(regexp)
-
-        # program counter of the automaton
-        auto_pc = "spec_pc_%d" % spec_id
         self.cenc.add_var(auto_pc, auto.count_state() - 1) # -1 since it starts from 0
         for v in self.cenc.get_counter_var(auto_pc): ts.add_var(v)
 
         # Rude debugging of the automaton encoding
         # Leave it here for now.
         if DEBUG_AUTO:
-            pretty_print(regexp, sys.stdout)
             auto.to_dot(sys.stdout)
             print auto_pc
 
@@ -696,15 +1201,76 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
             s_trans = Implies(eq_current, s_trans)
             ts.trans = And(ts.trans, s_trans)
 
-        final_states_ts = []
-        for a_s in auto.final_states:
-            ts_s = auto2ts_map[a_s]
-            final_states_ts.append(ts_s)
+        self.pc2auto[auto_pc] = (auto, auto2ts_map)
 
-            if DEBUG_AUTO:
-                print "FINAL - %s: %d\n" % (auto_pc, ts_s)
+        return (auto2ts_map, ts)
 
-        return (auto_pc, final_states_ts, ts)
+    def _get_spec_groups(self, specs):
+        """ Groups the specifications in specs by the key of their rhs
+        and their effect (enable or disable).
+
+        Returns the list of the groups that contain at least two
+        different regular expressions (the specifications with the same
+        regular expression already share the automaton).
+        """
+        groups = {}
+        group_keys = []
+        for ground_spec in specs:
+            key = TSEncoder.get_key_from_call(get_spec_rhs(ground_spec.ast))
+            group_key = (key, ground_spec.is_disable())
+            if group_key not in groups:
+                groups[group_key] = []
+                group_keys.append(group_key)
+            groups[group_key].append(ground_spec)
+
+        res = []
+        for group_key in group_keys:
+            group = groups[group_key]
+            regexps = set([get_regexp_node(gs.ast) for gs in group])
+            if len(regexps) > 1:
+                res.append(group)
+        return res
+
+    def _get_merged_ts(self, group, spec_id, accepting):
+        """ Encodes the specifications in group (that have the same
+        rhs and the same effect) with a single automaton, the
+        deterministic union of the automata of their regular expressions.
+
+        It has side effects on accepting.
+
+        Returns None, without encoding the specifications, if the union
+        has more than self.merge_max_states states (the
+        specifications are then encoded with their own automata).
+        """
+        regexps = []
+        for ground_spec in group:
+            regexp = get_regexp_node(ground_spec.ast)
+            if regexp not in regexps:
+                regexps.append(regexp)
+        autos = [self.r2a.get_from_regexp(regexp) for regexp in regexps]
+
+        union = Automaton.get_union_dfa(autos, self.merge_max_states)
+        if union is None:
+            logging.info("Union of %d automata exceeds %d states, " \
+                         "encoding them separately" % (len(autos),
+                                                       self.merge_max_states))
+            return None
+        (auto, auto_accepting) = union
+
+        auto_pc = "spec_pc_%d" % spec_id
+        (auto2ts_map, ts_auto) = self._get_auto_ts(auto, auto_pc)
+        ts = TransitionSystem()
+        ts.product(ts_auto)
+
+        for ground_spec in group:
+            index = regexps.index(get_regexp_node(ground_spec.ast))
+            final_states = [auto2ts_map[a_s] for a_s in auto.states
+                            if index in auto_accepting[a_s]]
+            key = TSEncoder.get_key_from_call(get_spec_rhs(ground_spec.ast))
+            if key not in accepting: accepting[key] = []
+            self._encode_spec_effects(ground_spec, auto_pc, final_states,
+                                      ts, accepting[key])
+        return ts
 
 
     def _get_ground_spec_ts(self, ground_spec, spec_id, accepting):
@@ -749,6 +1315,19 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
             self.regexp2ts[regexp] = (auto_pc, final_states, ts_auto)
             ts.product(ts_auto)
 
+        self._encode_spec_effects(ground_spec, auto_pc, final_states,
+                                  ts, accepting)
+        return ts
+
+    def _encode_spec_effects(self, ground_spec, auto_pc, final_states,
+                             ts, accepting):
+        """ Encodes in ts the effects of ground_spec, that changes the
+        rhs in the final_states of the automaton with pc auto_pc.
+
+        It has side effects on ts and accepting.
+        """
+        self.spec2ts[ground_spec] = (auto_pc, final_states)
+
         # Record the final states - on these states the value of the
         # rhs of the specifications change
         spec_accepting = []
@@ -789,7 +1368,6 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
                                   ground_spec,
                                   accepting_formula,
                                   spec)
-        return ts
 
 
     def _encode_vars(self):
@@ -807,7 +1385,7 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
         for v in self.r2a.get_letter_vars():
             var_ts.add_ivar(v)
 
-        for msg in self.msgs:
+        for msg in self.state_msgs:
             # create the state variable
             var = TSEncoder._get_state_var(msg)
             var_ts.add_var(var)
@@ -865,6 +1443,9 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
         max_pc_value = pc_size - 1
 
         pc_name = TSEncoder._get_pc_name()
+        # the callbacks are encoded again when new specifications are
+        # added (see add_specs)
+        self.cenc.remove_var(pc_name)
         self.cenc.add_var(pc_name, max_pc_value) # starts from 0
         self.mapback.set_pc_var(pc_name)
         self.mapback.add_encoder(pc_name, self.cenc)
@@ -873,6 +1454,17 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
         error_state_id = max_pc_value
         logging.debug("%d is the error state: " % error_state_id)
 
+        # Explicit graph of the pc: map from a value of the pc to the
+        # list of transitions (next value, letter, guard key, guard
+        # value), where the message guard key must have the enabled
+        # status guard value (no guard if guard key is None)
+        self.pc_graph = {}
+        self.pc_error_state = error_state_id
+        def add_pc_edge(current, next_value, letter, guard_key, guard_value):
+            if current not in self.pc_graph: self.pc_graph[current] = []
+            self.pc_graph[current].append((next_value, letter,
+                                           guard_key, guard_value))
+
         # add all the bit variables
         for v in self.cenc.get_counter_var(pc_name):
             ts.add_var(v)
@@ -883,11 +1475,11 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
 
 
         def add_msgs_to_stack(stack, msg):
-            exit_key = TSEncoder.get_key_from_msg(msg, TSEncoder.EXIT)
+            exit_key = self.get_msg_key(msg, TSEncoder.EXIT)
             if self._is_msg_visible(exit_key):
                 stack.append((TSEncoder.EXIT, msg))
 
-            entry_key = TSEncoder.get_key_from_msg(msg, TSEncoder.ENTRY)
+            entry_key = self.get_msg_key(msg, TSEncoder.ENTRY)
             if self._is_msg_visible(entry_key):
                 stack.append((TSEncoder.ENTRY, msg))
 
@@ -905,8 +1497,8 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
             add_msgs_to_stack(stack, tl_cb)
             while (len(stack) != 0):
                 (entry_type, msg) = stack.pop()
-                msg_key = TSEncoder.get_key_from_msg(msg, entry_type)
-                msg_enabled = TSEncoder._get_state_var(msg_key)
+                msg_key = self.get_msg_key(msg, entry_type)
+                msg_enabled = self._get_enabled_var(msg_key)
                 assert self._is_msg_visible(msg_key)
 
                 # Fill the stack in reverse order
@@ -940,6 +1532,7 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
                 snext = self.helper.get_next_formula(ts.state_vars, snext)
                 single_trans = And([s0, label, snext])
                 ts.trans = Or([ts.trans, single_trans])
+                add_pc_edge(current_state, next_state, msg_key, msg_key, True)
 
                 logging.debug("Trans: %d -> %d on %s" % (current_state, next_state, msg_key))
 
@@ -955,6 +1548,8 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
                     single_trans = And([s0, error_label, snext_error])
                     logging.debug("Error transition: %d -> %d on %s" % (current_state, error_state_id, error_label))
                     ts.trans = Or([ts.trans, single_trans])
+                    add_pc_edge(current_state, error_state_id,
+                                self.error_label, msg_key, False)
 
                     if error is None:
                         error = self.cenc.eq_val(pc_name, max_pc_value)
@@ -981,6 +1576,8 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
                                   error_state_id,
                                   self.error_label,
                                   self.error_label)
+        add_pc_edge(error_state_id, error_state_id, self.error_label,
+                    None, None)
 
         ts.trans = Or([ts.trans, single_trans])
 
@@ -991,6 +1588,288 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
         return (ts, errors)
 
 
+    def _get_block_msgs(self, tl_cb):
+        """ Returns the list of the visible messages (entry_type,
+        msg, msg_key) executed by the top-level callback tl_cb, in
+        the order of execution.
+        """
+        block_msgs = []
+        stack = [(TSEncoder.EXIT, tl_cb), (TSEncoder.ENTRY, tl_cb)]
+        while (len(stack) != 0):
+            (entry_type, msg) = stack.pop()
+            if (TSEncoder.ENTRY == entry_type):
+                for i in reversed(range(len(msg.children))):
+                    stack.append((TSEncoder.EXIT, msg.children[i]))
+                    stack.append((TSEncoder.ENTRY, msg.children[i]))
+
+            msg_key = self.get_msg_key(msg, entry_type)
+            if self._is_msg_visible(msg_key):
+                block_msgs.append((entry_type, msg, msg_key))
+        return block_msgs
+
+    def _get_spec_effects(self):
+        """ Returns the list of the pcs of the automata of the encoded
+        specifications and the map from the key of a message to the
+        list of the effects on the message (auto_pc, final_states,
+        is_enable) of the specifications.
+        """
+        auto_pcs = []
+        effects = {}
+        for ground_spec in self.encoded_specs:
+            (auto_pc, final_states) = self.spec2ts[ground_spec]
+            if auto_pc not in auto_pcs:
+                auto_pcs.append(auto_pc)
+            key = TSEncoder.get_key_from_call(get_spec_rhs(ground_spec.ast))
+            if key not in effects: effects[key] = []
+            effects[key].append((auto_pc, set(final_states),
+                                 ground_spec.is_enable()))
+        return (auto_pcs, effects)
+
+    def _get_auto_step(self, auto_pc, msg_key):
+        """ Returns the step of the (deterministic) automaton with pc
+        auto_pc on the letter msg_key, a map from each value of the pc
+        to the value reached reading msg_key (None if the automaton
+        cannot read msg_key).
+        """
+        if (auto_pc, msg_key) not in self.auto_steps:
+            (auto, auto2ts_map) = self.pc2auto[auto_pc]
+            assignment = self.r2a.get_msg_assignment(msg_key)
+            step = {}
+            for a_s in auto.states:
+                targets = TSEncoder._get_targets(auto, a_s, assignment)
+                assert targets is not None and len(targets) <= 1
+                if len(targets) == 0:
+                    # the automaton cannot read the message
+                    step[auto2ts_map[a_s]] = None
+                else:
+                    step[auto2ts_map[a_s]] = auto2ts_map[targets[0]]
+            self.auto_steps[(auto_pc, msg_key)] = step
+        return self.auto_steps[(auto_pc, msg_key)]
+
+    def _encode_blocks(self, disabled_msg):
+        """ Large block encoding of the callbacks.
+
+        After the system picks a top-level callback, the sequence of
+        messages executed in the callback is fixed. The encoding
+        executes all the messages of a top-level callback in a single
+        transition, so the length of a path is the number of
+        top-level callbacks and not the number of messages.
+
+        The automata are deterministic and the letters of the block
+        are known, so the steps of each automaton are composed
+        explicitly: for each state s of the automaton the encoding
+        computes the state reached from s after each message of the
+        block. The enabled status of a message after each message of
+        the block is a formula on the current state (the last effect
+        of the specifications applied in the block, or the current
+        value).
+
+        The input variable of the transition system selects the
+        block. Each message in the block that can be disallowed has
+        an additional transition to the error state: the transition
+        executes the block up to the message, the message must be
+        disabled and the system moves to the error state keeping the
+        state of the automata and of the messages before the message.
+
+        Returns a transition system and a list of error states
+        """
+        ts = TransitionSystem()
+        errors = []
+
+        # The system picks the next callback in 0, 1 is the error state
+        pc_name = TSEncoder._get_pc_name()
+        error_state_id = 1
+        self.cenc.remove_var(pc_name)
+        self.cenc.add_var(pc_name, error_state_id)
+        self.mapback.set_pc_var(pc_name)
+        self.mapback.add_encoder(pc_name, self.cenc)
+        for v in self.cenc.get_counter_var(pc_name):
+            ts.add_var(v)
+        ts.init = self.cenc.eq_val(pc_name, 0)
+
+        all_vars = set(self.ts.state_vars)
+        all_vars.update(ts.state_vars)
+
+        # effects of the encoded specifications
+        (auto_pcs, effects) = self._get_spec_effects()
+        enabled_keys = set(self.state_msgs)
+        enabled_keys.update(effects.keys())
+        enabled_vars = {}
+        for key in enabled_keys:
+            enabled_vars[key] = TSEncoder._get_state_var(key)
+            all_vars.add(enabled_vars[key])
+            if enabled_vars[key] not in self.ts.state_vars:
+                # rhs of a specification not in the trace
+                ts.add_var(enabled_vars[key])
+
+        def get_next_state(auto_states, enabled):
+            """ Encodes the next state of the automata and of the
+            enabled variables """
+            next_state = []
+            for auto_pc in auto_pcs:
+                current = auto_states[auto_pc]
+                if all(s == t for (s, t) in current.iteritems()):
+                    for v in self.cenc.get_counter_var(auto_pc):
+                        next_state.append(Iff(Helper.get_next_var(v, self.pysmt_env.formula_manager),
+                                              v))
+                    continue
+                auto_next = []
+                for (s, t) in current.iteritems():
+                    if t is None:
+                        continue
+                    eq_next = self.cenc.eq_val(auto_pc, t)
+                    eq_next = self.helper.get_next_formula(all_vars, eq_next)
+                    auto_next.append(And(self.cenc.eq_val(auto_pc, s),
+                                         eq_next))
+                next_state.append(Or(auto_next))
+            for (key, enabled_formula) in enabled.iteritems():
+                msg_enabled = enabled_vars[key]
+                next_state.append(Iff(Helper.get_next_var(msg_enabled,
+                                                          self.pysmt_env.formula_manager),
+                                      enabled_formula))
+            return And(next_state)
+
+        # collect the blocks
+        blocks = []
+        block_count = 0
+        for tl_cb in self.trace.children:
+            block_msgs = self._get_block_msgs(tl_cb)
+            if len(block_msgs) == 0:
+                continue
+            error_positions = []
+            for i in range(len(block_msgs)):
+                (entry_type, msg, msg_key) = block_msgs[i]
+                if (msg_key in disabled_msg and
+                    ((isinstance(msg, CCallin) and entry_type == TSEncoder.ENTRY) or
+                     (isinstance(msg, CCallback) and entry_type == TSEncoder.EXIT))):
+                    error_positions.append(i)
+            blocks.append((tl_cb, block_msgs, error_positions))
+            block_count += 1 + len(error_positions)
+
+        # input variable that selects the block (the last value is the
+        # self loop on the error state)
+        block_var = "__block_var___"
+        self.cenc.remove_var(block_var)
+        self.cenc.add_var(block_var, block_count)
+        self.mapback.set_msg_ivar(block_var)
+        self.mapback.add_encoder(block_var, self.cenc)
+        for v in self.cenc.get_counter_var(block_var):
+            ts.add_ivar(v)
+
+        s0 = self.cenc.eq_val(pc_name, 0)
+        s0_next = self.helper.get_next_formula(all_vars, s0)
+        error_state = self.cenc.eq_val(pc_name, error_state_id)
+        error_next = self.helper.get_next_formula(all_vars, error_state)
+
+        self.cb2block = {}
+        ts.trans = FALSE_PYSMT() # disjunction of transitions
+        block_value = 0
+        for (tl_cb, block_msgs, error_positions) in blocks:
+            auto_states = {}
+            for auto_pc in auto_pcs:
+                (auto, auto2ts_map) = self.pc2auto[auto_pc]
+                auto_states[auto_pc] = dict((s, s) for s in auto2ts_map.values())
+            enabled = dict(enabled_vars)
+            last_effects = {}
+            conditions = [s0]
+
+            for i in range(len(block_msgs)):
+                (entry_type, msg, msg_key) = block_msgs[i]
+                if msg_key in enabled:
+                    msg_enabled = enabled[msg_key]
+                else:
+                    msg_enabled = TRUE_PYSMT()
+
+                if i in error_positions:
+                    # the message is not allowed, move to the error
+                    # state
+                    error_value = block_value + 1 + error_positions.index(i)
+                    error_trans = And(conditions +
+                                      [self.cenc.eq_val(block_var, error_value),
+                                       Not(msg_enabled),
+                                       error_next,
+                                       get_next_state(auto_states, enabled)])
+                    ts.trans = Or(ts.trans, error_trans)
+                    self.mapback.add_vars2msg(error_value, msg_key)
+                    self.mapback.add_block2trace(error_value,
+                                                 [(e, m) for (e, m, k) in block_msgs[:i+1]])
+                    logging.debug("Error transition: block %d at %s" % (block_value,
+                                                                        msg_key))
+
+                # progress only if the message is enabled
+                conditions.append(msg_enabled)
+
+                # step of the automata
+                for auto_pc in auto_pcs:
+                    step = self._get_auto_step(auto_pc, msg_key)
+                    current = auto_states[auto_pc]
+                    for (s, t) in current.iteritems():
+                        if t is None:
+                            continue
+                        t = step[t]
+                        if t is None:
+                            conditions.append(Not(self.cenc.eq_val(auto_pc, s)))
+                        current[s] = t
+
+                # effects of the specifications
+                for (key, key_effects) in effects.iteritems():
+                    enable = []
+                    disable = []
+                    for (auto_pc, final_states, is_enable) in key_effects:
+                        for (s, t) in auto_states[auto_pc].iteritems():
+                            if t in final_states:
+                                accepting = self.cenc.eq_val(auto_pc, s)
+                                if is_enable:
+                                    enable.append(accepting)
+                                else:
+                                    disable.append(accepting)
+                    if len(enable) == 0 and len(disable) == 0:
+                        continue
+                    enable = Or(enable)
+                    disable = Or(disable)
+                    if last_effects.get(key) == (enable, disable):
+                        # same effect of the previous message
+                        continue
+                    last_effects[key] = (enable, disable)
+                    # a message cannot be enabled and disabled
+                    conditions.append(Not(And(enable, disable)))
+                    enabled[key] = Or(enable, And(Not(disable), enabled[key]))
+
+            block_trans = And(conditions +
+                              [self.cenc.eq_val(block_var, block_value),
+                               s0_next,
+                               get_next_state(auto_states, enabled)])
+            ts.trans = Or(ts.trans, block_trans)
+
+            self.mapback.add_vars2msg(block_value, block_msgs[0][2])
+            self.mapback.add_block2trace(block_value,
+                                         [(e, m) for (e, m, k) in block_msgs])
+            self.cb2block[tl_cb] = block_value
+            logging.debug("Block %d: %d messages, %d error transitions" % (block_value,
+                                                                           len(block_msgs),
+                                                                           len(error_positions)))
+            block_value += 1 + len(error_positions)
+
+        if block_count > len(blocks):
+            errors.append(error_state)
+
+        # Add self loop on error state to avoid deadlocks
+        frame = [Iff(Helper.get_next_var(v, self.pysmt_env.formula_manager), v)
+                 for v in all_vars
+                 if v not in self.cenc.get_counter_var(pc_name)]
+        single_trans = And([error_state,
+                            self.cenc.eq_val(block_var, block_count),
+                            error_next] + frame)
+        ts.trans = Or(ts.trans, single_trans)
+        self.mapback.add_vars2msg(block_count, self.error_label)
+        self.mapback.add_pc2trace(error_state_id,
+                                  error_state_id,
+                                  self.error_label,
+                                  self.error_label)
+
+        return (ts, errors)
+
+
     def _encode_initial_conditions(self):
         """ Initial condition:
         All the messages that are not specifically disabled/disallowed are
@@ -1001,7 +1880,7 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
                                                logic=QF_BOOL)
         solver.add_assertion(self.ts.init)
 
-        for msg in self.msgs:
+        for msg in self.state_msgs:
             msg_var = TSEncoder._get_state_var(msg)
             solver.push()
             solver.add_assertion(msg_var)
@@ -1047,6 +1926,34 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
                                         ",".join(string_params))
         return key
 
+    def get_msg_key(self, msg, entry_type):
+        """ Returns the key of the message msg of the trace.
+
+        Same as get_key_from_msg, but the ENTRY and EXIT keys are
+        computed once per message.
+        """
+        try:
+            keys = self.msg_keys[msg]
+        except KeyError:
+            keys = TSEncoder.get_keys_from_msg(msg)
+            self.msg_keys[msg] = keys
+
+        if entry_type == TSEncoder.ENTRY:
+            return keys[0]
+        else:
+            assert entry_type == TSEncoder.EXIT
+            return keys[1]
+
+    @staticmethod
+    def get_keys_from_msg(msg):
+        """ Returns the pair of ENTRY and EXIT keys of msg """
+        (retval, msg_type, full_msg_name, params) = TSEncoder._get_msg_key_data(msg)
+        entry_key = TSEncoder.get_key(retval, msg_type, TSEncoder.ENTRY,
+                                      full_msg_name, params)
+        exit_key = TSEncoder.get_key(retval, msg_type, TSEncoder.EXIT,
+                                     full_msg_name, params)
+        return (entry_key, exit_key)
+
     @staticmethod
     def get_key_from_msg(msg, entry_type):
         """ The input is a msg from a concrete trace.
@@ -1054,6 +1961,11 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
 
         The message must also be paired with the entry/exit information.
         """
+        (retval, msg_type, full_msg_name, params) = TSEncoder._get_msg_key_data(msg)
+        return TSEncoder.get_key(retval, msg_type, entry_type, full_msg_name, params)
+
+    @staticmethod
+    def _get_msg_key_data(msg):
 
         if isinstance(msg, CCallin):
             msg_type = "CI"
@@ -1073,7 +1985,7 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
             params.append(p_value)
 
         full_msg_name = msg.get_full_msg_name()
-        return TSEncoder.get_key(retval, msg_type, entry_type, full_msg_name, params)
+        return (retval, msg_type, full_msg_name, params)
 
     @staticmethod
     def get_key_from_call(call_node):
@@ -1159,7 +2071,7 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
             msg = stack.pop()
 
             # Add ENTRY
-            key = TSEncoder.get_key_from_msg(msg, TSEncoder.ENTRY)
+            key = self.get_msg_key(msg, TSEncoder.ENTRY)
             if self._is_msg_visible(key):
                 trace_length = trace_length + 1
                 msgs.add(key)
@@ -1171,7 +2083,7 @@ If simulation iterrupts here, it could be due to the bug""" % (current_step, msg
                     ci_entry.add(key)
 
             # Add EXIT
-            key = TSEncoder.get_key_from_msg(msg, TSEncoder.EXIT)
+            key = self.get_msg_key(msg, TSEncoder.EXIT)
             if self._is_msg_visible(key):
                 trace_length = trace_length + 1
                 msgs.add(key)
@@ -1214,6 +2126,8 @@ class TSMapback():
     a. Message state variable -> ground specification -> (accepting, specification)
     b. (msg_ivar, value) -> msg
     c. (pc_var, value) -> ci/cb in the trace
+    d. (msg_ivar, value) -> list of ci/cb executed in a block (large
+       block encoding)
     """
 
     def __init__(self, pysmt_env, msg_ivar, pc_var):
@@ -1223,6 +2137,9 @@ class TSMapback():
         self.pc2trace = {}
 
         self.msg2trans = {}
+        # (large block encoding) value of the input variable -> list
+        # of messages executed in the block
+        self.block2trace = {}
 
         self.msg_ivar = msg_ivar
         self.pc_var = pc_var
@@ -1273,6 +2190,9 @@ class TSMapback():
         assert self.pc_var is not None
         self.pc2trace[(self.pc_var, value, next_value, msg_key)] = trace_msg
 
+    def add_block2trace(self, value, trace_msgs):
+        self.block2trace[value] = trace_msgs
+
     def add_trans2pc(self, msg, current_state, next_state):
         self.msg2trans[msg] = (current_state, next_state)
 
@@ -1310,7 +2230,14 @@ class TSMapback():
     def get_fired_trace_msg(self, current_state, next_state):
         """ Given the models for the current states, returns
         the correspondent message in the trace that was executed.
+
+        With the large block encoding, returns the list of messages
+        executed in the transition.
         """
+        if len(self.block2trace) > 0:
+            value = self._get_pc_value(self.msg_ivar, current_state)
+            if value in self.block2trace:
+                return self.block2trace[value]
 
         trans_label = self.get_trans_label(current_state)
 
@@ -1394,13 +2321,33 @@ class TSMapback():
 class RegExpToAuto():
     """ Utility class to convert a regular expression in an automaton.
 
-    TODO: We can implement memoization of the intermediate results
+    The sub-expressions are hash-consed: a sub-expression is
+    identified by its operator and the ids of its operands (an atom by
+    its formula, that is unique in pysmt), so the same sub-expression
+    appearing in different regular expressions (e.g. the ground
+    specifications of the same template) has the same id.
+
+    The automata of the sub-expressions and the minimized automata
+    of the regular expressions are kept in a LRU cache of at most
+    cache_size automata (the sub-expressions are not minimized, since
+    the minimization of all the intermediate results is slower than
+    the operations on the non-minimal automata).
+    """
+
+    # Default size of the cache of the automata
+    CACHE_SIZE = 1000
 
-    TODO: all the recursive functions should become iterative
+    # Keys of the atoms and of the minimized automata in the table of
+    # the sub-expressions
+    _ATOM = "atom"
+    _MINIMIZE = "minimize"
 
-    """
+    # Arity of the operators of the regular expressions
+    _OPERATORS = {AND_OP : 2, OR_OP : 2, SEQ_OP : 2,
+                  NOT_OP : 1, STAR_OP : 1}
 
-    def __init__(self, cenc, alphabet, mapback, auto_env=None):
+    def __init__(self, cenc, alphabet, mapback, auto_env=None,
+                 cache_size=CACHE_SIZE):
         if auto_env is None:
             auto_env = AutoEnv.get_global_auto_env()
         self.auto_env = auto_env
@@ -1421,6 +2368,25 @@ class RegExpToAuto():
             self.letter_to_val[self.alphabet_list[i]] = i
             mapback.add_vars2msg(i, self.alphabet_list[i])
 
+        if self.auto_env.use_bdds:
+            # the bits of the messages are the top of the BDDs
+            self.auto_env.set_variable_order(self.cenc.get_counter_bits(self.counter_var))
+        elif self.auto_env.use_explicit:
+            # the i-th letter of the labels is the message with value i
+            self.auto_env.set_alphabet([self.get_msg_eq(msg)
+                                        for msg in self.alphabet_list])
+
+        # map from the key of a sub-expression to its id and
+        # list of the keys of the sub-expressions (indexed by id)
+        self.subexpr_ids = {}
+        self.subexpr_keys = []
+
+        # LRU cache from the id of a sub-expression to its automaton
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+
     def get_letter_vars(self):
         return self.cenc.get_counter_var(self.counter_var)
 
@@ -1431,83 +2397,166 @@ class RegExpToAuto():
         value = self.letter_to_val[msg_value]
         return self.cenc.eq_val(self.counter_var, value)
 
+    def get_msg_assignment(self, msg_value):
+        """ Returns the assignment to the letter variables for msg_value """
+        value = self.letter_to_val[msg_value]
+        return self.cenc.get_val_assignment(self.counter_var, value)
+
     def get_msg_for_val(self, value):
         assert value >= 0 and len(value) < len(self.alphabet_list) 
         return self.alphabet_list[value]
 
     def get_atom_var(self, call_node):
         key = TSEncoder.get_key_from_call(call_node)
+        if key not in self.letter_to_val:
+            # the message was removed from the alphabet (cone of
+            # influence), it is never read
+            return FALSE_PYSMT()
         eq = self.get_msg_eq(key)
         return eq
 
     def get_from_regexp(self, regexp):
-        """ Return a DETERMINISTIC automaton """
-        res = self.get_from_regexp_aux(regexp)
-        #deterministic = res.determinize()
-        deterministic = res.minimize()
+        """ Return a DETERMINISTIC (and minimal) automaton.
 
+        The automaton is shared with the cache and must not be
+        modified.
+        """
+        expr_id = self._get_expr_id(regexp)
+        min_id = self._get_id((RegExpToAuto._MINIMIZE, expr_id))
+        deterministic = self._cache_lookup(min_id)
+        if deterministic is None:
+            automaton = self._get_auto(expr_id)
+            if not automaton.is_deterministic():
+                automaton = automaton.determinize()
+            # cheaper than the two subset constructions of minimize
+            deterministic = automaton.minimize_dfa()
+            self._cache_insert(min_id, deterministic)
         return deterministic
 
     def get_from_regexp_aux(self, regexp):
-        node_type = get_node_type(regexp)
-
-        if (node_type in [TRUE,FALSE,CALL_ENTRY,CALL_EXIT]):
-            # base case
-            # accept the atoms in the bexp
-            formula = self.get_be(regexp)
-            label = self.auto_env.new_label(formula)
-            automaton = Automaton.get_singleton(label, self.auto_env)
-            return automaton
-        elif (node_type == AND_OP):
-            lhs = self.get_from_regexp_aux(regexp[1])
-            rhs = self.get_from_regexp_aux(regexp[2])
-
-            automaton = lhs.intersection(rhs)
-
-            lhs = None
-            rhs = None
-            return automaton
-        elif (node_type == OR_OP):
-            lhs = self.get_from_regexp_aux(regexp[1])
-            rhs = self.get_from_regexp_aux(regexp[2])
+        """ Return the (non minimized) automaton of regexp """
+        return self._get_auto(self._get_expr_id(regexp))
 
-            automaton = lhs.union(rhs)
+    def get_cache_stats(self):
+        """ Returns the hits and the misses of the cache """
+        return (self.cache_hits, self.cache_misses)
 
-            lhs = None
-            rhs = None
-            return automaton
-        elif (node_type == NOT_OP):
-            lhs = self.get_from_regexp_aux(regexp[1])
+    def _get_expr_id(self, regexp):
+        """ Returns the id of the (hash-consed) regexp.
 
-            automaton = lhs.complement()
+        The visit is iterative, so that deeply nested regular
+        expressions do not reach the recursion limit.
+        """
+        # stack of (node, operands visited)
+        stack = [(regexp, False)]
+        # ids of the visited operands
+        ids = []
+        while (len(stack) > 0):
+            (node, visited) = stack.pop()
+            node_type = get_node_type(node)
+
+            if (node_type in [TRUE,FALSE,CALL_ENTRY,CALL_EXIT]):
+                # accept the atoms in the bexp
+                key = (RegExpToAuto._ATOM, self.get_be(node))
+            elif (node_type in RegExpToAuto._OPERATORS):
+                arity = RegExpToAuto._OPERATORS[node_type]
+                if (not visited):
+                    stack.append((node, True))
+                    # visit the first operand first
+                    for i in reversed(range(1, arity + 1)):
+                        stack.append((node[i], False))
+                    continue
+                key = tuple([node_type] + ids[-arity:])
+                del ids[-arity:]
+            else:
+                # Should not see them, the boolean atoms are the CALLS node
+                # ID, INT, FLOAT, PARAM_LIST, NIL, DONTCARE, STRING, VALUE
+                #
+                # Should not even see the higher level nodes:
+                # SPEC_SYMB
+                # ENABLE_OP
+                # DISABLE_OP
+                # SPEC_LIST
+                raise UnexpectedSymbol(node)
+
+            ids.append(self._get_id(key))
+
+        assert len(ids) == 1
+        return ids[0]
+
+    def _get_id(self, key):
+        expr_id = self.subexpr_ids.get(key)
+        if expr_id is None:
+            expr_id = len(self.subexpr_keys)
+            self.subexpr_ids[key] = expr_id
+            self.subexpr_keys.append(key)
+        return expr_id
+
+    def _get_auto(self, expr_id):
+        """ Returns the automaton of the sub-expression expr_id,
+        building (iteratively) the automata that are not in the cache.
+        """
+        # automata of the sub-expressions used in this call (they may
+        # be evicted from the cache meanwhile)
+        autos = {}
+        stack = [expr_id]
+        while (len(stack) > 0):
+            current_id = stack[-1]
+            if current_id in autos:
+                stack.pop()
+                continue
 
-            lhs = None
-            return automaton
+            automaton = self._cache_lookup(current_id)
+            if automaton is None:
+                key = self.subexpr_keys[current_id]
+                if (key[0] == RegExpToAuto._ATOM):
+                    label = self.auto_env.new_label(key[1])
+                    automaton = Automaton.get_singleton(label, self.auto_env)
+                else:
+                    missing = [op_id for op_id in key[1:]
+                               if op_id not in autos]
+                    if (len(missing) > 0):
+                        stack.extend(missing)
+                        continue
+                    automaton = self._apply_op(key[0],
+                                               [autos[op_id] for op_id in key[1:]])
+                self._cache_insert(current_id, automaton)
+
+            autos[current_id] = automaton
+            stack.pop()
+
+        return autos[expr_id]
+
+    def _apply_op(self, node_type, operands):
+        if (node_type == AND_OP):
+            return operands[0].intersection(operands[1])
+        elif (node_type == OR_OP):
+            return operands[0].union(operands[1])
+        elif (node_type == NOT_OP):
+            return operands[0].complement()
         elif (node_type == SEQ_OP):
-            lhs = self.get_from_regexp_aux(regexp[1])
-            rhs = self.get_from_regexp_aux(regexp[2])
-
-            automaton = lhs.concatenate(rhs)
-            lhs = None
-            rhs = None
-            return automaton
+            return operands[0].concatenate(operands[1])
         elif (node_type == STAR_OP):
-            lhs = self.get_from_regexp_aux(regexp[1])
-
-            automaton = lhs.klenee_star()
-
-            lhs = None
-            return automaton
+            return operands[0].klenee_star()
         else:
-            # Should not see them, the boolean atoms are the CALLS node
-            # ID, INT, FLOAT, PARAM_LIST, NIL, DONTCARE, STRING, VALUE
-            #
-            # Should not even see the higher level nodes:
-            # SPEC_SYMB
-            # ENABLE_OP
-            # DISABLE_OP
-            # SPEC_LIST
-            raise UnexpectedSymbol(regexp)
+            raise UnexpectedSymbol(node_type)
+
+    def _cache_lookup(self, expr_id):
+        automaton = self.cache.pop(expr_id, None)
+        if automaton is not None:
+            # most recently used
+            self.cache[expr_id] = automaton
+            self.cache_hits += 1
+        return automaton
+
+    def _cache_insert(self, expr_id, automaton):
+        self.cache_misses += 1
+        if self.cache_size <= 0:
+            return
+        self.cache[expr_id] = automaton
+        if (len(self.cache) > self.cache_size):
+            # evict the least recently used
+            self.cache.popitem(last=False)
 
     def get_be(self, be_node):
         """ Given a node that represent a Boolean expression returns
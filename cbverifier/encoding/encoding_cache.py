@@ -0,0 +1,254 @@
+""" On-disk cache of the encodings of the verification problem.
+
+Each mode of the driver (bmc, ic3, simulate, to-smv) grounds the
+specifications and encodes the transition system again, also when the
+trace and the specifications do not change (e.g. a trace is simulated
+first and then model checked with different bounds).
+
+The cache stores the encoding (the transition system, the error
+property, the mapback information and, after a simulation, the encoding
+of the trace) in a directory.
+The key of an encoding is the SHA1 of the content of the trace file, of
+the content of the specification files and of the encoding options.
+
+The formulas are stored as a DAG of pysmt nodes and are rebuilt in the
+pysmt environment of the verifier when the encoding is loaded (the
+other objects, e.g. the mapback information, are pickled).
+
+"""
+
+import cPickle
+import hashlib
+import logging
+import os
+import tempfile
+from cStringIO import StringIO
+
+from pysmt.environment import Environment
+from pysmt.fnode import FNode
+from pysmt.operators import SYMBOL
+from pysmt.typing import BOOL
+from pysmt.shortcuts import get_env
+
+from cbverifier.encoding.encoder import TransitionSystem
+from cbverifier.helpers import Helper
+
+
+class CachedEncoding(object):
+    """ Encoding loaded from the cache.
+
+    Provides the methods of TSEncoder used to verify the transition
+    system and to print the counterexamples.
+    """
+    def __init__(self, ts, error_prop, mapback, trace_encoding=None,
+                 pysmt_env=None):
+        if pysmt_env is None:
+            pysmt_env = get_env()
+        self.pysmt_env = pysmt_env
+        self.helper = Helper(self.pysmt_env)
+        self.ts = ts
+        self.error_prop = error_prop
+        self.mapback = mapback
+        # encoding of the whole trace (None if not computed)
+        self.trace_encoding = trace_encoding
+
+    @staticmethod
+    def from_encoder(ts_enc, trace_encoding=None):
+        ts = ts_enc.get_ts_encoding()
+        return CachedEncoding(ts, ts_enc.error_prop, ts_enc.mapback,
+                              trace_encoding, ts_enc.pysmt_env)
+
+    def get_ts_encoding(self):
+        return self.ts
+
+    def get_trace_encoding(self, tl_cb_ids = None):
+        # only the encoding of the whole trace is stored
+        assert tl_cb_ids is None
+        assert self.trace_encoding is not None
+        return self.trace_encoding
+
+
+class _FormulaPickler(object):
+    """ Pickles an object replacing the pysmt formulas with their index
+    in a table of nodes (children come before their parents) """
+
+    def __init__(self, pysmt_env):
+        self.pysmt_env = pysmt_env
+        self.nodes = []
+        self.node_to_index = {}
+
+    def _add_formula(self, formula):
+        stack = [(formula, False)]
+        while (len(stack) > 0):
+            (node, expanded) = stack.pop()
+            if node in self.node_to_index:
+                continue
+            if not expanded:
+                stack.append((node, True))
+                for arg in node.args():
+                    if arg not in self.node_to_index:
+                        stack.append((arg, False))
+            else:
+                if node.node_type() == SYMBOL:
+                    if not node.symbol_type().is_bool_type():
+                        raise ValueError("Cannot store the non-Boolean " \
+                                         "variable %s" % node.symbol_name())
+                    payload = node.symbol_name()
+                else:
+                    payload = node._content.payload
+                args = tuple([self.node_to_index[arg] for arg in node.args()])
+                self.node_to_index[node] = len(self.nodes)
+                self.nodes.append((node.node_type(), args, payload))
+        return self.node_to_index[formula]
+
+    def _persistent_id(self, obj):
+        if isinstance(obj, FNode):
+            return "f%d" % self._add_formula(obj)
+        elif isinstance(obj, Environment):
+            if obj is not self.pysmt_env:
+                raise ValueError("Cannot store a different pysmt environment")
+            return "env"
+        return None
+
+    def dumps(self, obj):
+        stream = StringIO()
+        pickler = cPickle.Pickler(stream, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = self._persistent_id
+        pickler.dump(obj)
+        return (self.nodes, stream.getvalue())
+
+    @staticmethod
+    def loads(pysmt_env, nodes, data):
+        mgr = pysmt_env.formula_manager
+        formulas = []
+        for (node_type, args, payload) in nodes:
+            if node_type == SYMBOL:
+                formula = mgr.get_or_create_symbol(payload, BOOL)
+            else:
+                formula = mgr.create_node(node_type,
+                                          tuple([formulas[i] for i in args]),
+                                          payload)
+            formulas.append(formula)
+
+        def persistent_load(pid):
+            if pid == "env":
+                return pysmt_env
+            assert pid.startswith("f")
+            return formulas[int(pid[1:])]
+
+        unpickler = cPickle.Unpickler(StringIO(data))
+        unpickler.persistent_load = persistent_load
+        return unpickler.load()
+
+
+class EncodingCache(object):
+    # Change the version when the representation of the encoding changes
+    CACHE_VERSION = "1"
+
+    # Environment variable with the default cache directory
+    CACHE_DIR_ENV = "CBVERIFIER_ENCODING_CACHE"
+
+    SUFFIX = ".tsenc"
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    @staticmethod
+    def get_default():
+        """ Returns the cache in the directory set in the
+        CBVERIFIER_ENCODING_CACHE environment variable, None if the
+        variable is not set.
+        """
+        cache_dir = os.environ.get(EncodingCache.CACHE_DIR_ENV)
+        if cache_dir is None or cache_dir == "":
+            return None
+        return EncodingCache(cache_dir)
+
+    @staticmethod
+    def get_key(trace_file_name, spec_file_names, options):
+        """ Returns the key of the encoding of the trace and the
+        specifications with the given options (a list of values that
+        change the encoding) """
+        def update_file(sha, file_name):
+            with open(file_name, "rb") as f:
+                while True:
+                    data = f.read(1 << 20)
+                    if not data:
+                        break
+                    sha.update(data)
+
+        sha = hashlib.sha1()
+        sha.update("%s:%s\n" % (EncodingCache.CACHE_VERSION,
+                                ":".join([str(o) for o in options])))
+        update_file(sha, trace_file_name)
+        for i in range(len(spec_file_names)):
+            sha.update("\n%d\n" % i)
+            update_file(sha, spec_file_names[i])
+        return sha.hexdigest()
+
+    def _get_file_name(self, key):
+        return os.path.join(self.cache_dir, key + EncodingCache.SUFFIX)
+
+    def load(self, key, pysmt_env=None):
+        """ Returns the encoding (a CachedEncoding) stored for key,
+        None if the encoding is not in the cache.
+        """
+        if pysmt_env is None:
+            pysmt_env = get_env()
+
+        file_name = self._get_file_name(key)
+        if not os.path.isfile(file_name):
+            return None
+
+        try:
+            with open(file_name, "rb") as cache_file:
+                (nodes, data) = cPickle.load(cache_file)
+            (state_vars, input_vars, init, trans,
+             error_prop, mapback,
+             trace_encoding) = _FormulaPickler.loads(pysmt_env, nodes, data)
+        except Exception as e:
+            # stale or corrupted entry, encode the problem again
+            logging.warning("Cannot load the cached encoding %s (%s)" % (file_name,
+                                                                         str(e)))
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
+            return None
+
+        ts = TransitionSystem()
+        ts.state_vars = state_vars
+        ts.input_vars = input_vars
+        ts.init = init
+        ts.trans = trans
+        return CachedEncoding(ts, error_prop, mapback, trace_encoding,
+                              pysmt_env)
+
+    def store(self, key, encoding):
+        """ Store encoding (a CachedEncoding) in the cache """
+        ts = encoding.get_ts_encoding()
+        obj = (ts.state_vars, ts.input_vars, ts.init, ts.trans,
+               encoding.error_prop, encoding.mapback,
+               encoding.trace_encoding)
+
+        try:
+            pickled = _FormulaPickler(encoding.pysmt_env).dumps(obj)
+        except Exception as e:
+            # e.g. the BDD manager of the counters cannot be stored
+            logging.warning("Cannot store the encoding in the cache (%s)" % str(e))
+            return
+
+        # Write to a temporary file and rename it, so that concurrent
+        # runs never read a partial entry
+        (fd, tmp_name) = tempfile.mkstemp(dir=self.cache_dir,
+                                          suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as cache_file:
+                cPickle.dump(pickled, cache_file, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_name, self._get_file_name(key))
+        except Exception as e:
+            logging.warning("Cannot store the encoding in the cache (%s)" % str(e))
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
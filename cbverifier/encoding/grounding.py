@@ -14,6 +14,7 @@ TraceMap:
 
 import logging
 import collections
+import multiprocessing
 
 from cbverifier.specs.spec import Spec
 from cbverifier.specs.spec_ast import *
@@ -42,10 +43,22 @@ class GroundSpecs(object):
     concrete trace self.trace
 
     Return a list of ground specifications.
+
+    The substitutions are enumerated with the SAT solver
+    (SymbolicGrounding, the default) or joining the assignments of the
+    call nodes (JoinGrounding).
     """
 
-    def __init__(self, trace, learn_reasons = True):
+    SAT_ENGINE = "sat"
+    JOIN_ENGINE = "join"
+    ENGINES = [SAT_ENGINE, JOIN_ENGINE]
+
+    def __init__(self, trace, learn_reasons = True, engine = SAT_ENGINE):
+        if engine not in GroundSpecs.ENGINES:
+            raise Exception("Unknown grounding engine %s" % engine)
+
         self.trace = trace
+        self.engine = engine
         self.trace_map = TraceMap(self.trace)
         self.ground_to_spec = {}
 
@@ -57,15 +70,142 @@ class GroundSpecs(object):
         # self.learn_reasons = learn_reasons
         self.learn_reasons = learn_reasons
 
+        # number of specifications skipped by ground_spec_list
+        self.pruned_specs = 0
+
+    def is_relevant(self, spec):
+        """ Cheap check (on the signatures of the messages in the trace)
+        that returns False if the spec cannot have any ground
+        specification in the trace.
+
+        The spec cannot be grounded if its rhs or its regexp is
+        always FALSE after the substitution (a call node without
+        messages in the trace is substituted with FALSE).
+        """
+        memo = {}
+        return (self._may_be_sat(get_spec_rhs(spec.ast), memo) and
+                self._may_be_sat(get_regexp_node(spec.ast), memo))
+
+    def _may_be_sat(self, node, memo):
+        """ Returns False if node is always simplified to FALSE
+        by _substitute """
+        if node in memo:
+            return memo[node]
+
+        node_type = get_node_type(node)
+        if (node_type in leaf_nodes):
+            res = node_type != FALSE
+        elif (node_type == CALL_ENTRY or node_type == CALL_EXIT):
+            res = self.trace_map.has_methods(node)
+        elif (node_type == AND_OP or node_type == SEQ_OP):
+            res = (self._may_be_sat(node[1], memo) and
+                   self._may_be_sat(node[2], memo))
+        elif (node_type == OR_OP):
+            res = (self._may_be_sat(node[1], memo) or
+                   self._may_be_sat(node[2], memo))
+        elif (node_type == NOT_OP or node_type == STAR_OP):
+            # ! FALSE and FALSE[*] are not FALSE
+            res = True
+        else:
+            raise UnexpectedSymbol(node)
+
+        memo[node] = res
+        return res
+
+    def ground_spec_list(self, specs, jobs = 1):
+        """ Ground all the specifications in specs.
+
+        The specifications are grounded independently: with jobs > 1
+        the specifications are grounded in a pool of jobs processes
+        (jobs = 0 uses a process for each cpu).
+
+        The specifications that cannot be grounded in the trace (see
+        is_relevant) are skipped and counted in self.pruned_specs.
+
+        Returns the list of the ground specifications without
+        duplicates, in the order of specs (the result does not depend
+        on the number of jobs).
+        """
+        if jobs == 0:
+            jobs = multiprocessing.cpu_count()
+
+        # skip the specs that cannot be grounded in the trace
+        relevant_specs = []
+        for spec in specs:
+            if self.is_relevant(spec):
+                relevant_specs.append(spec)
+            else:
+                self.pruned_specs += 1
+        logging.debug("Pruned %d specs" % (len(specs) - len(relevant_specs)))
+        specs = relevant_specs
+
+        jobs = min(jobs, len(specs))
+
+        if jobs <= 1:
+            ground_spec_lists = [self.ground_spec(spec) for spec in specs]
+        else:
+            ground_spec_lists = self._ground_spec_parallel(specs, jobs)
+
+        # different specs may have the same ground specs
+        ground_specs = []
+        ground_spec_set = set()
+        for ground_spec_list in ground_spec_lists:
+            for ground_spec in ground_spec_list:
+                if ground_spec not in ground_spec_set:
+                    ground_spec_set.add(ground_spec)
+                    ground_specs.append(ground_spec)
+        return ground_specs
+
+    def _ground_spec_parallel(self, specs, jobs):
+        """ Ground specs in a pool of processes.
+
+        The workers are forked after setting _parallel_data, so they
+        share the trace map of self (read-only) and they only send
+        back the ASTs of the ground specifications.
+        """
+        global _parallel_data
+
+        logging.debug("Grounding %d specs with %d processes" % (len(specs),
+                                                                 jobs))
+        _parallel_data = (self, specs)
+        pool = multiprocessing.Pool(jobs)
+        try:
+            # map keeps the order of the specs
+            ast_lists = pool.map(_ground_spec_worker, range(len(specs)),
+                                 chunksize=1)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _parallel_data = None
+
+        # Rebuild the ground specs in this process
+        ground_spec_lists = []
+        for (spec, ast_list) in zip(specs, ast_lists):
+            ground_spec_list = []
+            for ground_ast in ast_list:
+                new_spec = Spec(ground_ast)
+                self.ground_to_spec[new_spec] = spec
+                ground_spec_list.append(new_spec)
+            ground_spec_lists.append(ground_spec_list)
+        return ground_spec_lists
 
     def ground_spec(self, spec):
         ast_set = set() # avoid duplicate specs - memo works at ast level
         ground_specs = []
-        sg = SymbolicGrounding(self.trace_map, self.learn_reasons)
+        if self.engine == GroundSpecs.JOIN_ENGINE:
+            sg = JoinGrounding(self.trace_map)
+        else:
+            sg = SymbolicGrounding(self.trace_map, self.learn_reasons)
 
         data = (spec, ast_set, ground_specs)
         sg.process_substitutions(spec, self, self._process_subs, data)
 
+        # the substitutions are found in an arbitrary order (e.g. the
+        # order of the models of the solver)
+        ground_specs.sort(key=lambda ground_spec: ground_spec.ast)
         return ground_specs
 
     def _process_subs(self, data, substitution):
@@ -433,6 +573,14 @@ class GroundSpecs(object):
         else:
             return self.ground_to_spec[ground_spec]
 
+# (GroundSpecs, list of specs) used by the grounding workers
+_parallel_data = None
+
+def _ground_spec_worker(spec_index):
+    """ Ground a spec in a worker of GroundSpecs._ground_spec_parallel """
+    (gs, specs) = _parallel_data
+    return [ground_spec.ast for ground_spec in gs.ground_spec(specs[spec_index])]
+
 class SymbolicGrounding:
 
     # Maximum dimension for the bitvector
@@ -806,6 +954,324 @@ class SymbolicGrounding:
 
         logging.debug("Processed %d models" % count_models)
 
+class JoinGrounding:
+    """ Computes the substitutions for the call nodes of a specification
+    joining the assignments found in the trace (instead of enumerating
+    the models of the formula built by SymbolicGrounding).
+
+    Each call node is a table: each row is an assignment to the free
+    variables of the node (its "bindings") and the set of messages of
+    the trace that agree with the bindings.
+    A call node can also be assigned to bottom, when no row is
+    compatible with the value of the free variables (the free variables
+    can always be assigned to a value that does not appear in the trace).
+
+    The tables are joined on their shared free variables, with a
+    depth-first nested loop join. The rows of a call node are looked up
+    in the trace with the values of the variables already assigned
+    (see _lookup_rows), and cached.
+
+    The class produces the same substitutions of SymbolicGrounding (the
+    same set of assignments to the call nodes).
+    """
+
+    # Nodes of the must bind formula (see
+    # SymbolicGrounding._ground_bindings_formula_rec)
+    MB_TRUE = 0
+    MB_FALSE = 1
+    MB_CALL = 2
+    MB_AND = 3
+    MB_OR = 4
+
+    def __init__(self, trace_map):
+        self.trace_map = trace_map
+
+        # list of call variables (is_entry, call_node)
+        self.call_vars = []
+        # Map from call variable to the (sorted) tuple of its free
+        # variables
+        self.call_fvars = {}
+        # Map from call variable to the number of messages with its
+        # signature (used to order the join)
+        self.call_size = {}
+        # Rows of the call variables, computed lazily:
+        # (call variable, tuple of assigned variables) -> map from
+        # values of the assigned variables to the list of rows
+        # (bindings, messages) that agree with them.
+        # bindings is a tuple of values (following self.call_fvars)
+        self.row_index = {}
+
+    def _add_call_node(self, is_entry, call_node):
+        call_var = (is_entry, call_node)
+        if call_var in self.call_fvars:
+            return call_var
+
+        fvars = self.trace_map.get_call_variables(call_node)
+        self.call_vars.append(call_var)
+        self.call_fvars[call_var] = tuple(sorted(fvars))
+        self.call_size[call_var] = self.trace_map.count_methods(call_node)
+        return call_var
+
+    def _get_rows(self, call_var, bindings):
+        """ Returns the rows of call_var that agree with bindings (a
+        map from some of the free variables to their values, or None)
+        """
+        (is_entry, call_node) = call_var
+        fvars = self.call_fvars[call_var]
+
+        # Group the messages by the same variable assigment, as in
+        # SymbolicGrounding.process_assignments_formula
+        a_map = {}
+        for aset in self.trace_map.lookup_assignments(call_node, bindings):
+            complete_assignment = True
+            message = None
+            bindings_set = set()
+            for (fvar, fval) in aset.assignments.iteritems():
+                if fval == bottom_value:
+                    complete_assignment = False
+                elif (get_node_type(fvar) == ID):
+                    bindings_set.add((fvar, fval))
+                elif (type(fvar) == tuple):
+                    assert call_var == fvar
+                    message = fval
+
+            if complete_assignment and message is not None:
+                bindings_set = frozenset(bindings_set)
+                if bindings_set not in a_map:
+                    a_map[bindings_set] = set()
+                a_map[bindings_set].add(message)
+
+        rows = []
+        for (bindings_set, messages) in a_map.iteritems():
+            row_bindings = dict(bindings_set)
+            # all the complete assignments bind all the free variables
+            assert len(row_bindings) == len(fvars)
+            rows.append((tuple([row_bindings[v] for v in fvars]),
+                         frozenset(messages)))
+        return rows
+
+    def _get_must_bind(self, spec_node, memo, must_bind):
+        """ Collect the call nodes in spec_node and returns the formula
+        that encodes which call nodes cannot be assigned to bottom.
+        """
+        if ((spec_node,must_bind) in memo):
+            return memo[spec_node,must_bind]
+
+        node_type = get_node_type(spec_node)
+        if (node_type in leaf_nodes):
+            res = (JoinGrounding.MB_TRUE,)
+        elif (node_type == AND_OP or
+              node_type == SEQ_OP or
+              node_type == ENABLE_OP or
+              node_type == DISABLE_OP or
+              node_type == OR_OP):
+            r_mbc = self._get_must_bind(spec_node[2], memo, must_bind)
+            l_mbc = self._get_must_bind(spec_node[1], memo, must_bind)
+            op = JoinGrounding.MB_OR if node_type == OR_OP else JoinGrounding.MB_AND
+            res = JoinGrounding._mb_simplify((op, l_mbc, r_mbc))
+        elif (node_type == STAR_OP or node_type == SPEC_SYMB or
+              node_type == NOT_OP):
+            must_bind = must_bind and node_type == SPEC_SYMB
+            res = self._get_must_bind(spec_node[1], memo, must_bind)
+        elif (node_type == CALL_ENTRY or node_type == CALL_EXIT):
+            call_var = self._add_call_node(node_type == CALL_ENTRY, spec_node)
+            if must_bind:
+                res = (JoinGrounding.MB_CALL, call_var)
+            else:
+                res = (JoinGrounding.MB_TRUE,)
+        else:
+            # WARNING: we handle one spec at a time (node_type != SPEC_LIST)
+            raise UnexpectedSymbol(spec_node)
+
+        memo[spec_node,must_bind] = res
+        return res
+
+    @staticmethod
+    def _mb_simplify(mbc):
+        (op, l_mbc, r_mbc) = mbc
+        if op == JoinGrounding.MB_AND:
+            (absorbing, neutral) = (JoinGrounding.MB_FALSE, JoinGrounding.MB_TRUE)
+        else:
+            (absorbing, neutral) = (JoinGrounding.MB_TRUE, JoinGrounding.MB_FALSE)
+
+        if l_mbc[0] == absorbing or r_mbc[0] == absorbing:
+            return (absorbing,)
+        elif l_mbc[0] == neutral:
+            return r_mbc
+        elif r_mbc[0] == neutral:
+            return l_mbc
+        return mbc
+
+    @staticmethod
+    def _mb_eval(mbc, assigned):
+        """ Three-valued evaluation of the must bind formula.
+
+        assigned maps the call variables to True (the call node is
+        bound to some messages) or False (the call node is bottom).
+        Returns None if the value is not known yet.
+        """
+        op = mbc[0]
+        if op == JoinGrounding.MB_TRUE:
+            return True
+        elif op == JoinGrounding.MB_FALSE:
+            return False
+        elif op == JoinGrounding.MB_CALL:
+            return assigned.get(mbc[1])
+        else:
+            l_val = JoinGrounding._mb_eval(mbc[1], assigned)
+            r_val = JoinGrounding._mb_eval(mbc[2], assigned)
+            if op == JoinGrounding.MB_AND:
+                if l_val == False or r_val == False: return False
+                if l_val is None or r_val is None: return None
+                return True
+            else:
+                if l_val == True or r_val == True: return True
+                if l_val is None or r_val is None: return None
+                return False
+
+    def _get_join_order(self):
+        """ Greedy join order: first the call nodes that share more
+        variables with the nodes already joined, then the ones with
+        less messages """
+        to_visit = list(self.call_vars)
+        order = []
+        joined_vars = set()
+        while len(to_visit) > 0:
+            best = None
+            best_key = None
+            for call_var in to_visit:
+                fvars = self.call_fvars[call_var]
+                shared = len([v for v in fvars if v in joined_vars])
+                key = (-shared, self.call_size[call_var])
+                if best is None or key < best_key:
+                    best = call_var
+                    best_key = key
+            to_visit.remove(best)
+            order.append(best)
+            joined_vars.update(self.call_fvars[best])
+        return order
+
+    def _lookup_rows(self, call_var, values):
+        """ Returns the rows of call_var compatible with values.
+
+        The rows are looked up in the trace with the values of the
+        variables already assigned, so that only the messages that
+        agree with them are visited (see TraceMap.lookup_assignments).
+        """
+        fvars = self.call_fvars[call_var]
+        bound = tuple([v for v in fvars if v in values])
+        key = tuple([values[v] for v in bound])
+
+        index_key = (call_var, bound)
+        try:
+            index = self.row_index[index_key]
+        except KeyError:
+            index = {}
+            self.row_index[index_key] = index
+
+        try:
+            return index[key]
+        except KeyError:
+            pass
+
+        if len(bound) == 0:
+            bindings = None
+        else:
+            bindings = dict(zip(bound, key))
+        rows = self._get_rows(call_var, bindings)
+        index[key] = rows
+        return rows
+
+    def _is_bottom_feasible(self, call_var, values):
+        """ True if no row of call_var can be matched (now or
+        extending values).
+
+        Since all the rows bind the same variables, a row can be
+        matched only when all the variables are assigned (the variables
+        that are not assigned at the end of the join are set to a value
+        not appearing in the trace).
+        """
+        fvars = self.call_fvars[call_var]
+        for v in fvars:
+            if v not in values:
+                return True
+        return len(self._lookup_rows(call_var, values)) == 0
+
+    def process_substitutions(self, spec, parent, _process_subs, data):
+        """ Generates all the possible substitutions
+        for the CALL nodes.
+
+        Same interface of SymbolicGrounding.process_substitutions
+        """
+        mbc = self._get_must_bind(spec.ast, {}, True)
+        if mbc[0] == JoinGrounding.MB_FALSE:
+            logging.debug("Processed 0 substitutions")
+            return
+
+        order = self._get_join_order()
+        bottom_set = frozenset([bottom_value])
+
+        count_subs = [0]
+        # values of the free variables
+        values = {}
+        # True/False if the call var is bound/bottom
+        assigned = {}
+        # call variables assigned to bottom
+        bottom_vars = []
+        substitution = {}
+
+        def join_rec(index):
+            if index == len(order):
+                count_subs[0] += 1
+                _process_subs(data, dict(substitution))
+                return
+
+            call_var = order[index]
+            fvars = self.call_fvars[call_var]
+
+            # bind the call node to a row
+            for (row_values, messages) in self._lookup_rows(call_var, values):
+                new_vars = []
+                for (v, val) in zip(fvars, row_values):
+                    if v not in values:
+                        values[v] = val
+                        new_vars.append(v)
+
+                # the new values must not match the rows of the
+                # nodes assigned to bottom
+                feasible = True
+                if len(new_vars) > 0:
+                    for b_var in bottom_vars:
+                        if not self._is_bottom_feasible(b_var, values):
+                            feasible = False
+                            break
+
+                if feasible:
+                    assigned[call_var] = True
+                    if JoinGrounding._mb_eval(mbc, assigned) != False:
+                        substitution[call_var] = messages
+                        join_rec(index + 1)
+                    del assigned[call_var]
+
+                for v in new_vars:
+                    del values[v]
+
+            # assign the call node to bottom
+            if self._is_bottom_feasible(call_var, values):
+                assigned[call_var] = False
+                if JoinGrounding._mb_eval(mbc, assigned) != False:
+                    substitution[call_var] = bottom_set
+                    bottom_vars.append(call_var)
+                    join_rec(index + 1)
+                    bottom_vars.pop()
+                del assigned[call_var]
+
+            if call_var in substitution:
+                del substitution[call_var]
+
+        join_rec(0)
+        logging.debug("Processed %d substitutions" % count_subs[0])
+
 class AssignmentsBottom(object):
     """ Object used to represent the bottom value inside Assignemnts """
 
@@ -1014,6 +1480,11 @@ class TraceMap(object):
       - the type of the method (entry/exit)
       - if the method returns a value
 
+    The messages of each method are further indexed (lazily) by the
+    values of their parameters, so that the lookups of call nodes with
+    constants (or with variables bound to a value) only visit the
+    messages with those values.
+
     The class implements two lookup functions.
 
     1. lookup_methods: given the type, name, arity, and
@@ -1030,9 +1501,15 @@ class TraceMap(object):
     ENTRY_TYPE = "ENTRY"
     EXIT_TYPE = "EXIT"
 
+    # position of the return value in the value indexes
+    RETVAL_POSITION = -1
+
     def __init__(self, trace):
         # 3-level index with method name and arity of paramters
         self.trace_map = {}
+        # secondary indexes on the values of the parameters
+        # (see _get_value_index)
+        self.value_index = {}
         for child in trace.children:
             self.trace_map = self._fill_map(child, self.trace_map)
 
@@ -1231,18 +1708,12 @@ class TraceMap(object):
         else:
             return False
 
-    def lookup_assignments(self, call_node):
-        """ Given a node that represent a call in a specification,
-        returns the set of all the assignments from free variables
-        in the call node to concrete values found in the trace.
-
-        The method returns an AssignmentsSet object.
+    def _get_formals(self, call_node):
+        """ Returns the type of the call node (True for entry), its
+        return value (None for entry nodes) and the list of its formal
+        parameters (including the receiver)
         """
         node_type = get_node_type(call_node)
-        assert (node_type == CALL_ENTRY or
-                node_type == CALL_EXIT)
-
-        set_assignments = AssignmentsSet()
 
         # Build the list of formal parameters
         if (node_type == CALL_EXIT):
@@ -1253,9 +1724,6 @@ class TraceMap(object):
             is_entry = True
             retval = None
 
-        call_type = get_call_type(call_node)
-        method_name_node = get_call_method(call_node)
-        method_signature = get_id_val(get_call_signature(call_node))
         receiver = get_call_receiver(call_node)
         params = get_call_params(call_node)
         param_list = []
@@ -1273,19 +1741,187 @@ class TraceMap(object):
         while (get_node_type(params) == PARAM_LIST):
             param_list.append(get_param_name(params))
             params = get_param_tail(params)
+
+        return (is_entry, retval, param_list)
+
+    def _get_signature(self, call_node, is_entry, retval, param_list):
+        """ Returns the signature of the call node, the tuple of the
+        arguments of lookup_methods """
+        call_type = get_call_type(call_node)
+        method_signature = get_id_val(get_call_signature(call_node))
         arity = len(param_list)
 
-        matching_methods = self.lookup_methods(is_entry,
-                                               call_type,
-                                               method_signature,
-                                               arity,
-                                               (retval is not None) and (retval != new_nil()))
+        return (is_entry,
+                call_type,
+                method_signature,
+                arity,
+                (retval is not None) and (retval != new_nil()))
+
+    def _lookup_call_methods(self, signature):
+        (is_entry, call_type, method_signature, arity, has_retval) = signature
+        return self.lookup_methods(is_entry, call_type, method_signature,
+                                   arity, has_retval)
+
+    def _get_value_index(self, signature, method_list, position, by_value):
+        """ Returns the index of the messages in method_list (the
+        messages with signature) by the value of the parameter in
+        position (TraceMap.RETVAL_POSITION for the return value).
+
+        The index maps the CValue of the parameter (by_value = True) or
+        its conversion to a spec node (by_value = False, used to match
+        the constants) to the list of messages, in the order of
+        method_list.
+        The index is a pair (map, list of messages that cannot be
+        indexed).
+
+        The index is built the first time it is used.
+        """
+        index_key = (signature, position, by_value)
+        try:
+            return self.value_index[index_key]
+        except KeyError:
+            pass
+
+        value_map = {}
+        not_indexed = []
+        for method in method_list:
+            if position == TraceMap.RETVAL_POSITION:
+                actual = method.return_value
+            else:
+                actual = method.params[position]
+
+            if by_value:
+                key = actual
+            else:
+                try:
+                    key = TraceSpecConverter.traceval2specnode(actual)
+                except Exception:
+                    # _get_formal_assignment will report the error
+                    not_indexed.append(method)
+                    continue
+
+            self._get_inner_elem(value_map, key, []).append(method)
+
+        self.value_index[index_key] = (value_map, not_indexed)
+        return self.value_index[index_key]
+
+    def _lookup_by_values(self, signature, method_list, formals, bindings):
+        """ Restrict method_list (the messages with signature) to the
+        messages that may match the constants in formals and the
+        values of the variables in bindings.
+
+        formals is a list of (position, formal parameter).
+        The result is a sublist of method_list (in the same order):
+        the caller still has to check the values of the parameters.
+        """
+        candidates = method_list
+        for (position, formal) in formals:
+            if len(candidates) == 0:
+                break
+
+            formal_type = get_node_type(formal)
+            if formal_type in const_nodes:
+                (value_map, not_indexed) = self._get_value_index(signature,
+                                                                 method_list,
+                                                                 position,
+                                                                 False)
+                key = formal
+            elif (formal_type == ID and bindings is not None and
+                  formal in bindings):
+                (value_map, not_indexed) = self._get_value_index(signature,
+                                                                 method_list,
+                                                                 position,
+                                                                 True)
+                key = bindings[formal]
+            else:
+                continue
+
+            matching = value_map.get(key, [])
+            if len(not_indexed) > 0:
+                to_keep = set([id(m) for m in matching + not_indexed])
+                matching = [m for m in method_list if id(m) in to_keep]
+            if len(matching) < len(candidates):
+                candidates = matching
+        return candidates
+
+    def has_methods(self, call_node):
+        """ Returns True if the trace contains a message with the
+        signature of call_node (name, arity, entry/exit and return value).
+
+        The check does not look at the values of the parameters: if it
+        returns False, call_node cannot be matched by any message.
+        """
+        return self.count_methods(call_node) > 0
+
+    def count_methods(self, call_node):
+        """ Returns the number of messages in the trace with the
+        signature of call_node (see has_methods) """
+        (is_entry, retval, param_list) = self._get_formals(call_node)
+        signature = self._get_signature(call_node, is_entry, retval,
+                                        param_list)
+        return len(self._lookup_call_methods(signature))
+
+    def get_call_variables(self, call_node):
+        """ Returns the set of the free variables of call_node (its
+        parameters, receiver and return value) """
+        (is_entry, retval, param_list) = self._get_formals(call_node)
+        formals = list(param_list)
+        if (not is_entry) and retval != new_nil():
+            formals.append(retval)
+        return set([f for f in formals if get_node_type(f) == ID])
+
+    def lookup_assignments(self, call_node, bindings = None):
+        """ Given a node that represent a call in a specification,
+        returns the set of all the assignments from free variables
+        in the call node to concrete values found in the trace.
+
+        bindings optionally maps some free variables of call_node to
+        their value (a CValue): only the messages that agree with
+        bindings are considered.
+
+        The method returns an AssignmentsSet object.
+        """
+        node_type = get_node_type(call_node)
+        assert (node_type == CALL_ENTRY or
+                node_type == CALL_EXIT)
+
+        set_assignments = AssignmentsSet()
+
+        (is_entry, retval, param_list) = self._get_formals(call_node)
+        signature = self._get_signature(call_node, is_entry, retval,
+                                        param_list)
+        matching_methods = self._lookup_call_methods(signature)
+
+        # Use the indexes on the values of the parameters to
+        # consider only the messages that can match the constants
+        # and the bound variables of the call node
+        formals = list(enumerate(param_list))
+        if (not is_entry) and retval != new_nil():
+            formals.append((TraceMap.RETVAL_POSITION, retval))
+        matching_methods = self._lookup_by_values(signature,
+                                                  matching_methods, formals,
+                                                  bindings)
+
         # For each method, find:
         #   - the assignments to the variables in params
         #   - the assignment to the return value
         no_assignments = True
         for method in matching_methods:
             match = True
+
+            if bindings is not None:
+                for (position, formal) in formals:
+                    if formal in bindings:
+                        if position == TraceMap.RETVAL_POSITION:
+                            actual = method.return_value
+                        else:
+                            actual = method.params[position]
+                        # CValue does not define __ne__
+                        if not (actual == bindings[formal]):
+                            match = False
+                            break
+                if not match:
+                    continue
             method_assignments = Assignments()
 
             # Replace the call node with the
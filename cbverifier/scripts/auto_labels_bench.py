@@ -0,0 +1,162 @@
+# Compare the time and the peak memory used to convert the regular
+# expressions of the ground specifications into automata with the
+# different representations of the automata labels (SAT formulas, BDDs
+# and explicit sets of letters).
+#
+# The benchmark grounds the specifications on a trace (by default, the
+# lifestate specifications in android_specs on the trace of the iss86
+# regression test) and converts each regular expression with each kind
+# of labels (the BDD labels are skipped if the BDD package is not
+# installed).
+# Each kind of labels runs in its own process, and the memory is the
+# increase of the peak resident set size of the process.
+#
+# Usage:
+#   python auto_labels_bench.py [--trace T] [--json] [--repeat R]
+#                               [--labels L] [spec_file ...]
+
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+
+import cbverifier.android_specs
+import cbverifier.test.regression.iss86
+from cbverifier.traces.ctrace import CTraceSerializer
+from cbverifier.specs.spec import Spec
+from cbverifier.specs.spec_ast import get_regexp_node
+from cbverifier.encoding.encoder import TSEncoder, TSMapback, RegExpToAuto
+from cbverifier.encoding.automata import AutoEnv
+from cbverifier.encoding.counter_enc import CounterEnc
+
+
+# The lifestate specifications (see benchtools_setup/scripts/gen_config.py)
+LIFESTATE_SPECS = [
+    "subexpr/android.app.Activity/activity_callbacks.spec",
+    "subexpr/android.app.Fragment/fragment_callbacks.spec",
+    "subexpr/android.app.Activity/activity_aux.spec",
+    "enabledisable/android.app.Fragment/DialogFragment_lifecycle.spec",
+    "enabledisable/android.view.View/view_REGEX.spec",
+    "enabledisable/android.os.CountdownTimer/countdowntimer.spec",
+    "enabledisable/android.app.Fragment/Fragment.spec",
+    "enabledisable/android.view.View/onClick_listener_setenabled.spec",
+    "enabledisable/android.os.AsyncTask/AsyncTask.spec",
+    "enabledisable/android.app.Activity/activity_lifestate.spec",
+    "subexpr/android.app.AlertDialog/dialog.spec",
+    "enabledisable/android.app.AlertDialog/DialogInterfaces_OnClickListener.spec",
+    "subexpr/android.widget.PopupMenu/popupmenu.spec",
+    "enabledisable/android.widget.PopupMenu/PopupMenu.spec",
+    "subexpr/android.widget.Toolbar/toolbar.spec",
+    "enabledisable/android.widget.Toolbar/onMenuItemClick.spec",
+    "allowdisallow/android.app.AlertDialog/dismiss.spec",
+    "allowdisallow/android.app.AlertDialog/show.spec",
+]
+
+
+def get_lifestate_specs():
+    specs_path = os.path.dirname(cbverifier.android_specs.__file__)
+    return [os.path.join(specs_path, name) for name in LIFESTATE_SPECS]
+
+
+def time_labels(encoder, regexps, labels, repeat):
+    """ Returns the best time to convert all the regexps, the total
+    number of states of the automata and the increase of the peak
+    memory (in KB) """
+    best = None
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for i in range(repeat):
+        auto_env = AutoEnv(encoder.pysmt_env, labels=labels)
+        r2a = RegExpToAuto(CounterEnc(encoder.pysmt_env),
+                           encoder.r2a.alphabet,
+                           TSMapback(encoder.pysmt_env, None, None),
+                           auto_env)
+        start = time.time()
+        states = 0
+        for regexp in regexps:
+            auto = r2a.get_from_regexp(regexp)
+            states += len(auto.states)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (best, states, peak_rss - start_rss)
+
+
+def run_labels(encoder, regexps, labels, repeat):
+    """ Run time_labels in a new process, so that the peak memory of
+    each kind of labels is measured separately """
+    def child(queue):
+        try:
+            queue.put(time_labels(encoder, regexps, labels, repeat))
+        except Exception as e:
+            queue.put(e)
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=child, args=(queue,))
+    process.start()
+    res = queue.get()
+    process.join()
+    if isinstance(res, Exception):
+        raise res
+    return res
+
+
+def get_default_trace():
+    return os.path.join(os.path.dirname(cbverifier.test.regression.iss86.__file__),
+                        "nocrashsequence.out")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the labels of the automata')
+    parser.add_argument('--trace', default=get_default_trace(),
+                        help="Trace used to ground the specifications")
+    parser.add_argument('--json', action='store_true',
+                        help="The trace file is in json format")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Repetitions (the best time is reported)")
+    parser.add_argument('--labels', action='append', choices=AutoEnv.LABELS,
+                        help="Labels to compare (default: all)")
+    parser.add_argument('specs', nargs='*',
+                        help="Specification files (default: the lifestate specs)")
+    args = parser.parse_args()
+
+    spec_files = args.specs if len(args.specs) > 0 else get_lifestate_specs()
+    specs = Spec.get_specs_from_files(spec_files)
+    trace = CTraceSerializer.read_trace_file_name(args.trace, args.json)
+    encoder = TSEncoder(trace, specs)
+
+    regexps = []
+    visited = set()
+    for ground_spec in encoder.ground_specs:
+        regexp = get_regexp_node(ground_spec.ast)
+        if regexp not in visited:
+            visited.add(regexp)
+            regexps.append(regexp)
+
+    print "Specifications: %d, ground specifications: %d, " \
+        "regular expressions: %d, letters: %d" % (len(specs),
+                                                  len(encoder.ground_specs),
+                                                  len(regexps),
+                                                  len(encoder.r2a.alphabet))
+
+    all_labels = args.labels if args.labels else AutoEnv.LABELS
+    print "%-10s %12s %8s %8s %12s" % ("labels", "time(s)", "states",
+                                       "speedup", "peak(KB)")
+    first_time = None
+    for labels in all_labels:
+        try:
+            (elapsed, states, peak) = run_labels(encoder, regexps, labels,
+                                                 args.repeat)
+        except Exception as e:
+            print "%-10s skipped (%s)" % (labels, str(e).strip())
+            continue
+        if first_time is None:
+            first_time = elapsed
+        speedup = first_time / elapsed if elapsed > 0 else 0.0
+        print "%-10s %12.4f %8d %8.2f %12d" % (labels, elapsed, states,
+                                               speedup, peak)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# Compare the streaming json trace reader with the previous reader, that
+# loaded the whole file and converted each message with json.dumps and
+# json_format.Parse.
+#
+# The benchmark reads the json traces in cbverifier/test/examples and a
+# synthetic trace with --callbacks top-level callbacks (the synthetic
+# trace is also read with half and a quarter of the callbacks, to show
+# how the reading time grows with the size of the file).
+#
+# Usage:
+#   python json_reader_bench.py [--callbacks N] [--repeat R]
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from google.protobuf.json_format import Parse
+
+import cbverifier.test.examples
+import cbverifier.traces.tracemsg_pb2 as tracemsg_pb2
+from cbverifier.traces.ctrace import CTraceJsonReader
+
+
+class PreviousJsonReader(object):
+    """ The previous reader: json.load and json.dumps/Parse """
+    def __init__(self, trace_file):
+        self.data = json.load(trace_file)
+        self.position = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if (self.position >= len(self.data)):
+            raise StopIteration()
+        trace_msg_container = tracemsg_pb2.TraceMsgContainer()
+        json_str = json.dumps(self.data[self.position])
+        trace_msg_container = Parse(json_str, trace_msg_container)
+        self.position = self.position + 1
+        return trace_msg_container
+
+
+def get_value(object_id):
+    return {"isNull" : False,
+            "type" : "android.app.Activity",
+            "fmwkType" : "android.app.Activity",
+            "objectId" : str(object_id)}
+
+def write_synthetic_trace(file_name, callbacks):
+    """ Write a trace with callbacks top-level callbacks, each one
+    calling two callins """
+    message_id = 0
+    with open(file_name, "w") as f:
+        f.write("[\n")
+        for i in range(callbacks):
+            msgs = []
+            msgs.append({"type" : "CALLBACK_ENTRY",
+                         "callbackEntry" : {
+                             "class_name" : "android.app.Activity",
+                             "methodName" : "void onResume()",
+                             "paramList" : [get_value(i % 10)],
+                             "frameworkOverrides" : [{"class_name" : "android.app.Activity",
+                                                      "method" : "void onResume()",
+                                                      "is_interface" : False}]}})
+            for j in range(2):
+                msgs.append({"type" : "CALLIN_ENTRY",
+                             "callinEntry" : {
+                                 "class_name" : "android.app.Activity",
+                                 "methodName" : "void finish()",
+                                 "paramList" : [get_value(i % 10)]}})
+                msgs.append({"type" : "CALLIN_EXIT",
+                             "callinExit" : {
+                                 "class_name" : "android.app.Activity",
+                                 "methodName" : "void finish()"}})
+            msgs.append({"type" : "CALLBACK_EXIT",
+                         "callbackExit" : {
+                             "class_name" : "android.app.Activity",
+                             "methodName" : "void onResume()"}})
+
+            for msg in msgs:
+                msg["threadId"] = "1"
+                msg["isActivityThread"] = True
+                msg["messageId"] = str(message_id)
+                message_id += 1
+                if message_id > 1:
+                    f.write(",\n")
+                json.dump({"msg" : msg}, f, indent=2)
+        f.write("]\n")
+
+
+def time_reader(reader_class, file_name, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        with open(file_name, "r") as f:
+            count = 0
+            for msg in reader_class(f):
+                count += 1
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return (count, best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the json trace reader')
+    parser.add_argument('--callbacks', type=int, default=20000,
+                        help="Callbacks in the synthetic trace")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Repetitions (the best time is reported)")
+    args = parser.parse_args()
+
+    test_path = os.path.dirname(cbverifier.test.examples.__file__)
+    traces = [os.path.join(test_path, name)
+              for name in sorted(os.listdir(test_path))
+              if name.startswith("trace") and name.endswith(".json")]
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for callbacks in [args.callbacks / 4, args.callbacks / 2, args.callbacks]:
+            file_name = os.path.join(tmp_dir, "synthetic_%d.json" % callbacks)
+            write_synthetic_trace(file_name, callbacks)
+            traces.append(file_name)
+
+        print "%-30s %10s %8s %12s %12s %8s" % ("trace", "bytes", "msgs",
+                                                "previous(s)", "stream(s)",
+                                                "speedup")
+        for file_name in traces:
+            (count, prev_time) = time_reader(PreviousJsonReader, file_name,
+                                             args.repeat)
+            (count, new_time) = time_reader(CTraceJsonReader, file_name,
+                                            args.repeat)
+            speedup = prev_time / new_time if new_time > 0 else 0.0
+            print "%-30s %10d %8d %12.4f %12.4f %8.2f" % (os.path.basename(file_name),
+                                                          os.path.getsize(file_name),
+                                                          count,
+                                                          prev_time,
+                                                          new_time,
+                                                          speedup)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
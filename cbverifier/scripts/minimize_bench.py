@@ -0,0 +1,95 @@
+# Compare the minimization of the automata of the ground specifications
+# with Brzozowski's algorithm (Automaton.minimize) and with the Moore's
+# partition refinement (Automaton.minimize_dfa).
+#
+# The specifications and the trace are the ones of auto_labels_bench.py
+# (by default, the lifestate specifications on the trace of the iss86
+# regression test).
+# For each regular expression the benchmark minimizes:
+#   - the automaton of the regular expression (nfa), with Brzozowski's
+#     algorithm and with the subset construction followed by Moore's
+#     algorithm;
+#   - the deterministic automaton (dfa), with both algorithms.
+#
+# Usage:
+#   python minimize_bench.py [--trace T] [--json] [--labels L] [spec_file ...]
+
+import argparse
+import time
+
+from auto_labels_bench import get_lifestate_specs, get_default_trace
+
+from cbverifier.traces.ctrace import CTraceSerializer
+from cbverifier.specs.spec import Spec
+from cbverifier.specs.spec_ast import get_regexp_node
+from cbverifier.encoding.encoder import TSEncoder
+from cbverifier.encoding.automata import AutoEnv
+
+
+def timed(function):
+    start = time.time()
+    res = function()
+    return (res, time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the minimization of the automata')
+    parser.add_argument('--trace', default=get_default_trace(),
+                        help="Trace used to ground the specifications")
+    parser.add_argument('--json', action='store_true',
+                        help="The trace file is in json format")
+    parser.add_argument('--labels', choices=AutoEnv.LABELS,
+                        default=AutoEnv.SAT_LABELS,
+                        help="Labels of the automata (default sat)")
+    parser.add_argument('specs', nargs='*',
+                        help="Specification files (default: the lifestate specs)")
+    args = parser.parse_args()
+
+    spec_files = args.specs if len(args.specs) > 0 else get_lifestate_specs()
+    specs = Spec.get_specs_from_files(spec_files)
+    trace = CTraceSerializer.read_trace_file_name(args.trace, args.json)
+    encoder = TSEncoder(trace, specs, labels=args.labels)
+
+    regexps = []
+    visited = set()
+    for ground_spec in encoder.ground_specs:
+        regexp = get_regexp_node(ground_spec.ast)
+        if regexp not in visited:
+            visited.add(regexp)
+            regexps.append(regexp)
+
+    print "%-6s %6s | %10s %10s %6s %6s | %10s %10s" % ("regexp", "states",
+                                                       "nfa-brz(s)", "nfa-moore(s)",
+                                                       "brz", "moore",
+                                                       "dfa-brz(s)", "dfa-moore(s)")
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for i in range(len(regexps)):
+        nfa = encoder.r2a.get_from_regexp_aux(regexps[i])
+
+        (brz, nfa_brz_time) = timed(lambda : nfa.minimize())
+        (moore, nfa_moore_time) = timed(lambda : nfa.determinize().minimize_dfa())
+        assert brz.is_equivalent(moore)
+
+        dfa = nfa.determinize()
+        (dfa_brz, dfa_brz_time) = timed(lambda : dfa.minimize())
+        (dfa_moore, dfa_moore_time) = timed(lambda : dfa.minimize_dfa())
+
+        times = [nfa_brz_time, nfa_moore_time, dfa_brz_time, dfa_moore_time]
+        totals = [t + s for (t, s) in zip(totals, times)]
+        print "%-6d %6d | %10.4f %10.4f %6d %6d | %10.4f %10.4f" % (i,
+                                                                   nfa.count_state(),
+                                                                   nfa_brz_time,
+                                                                   nfa_moore_time,
+                                                                   brz.count_state(),
+                                                                   moore.count_state(),
+                                                                   dfa_brz_time,
+                                                                   dfa_moore_time)
+
+    print "%-6s %6s | %10.4f %10.4f %6s %6s | %10.4f %10.4f" % ("total", "",
+                                                               totals[0], totals[1],
+                                                               "", "",
+                                                               totals[2], totals[3])
+
+
+if __name__ == '__main__':
+    main()
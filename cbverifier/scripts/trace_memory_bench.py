@@ -0,0 +1,132 @@
+# Compare the memory used by the compact trace representation (slots,
+# shared values and strings) against the previous representation, where
+# each message and value had a __dict__ and its own copy of the strings.
+#
+# Usage:
+#   python trace_memory_bench.py [--json] [trace_file ...]
+#
+# Without trace files, the script uses the traces in cbverifier/test/examples.
+
+import argparse
+import os
+import sys
+
+import cbverifier.test.examples
+from cbverifier.traces.ctrace import CTraceSerializer, CCallback
+
+
+class DictValue(object):
+    """ Value with a __dict__ (previous representation) """
+    def __init__(self, v):
+        self.is_null = v.is_null
+        self.type = copy_str(v.type)
+        self.fmwk_type = copy_str(v.fmwk_type)
+        self.object_id = copy_str(v.object_id)
+        self.value = copy_str(v.value)
+        self._hash = None
+
+class DictMessage(object):
+    """ Message with a __dict__ (previous representation) """
+    def __init__(self, msg):
+        self.message_id = msg.message_id
+        self.thread_id = msg.thread_id
+        self.class_name = copy_str(msg.class_name)
+        self.method_name = copy_str(msg.method_name)
+        self.params = [DictValue(p) for p in msg.params]
+        self.return_value = (None if msg.return_value is None
+                             else DictValue(msg.return_value))
+        self.exception = msg.exception
+        self.children = [DictMessage(c) for c in msg.children]
+        if isinstance(msg, CCallback):
+            self.fmwk_overrides = list(msg.fmwk_overrides)
+
+
+def copy_str(s):
+    """ A new string object equal to s (the protobuf decoder created a
+    new string for each field of each message) """
+    if s is None or not isinstance(s, basestring):
+        return s
+    return (s + " ")[:-1]
+
+
+def deep_size(root):
+    """ Size in bytes of all the objects reachable from root, counting
+    each shared object once """
+    seen = set()
+    size = 0
+    stack = [root]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif not isinstance(obj, basestring):
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for slot in cls.__dict__.get("__slots__", ()):
+                    if hasattr(obj, slot):
+                        stack.append(getattr(obj, slot))
+    return size
+
+
+def get_example_traces():
+    test_path = os.path.dirname(cbverifier.test.examples.__file__)
+    traces = []
+    for name in sorted(os.listdir(test_path)):
+        if name.startswith("trace"):
+            traces.append((os.path.join(test_path, name),
+                           name.endswith(".json")))
+    return traces
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory used by the trace representation')
+    parser.add_argument('--json', action='store_true',
+                        help="The trace files are in json format")
+    parser.add_argument('traces', nargs='*', help="Trace files")
+    args = parser.parse_args()
+
+    if len(args.traces) == 0:
+        traces = get_example_traces()
+    else:
+        traces = [(t, args.json) for t in args.traces]
+
+    total_compact = 0
+    total_dict = 0
+    print "%-40s %8s %12s %12s %6s" % ("trace", "msgs", "previous", "compact", "ratio")
+    for (trace_file, is_json) in traces:
+        try:
+            trace = CTraceSerializer.read_trace_file_name(trace_file, is_json)
+        except Exception as e:
+            print "%-40s skipped (%s)" % (os.path.basename(trace_file),
+                                          str(e).strip())
+            continue
+
+        compact_size = deep_size(trace.children)
+        dict_size = deep_size([DictMessage(cb) for cb in trace.children])
+        total_compact += compact_size
+        total_dict += dict_size
+
+        ratio = float(compact_size) / dict_size if dict_size > 0 else 1.0
+        print "%-40s %8d %12d %12d %6.2f" % (os.path.basename(trace_file),
+                                              trace.get_total_msg(),
+                                              dict_size,
+                                              compact_size,
+                                              ratio)
+
+    if total_dict > 0:
+        print "%-40s %8s %12d %12d %6.2f" % ("total", "",
+                                              total_dict, total_compact,
+                                              float(total_compact) / total_dict)
+
+
+if __name__ == '__main__':
+    main()
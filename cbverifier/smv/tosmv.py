@@ -73,7 +73,14 @@ class NuXmvDriver:
         # Known limitation of Popen
 
         proc = Popen(args, cwd=cwd, stdout=PIPE,  stderr=PIPE)
-        (stdout, stderr) = proc.communicate()
+        try:
+            (stdout, stderr) = proc.communicate()
+        except:
+            # e.g. the caller is interrupted, do not leave the process
+            # running
+            proc.kill()
+            proc.wait()
+            raise
 
         return_code = proc.returncode
         if (return_code != 0):
@@ -99,18 +106,25 @@ class NuXmvDriver:
             DELETE_FILES = True
 
         smv_file = self.get_tmp_file("smv", DELETE_FILES)
-        self.ts2smv.to_smv(smv_file)
-        smv_file.flush()
-
-        # 2. Writes the CMD file
-        cmd_file = self.get_tmp_file("cmd", DELETE_FILES)
-        # writes the cmd file
-        cmd_file.write(cmds)
-        cmd_file.flush()
-
-        # call nuXmv
-        args = [self.nuxmv, "-source", cmd_file.name, smv_file.name]
-        res = NuXmvDriver._call_sub(args, result_cb)
+        cmd_file = None
+        try:
+            self.ts2smv.to_smv(smv_file)
+            smv_file.flush()
+
+            # 2. Writes the CMD file
+            cmd_file = self.get_tmp_file("cmd", DELETE_FILES)
+            # writes the cmd file
+            cmd_file.write(cmds)
+            cmd_file.flush()
+
+            # call nuXmv
+            args = [self.nuxmv, "-source", cmd_file.name, smv_file.name]
+            res = NuXmvDriver._call_sub(args, result_cb)
+        finally:
+            # removes the temporary files
+            smv_file.close()
+            if cmd_file is not None:
+                cmd_file.close()
 
         return res
 
@@ -123,7 +123,7 @@ class Spec:
 
     @staticmethod
     def get_specs_from_file(spec_file):
-        return get_specs_from_files([spec_file])
+        return Spec.get_specs_from_files([spec_file])
 
     @staticmethod
     def get_specs_from_files(files_list):
@@ -56,9 +56,37 @@ class TestAuto(unittest.TestCase):
                            BddLabel(Not(And(symbols[0], symbols[1])), bdd_env),
                            BddLabel(And(Not(symbols[0]), symbols[1]), bdd_env)])
 
+        explicit_env = AutoEnv(get_env(), labels=AutoEnv.EXPLICIT_LABELS)
+        explicit_env.set_alphabet(symbols[0:3])
+        labels.extend([explicit_env.new_label(symbols[0]),
+                       explicit_env.new_label(Or(symbols[0], symbols[1])),
+                       explicit_env.new_label(Not(symbols[1])),
+                       explicit_env.new_label(symbols[2])])
+
         for l in labels:
             _check_tautologies(l)
 
+    def test_explicit_labels(self):
+        symbols = [Symbol(chr(i), BOOL) for i in range(ord('a'),ord('d')+1)]
+        env = AutoEnv(get_env(), labels=AutoEnv.EXPLICIT_LABELS)
+        env.set_alphabet(symbols)
+
+        a = env.new_label(symbols[0])
+        b = env.new_label(symbols[1])
+        a_or_b = env.new_label(Or(symbols[0], symbols[1]))
+        self.assertEqual(a.letters, 1)
+        self.assertEqual(b.letters, 2)
+        self.assertEqual(a_or_b, a.union(b))
+        self.assertEqual(a.complement().letters, 14)
+        self.assertFalse(a.intersect(b).is_sat())
+        self.assertTrue(a.is_contained(a_or_b))
+        self.assertFalse(a_or_b.is_contained(a))
+        self.assertTrue(env.new_label(TRUE()).is_valid())
+        self.assertFalse(env.new_label(FALSE()).is_sat())
+
+        self.assertEqual(a_or_b.get_formula(), Or(symbols[0], symbols[1]))
+        self.assertEqual(a.complement().get_formula(), Not(symbols[0]))
+
     def _has_bdd(self):
         try:
             from pysmt.solvers.bdd import BddSolver
@@ -70,6 +98,11 @@ class TestAuto(unittest.TestCase):
         sat_env = AutoEnv(get_env(), False)
         self._test_auto_aux(sat_env)
 
+        symbols = [Symbol(chr(i), BOOL) for i in range(ord('a'),ord('d')+1)]
+        explicit_env = AutoEnv(get_env(), labels=AutoEnv.EXPLICIT_LABELS)
+        explicit_env.set_alphabet(symbols)
+        self._test_auto_aux(explicit_env)
+
         if self._has_bdd():
             bdd_env = AutoEnv(get_env(), True)
             self._test_auto_aux(bdd_env)
@@ -84,6 +117,19 @@ class TestAuto(unittest.TestCase):
             self.assertTrue(auto.is_equivalent((auto.reverse()).reverse()))
             self.assertTrue(auto.is_equivalent(auto.minimize()))
 
+            det = auto.determinize()
+            self.assertTrue(det.is_deterministic())
+            min_dfa = det.minimize_dfa()
+            self.assertTrue(min_dfa.is_deterministic())
+            self.assertTrue(auto.is_equivalent(min_dfa))
+            # the sink state added by determinize is an explicit
+            # state of the subsets, so Brzozowski's algorithm may
+            # not find the minimal automaton
+            self.assertTrue(min_dfa.count_state() <=
+                            auto.minimize().count_state())
+            self.assertEqual(min_dfa.count_state(),
+                             min_dfa.minimize_dfa().count_state())
+
         symbols = [Symbol(chr(i), BOOL) for i in range(ord('a'),ord('z')+1)]
 
         a = auto_env.new_label(symbols[0])
@@ -322,3 +368,63 @@ class TestAuto(unittest.TestCase):
     
 
         self.assertTrue(len(det_auto.trans[0]) >0 )
+
+    def test_concatenate(self):
+        # the states of self reached from more than one state are
+        # copied once
+        auto_env = AutoEnv(get_env(), False)
+        a = auto_env.new_label(Symbol('a'))
+        b = auto_env.new_label(Symbol('b'))
+        c = auto_env.new_label(Symbol('c'))
+
+        not_a = Automaton.get_singleton(a, auto_env).complement()
+        res = not_a.klenee_star().concatenate(Automaton.get_singleton(c, auto_env))
+        self.assertTrue(res.accept([c]))
+        self.assertTrue(res.accept([b, c]))
+        self.assertTrue(res.accept([a, a, c]))
+        self.assertTrue(res.accept([a, b, c]))
+        self.assertFalse(res.accept([a, c]))
+
+    def test_union_dfa(self):
+        def get_state(auto, word):
+            state = iter(auto.initial_states).next()
+            for letter in word:
+                dsts = [dst for (dst, label) in auto.trans[state]
+                        if label.is_intersecting(letter)]
+                self.assertEqual(len(dsts), 1)
+                state = dsts[0]
+            return state
+
+        auto_env = AutoEnv(get_env(), False)
+        a = auto_env.new_label(Symbol('a'))
+        b = auto_env.new_label(Symbol('b'))
+        not_a = a.complement()
+        not_b = b.complement()
+        a_and_not_b = a.intersect(not_b)
+        b_and_not_a = b.intersect(not_a)
+
+        true_star = Automaton.get_singleton(auto_env.new_label(TRUE()),
+                                            auto_env).klenee_star()
+        ends_a = true_star.concatenate(Automaton.get_singleton(a, auto_env))
+        ends_b = true_star.concatenate(Automaton.get_singleton(b, auto_env))
+        autos = [ends_a.determinize().minimize_dfa(),
+                 ends_b.determinize().minimize_dfa()]
+
+        (union, accepting) = Automaton.get_union_dfa(autos)
+        self.assertTrue(union.is_deterministic())
+        self.assertTrue(union.is_equivalent(ends_a.union(ends_b)))
+        self.assertEqual(set(accepting.keys()), union.states)
+        for s in union.states:
+            self.assertEqual(union.is_final(s), len(accepting[s]) > 0)
+
+        self.assertEqual(accepting[get_state(union, [])], frozenset())
+        self.assertEqual(accepting[get_state(union, [a_and_not_b])],
+                         frozenset([0]))
+        self.assertEqual(accepting[get_state(union, [a_and_not_b, b_and_not_a])],
+                         frozenset([1]))
+        self.assertEqual(accepting[get_state(union, [a.intersect(b)])],
+                         frozenset([0,1]))
+
+        # the product exceeds the maximum number of states
+        self.assertTrue(Automaton.get_union_dfa(autos, 3) is None)
+        self.assertTrue(Automaton.get_union_dfa(autos, 4) is not None)
@@ -148,3 +148,16 @@ class TestCounterEnc(unittest.TestCase):
         eq_value(self, var_name, 2)
         eq_value(self, var_name, 3)
         eq_value(self, var_name, 4)
+
+    def test_counter_bits(self):
+        var_name = "counter_5"
+        self.enc.add_var(var_name, 5)
+
+        bits = self.enc.get_counter_bits(var_name)
+        self.assertEqual(3, len(bits))
+        self.assertEqual(set(bits), self.enc.get_counter_var(var_name))
+        # the most significant bit is the first
+        assignment = self.enc.get_val_assignment(var_name, 4)
+        self.assertTrue(assignment[bits[0]].is_true())
+        self.assertTrue(assignment[bits[1]].is_false())
+        self.assertTrue(assignment[bits[2]].is_false())
@@ -6,6 +6,9 @@ import sys
 import logging
 import unittest
 import os
+import shutil
+import tempfile
+import time
 
 from cStringIO import StringIO
 
@@ -19,10 +22,21 @@ from cbverifier.driver import check_disable, print_ground_spec_map
 from cbverifier.traces.ctrace import MalformedTraceException, TraceEndsInErrorException
 from cbverifier.encoding.cex_printer import CexPrinter
 from cbverifier.utils.stats import Stats
+from cbverifier.smv.tosmv import NuXmvDriver
+from cbverifier.bmc.explicit import ExplicitReachability
+from cbverifier.bmc.kind import KInduction
 import cbverifier.test.examples
+from cbverifier.test.test_explicit import is_error_cex
 
 
 class TestEnc(unittest.TestCase):
+    def _check_cex(self, driver, verdict, cex):
+        """ The cex of an UNSAFE verdict is a path to an error state
+        of the encoding of driver that can be printed """
+        self.assertEqual(verdict == NuXmvDriver.UNSAFE, cex is not None)
+        if cex is not None:
+            self.assertTrue(is_error_cex(driver._get_ts_encoder(), cex))
+
     def test_driver(self):
 
         test_path = os.path.dirname(cbverifier.test.examples.__file__)
@@ -36,6 +50,23 @@ class TestEnc(unittest.TestCase):
         self.assertTrue(0 == retval)
 
 
+    def test_driver_trace_cache(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            argv = ["", "-t", t1, "-f", "json",
+                    "-s", s1,
+                    "-m", "bmc", "-k", "2",
+                    "--trace_cache", cache_dir]
+            self.assertTrue(0 == main(argv))
+            self.assertTrue(1 == len(os.listdir(cache_dir)))
+            self.assertTrue(0 == main(argv))
+        finally:
+            shutil.rmtree(cache_dir)
+
     def test_driver_api(self):
         test_path = os.path.dirname(cbverifier.test.examples.__file__)
 
@@ -60,6 +91,250 @@ class TestEnc(unittest.TestCase):
         trace = driver.run_bmc(2)
         assert (trace is not None)
 
+    def test_driver_large_block(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        argv = ["", "-t", t1, "-f", "json",
+                "-s", s1,
+                "-m", "bmc", "-k", "1", "-b"]
+        self.assertTrue(0 == main(argv))
+
+        # the bug needs 2 steps, and a single callback with the large
+        # block encoding
+        for (large_block, has_bug) in [(False, False), (True, True)]:
+            driver_opts = DriverOptions(t1,
+                                        "json",
+                                        [s1],
+                                        False,
+                                        False,
+                                        None,
+                                        enc_large_block=large_block)
+            driver = Driver(driver_opts)
+            (cex, mapback) = driver.run_bmc(1)
+            self.assertEqual(cex is not None, has_bug)
+
+    def test_driver_split(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        argv = ["", "-t", t1, "-f", "json",
+                "-s", s1,
+                "-m", "bmc", "-k", "2", "--split_errors"]
+        self.assertTrue(0 == main(argv))
+
+        driver_opts = DriverOptions(t1, "json", [s1],
+                                    False, False, None)
+        driver = Driver(driver_opts)
+        (cex, mapback) = driver.run_bmc(2)
+
+        results = driver.run_bmc_split(2)
+        self.assertTrue(len(results) > 0)
+        unsafe = [key for (key, verdict, key_cex) in results
+                  if verdict == NuXmvDriver.UNSAFE]
+        self.assertEqual(cex is not None, len(unsafe) > 0)
+        for (key, verdict, key_cex) in results:
+            self.assertEqual(verdict == NuXmvDriver.UNSAFE,
+                             key_cex is not None)
+
+        # same verdicts in parallel
+        parallel_results = driver.run_bmc_split(2, jobs=2)
+        self.assertEqual([(k, v) for (k, v, c) in results],
+                         [(k, v) for (k, v, c) in parallel_results])
+
+    def test_driver_explicit(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        argv = ["", "-t", t1, "-f", "json",
+                "-s", s1,
+                "-m", "explicit"]
+        self.assertTrue(0 == main(argv))
+
+        driver_opts = DriverOptions(t1, "json", [s1],
+                                    False, False, None)
+        driver = Driver(driver_opts)
+        (cex, mapback) = driver.run_bmc(2)
+        self.assertTrue(cex is not None)
+        self._check_cex(driver, NuXmvDriver.UNSAFE, cex)
+        (res, explicit_cex, mapback) = driver.run_explicit()
+        self._check_cex(driver, res, explicit_cex)
+        self.assertEqual(res, ExplicitReachability.UNSAFE)
+        self.assertTrue(len(explicit_cex) <= len(cex))
+
+    def test_driver_kind(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        argv = ["", "-t", t1, "-f", "json",
+                "-s", s1,
+                "-m", "kind", "-k", "2"]
+        self.assertTrue(0 == main(argv))
+
+        driver_opts = DriverOptions(t1, "json", [s1],
+                                    False, False, None)
+        driver = Driver(driver_opts)
+        (res, explicit_cex, mapback) = driver.run_explicit()
+        (res_kind, cex, mapback) = driver.run_kind(20)
+        self._check_cex(driver, res_kind, cex)
+        if res_kind != KInduction.UNKNOWN:
+            self.assertEqual(res, res_kind)
+
+    def test_driver_native_ic3(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        argv = ["", "-t", t1, "-f", "json",
+                "-s", s1,
+                "-m", "ic3", "--ic3_engine", "native", "-q", "20"]
+        self.assertTrue(0 == main(argv))
+
+        driver_opts = DriverOptions(t1, "json", [s1],
+                                    False, False, None,
+                                    ic3_engine=DriverOptions.NATIVE_IC3)
+        driver = Driver(driver_opts)
+        (res, explicit_cex, mapback) = driver.run_explicit()
+        (ic3_res, cex, mapback) = driver.run_ic3(None, 20)
+        self.assertEqual(res, ic3_res)
+        self._check_cex(driver, ic3_res, cex)
+        self.assertTrue(driver.ic3_lemmas is not None)
+
+        (ic3_res, cex, mapback) = driver.run_ic3(None, 20,
+                                                 driver.ic3_lemmas)
+        self.assertEqual(res, ic3_res)
+
+    def test_driver_portfolio(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        argv = ["", "-t", t1, "-f", "json",
+                "-s", s1,
+                "-m", "portfolio", "-k", "5", "-q", "20"]
+        self.assertTrue(0 == main(argv))
+
+        driver_opts = DriverOptions(t1, "json", [s1],
+                                    False, False, None)
+        driver = Driver(driver_opts)
+        (res, explicit_cex, mapback) = driver.run_explicit()
+        (engine, verdict, cex) = driver.run_portfolio(5, 20)
+        # the explicit engine always finds a verdict
+        self.assertTrue(engine in ["bmc", "kind", "ic3", "explicit"])
+        self.assertEqual(res, verdict)
+        self.assertEqual(verdict == NuXmvDriver.UNSAFE, cex is not None)
+        if cex is not None:
+            # the printed counterexample of the winner
+            self.assertTrue("Reached an error state" in cex)
+
+    def test_driver_portfolio_stop(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        driver_opts = DriverOptions(t1, "json", [s1],
+                                    False, False, None)
+        driver = Driver(driver_opts)
+        ts_enc = driver._get_ts_encoder()
+
+        tmp_dir = tempfile.mkdtemp()
+        pid_file = os.path.join(tmp_dir, "pid")
+
+        def run_slow(ts_enc):
+            # the subprocess runs until it is killed
+            args = ["sh", "-c", "echo $$ > %s; exec sleep 1000" % pid_file]
+            NuXmvDriver._call_sub(args, lambda stdout, stderr, res: None)
+            return (NuXmvDriver.UNSAFE, None)
+
+        def run_fast(ts_enc):
+            # wait for the subprocess of the slow engine
+            for i in range(100):
+                if (os.path.isfile(pid_file) and
+                    open(pid_file).read().endswith("\n")):
+                    break
+                time.sleep(0.1)
+            return (NuXmvDriver.SAFE, None)
+
+        def run_broken(ts_enc):
+            raise Exception("Broken engine")
+
+        def run_bad_cex(ts_enc):
+            # the counterexample cannot be printed
+            return (NuXmvDriver.UNSAFE, [{}, {}])
+
+        try:
+            engines = [("slow", run_slow, True),
+                       ("broken", run_broken, False),
+                       ("bad_cex", run_bad_cex, False),
+                       ("fast", run_fast, False)]
+            winner = driver._run_portfolio(ts_enc, engines, False)
+            self.assertEqual(("fast", NuXmvDriver.SAFE, None), winner)
+
+            # the subprocess of the slow engine was killed
+            pid = int(open(pid_file).read())
+            with self.assertRaises(OSError):
+                os.kill(pid, 0)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_driver_labels(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        argv = ["", "-t", t1, "-f", "json",
+                "-s", s1,
+                "-m", "bmc", "-k", "2", "--labels", "explicit"]
+        self.assertTrue(0 == main(argv))
+
+        for labels in ["sat", "explicit"]:
+            driver_opts = DriverOptions(t1,
+                                        "json",
+                                        [s1],
+                                        False,
+                                        False,
+                                        None,
+                                        enc_labels=labels)
+            driver = Driver(driver_opts)
+            (cex, mapback) = driver.run_bmc(2)
+            self.assertTrue(cex is not None)
+
+    def test_driver_merge(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        for opts in [["--enc_merge"],
+                     ["--enc_merge", "--merge_max_states", "1"]]:
+            argv = ["", "-t", t1, "-f", "json",
+                    "-s", s1,
+                    "-m", "bmc", "-k", "2"] + opts
+            self.assertTrue(0 == main(argv))
+
+        driver_opts = DriverOptions(t1,
+                                    "json",
+                                    [s1],
+                                    False,
+                                    False,
+                                    None,
+                                    enc_merge=True)
+        driver = Driver(driver_opts)
+        (cex, mapback) = driver.run_bmc(2)
+        self.assertTrue(cex is not None)
+
     def test_driver_not_wf_trace(self):
         test_path = os.path.dirname(cbverifier.test.examples.__file__)
 
@@ -189,3 +464,67 @@ class TestEnc(unittest.TestCase):
 
 
 
+
+    def test_encoding_cache(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+
+        t1 = os.path.join(test_path, "trace1.json")
+        s1 = os.path.join(test_path, "spec1.spec")
+
+        def get_cex_str(cex, mapback):
+            mystream = StringIO()
+            printer = CexPrinter(mapback, cex, mystream, True)
+            printer.print_cex()
+            return mystream.getvalue()
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            def get_driver(enc_coi=False):
+                sat = DriverOptions.SAT_SIMULATION
+                driver_opts = DriverOptions(t1, "json", [s1],
+                                            False, False, None,
+                                            enc_coi=enc_coi,
+                                            encoding_cache_dir=cache_dir,
+                                            simulation_engine=sat)
+                return Driver(driver_opts)
+
+            driver = get_driver()
+            (cex, mapback) = driver.run_bmc(2)
+            self.assertTrue(0 == driver.stats.get_counter(Stats.ENCODING_CACHE_HITS))
+            self.assertTrue(1 == driver.stats.get_counter(Stats.ENCODING_CACHE_MISSES))
+            expected = get_cex_str(cex, mapback)
+
+            # the encoding is loaded from the cache
+            driver = get_driver()
+            (cex, mapback) = driver.run_bmc(2)
+            self.assertTrue(1 == driver.stats.get_counter(Stats.ENCODING_CACHE_HITS))
+            self.assertTrue(0 == driver.stats.get_counter(Stats.ENCODING_CACHE_MISSES))
+            self.assertTrue(expected == get_cex_str(cex, mapback))
+
+            # the stored encoding does not have the encoding of the trace
+            (steps, cex, last_cex, mapback) = driver.run_simulation()
+            self.assertTrue(1 == driver.stats.get_counter(Stats.ENCODING_CACHE_MISSES))
+            (steps_cached, cex_cached, last_cex, mapback) = driver.run_simulation()
+            self.assertTrue(2 == driver.stats.get_counter(Stats.ENCODING_CACHE_HITS))
+            self.assertTrue(steps == steps_cached)
+            self.assertTrue((cex is None) == (cex_cached is None))
+
+            # different encoding options
+            driver = get_driver(True)
+            driver.run_bmc(2)
+            self.assertTrue(1 == driver.stats.get_counter(Stats.ENCODING_CACHE_MISSES))
+
+            # corrupted entries
+            for name in os.listdir(cache_dir):
+                with open(os.path.join(cache_dir, name), "wb") as f:
+                    f.write("corrupted")
+            driver = get_driver()
+            (cex, mapback) = driver.run_bmc(2)
+            self.assertTrue(1 == driver.stats.get_counter(Stats.ENCODING_CACHE_MISSES))
+            self.assertTrue(expected == get_cex_str(cex, mapback))
+
+            argv = ["", "-t", t1, "-f", "json", "-s", s1,
+                    "-m", "bmc", "-k", "2", "--encoding_cache", cache_dir]
+            self.assertTrue(0 == main(argv))
+        finally:
+            shutil.rmtree(cache_dir)
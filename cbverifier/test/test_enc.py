@@ -15,6 +15,7 @@ except ImportError:
 from cbverifier.encoding.encoder import TSEncoder, TSMapback
 from cbverifier.encoding.cex_printer import CexPrinter
 from cbverifier.encoding.counter_enc import CounterEnc
+from cbverifier.encoding.automata import AutoEnv
 from cbverifier.traces.ctrace import CTrace, CCallback, CCallin, CValue, CTraceException
 from cbverifier.specs.spec_ast import *
 from cbverifier.specs.spec import Spec
@@ -26,6 +27,7 @@ from pysmt.shortcuts import Solver
 from pysmt.shortcuts import get_env, is_sat, is_valid, get_model
 from pysmt.shortcuts import Symbol, TRUE, FALSE
 from pysmt.shortcuts import Not, And, Or, Implies, Iff, ExactlyOne
+from pysmt.exceptions import SolverAPINotFound
 
 from cbverifier.test.test_grounding import TestGrounding
 
@@ -142,6 +144,15 @@ class TestEnc(unittest.TestCase):
 
 
 
+    def test_get_msg_key(self):
+        ts_enc = self._get_sample_trace()
+        for msg in [ts_enc.trace.children[0], ts_enc.trace.children[0].children[0]]:
+            for entry_type in [TSEncoder.ENTRY, TSEncoder.EXIT]:
+                key = ts_enc.get_msg_key(msg, entry_type)
+                self.assertTrue(key == TSEncoder.get_key_from_msg(msg, entry_type))
+                # the key is computed once
+                self.assertTrue(key is ts_enc.get_msg_key(msg, entry_type))
+
     def test_get_key_from_call(self):
         spec_list = Spec.get_specs_from_string("SPEC TRUE |- [CI] [ENTRY] [1] void m1(); " +
                                                "SPEC TRUE |- [CI] [ENTRY] [1] void m1(2 : int,1 : int,2 : int);" +
@@ -725,6 +736,20 @@ class TestEnc(unittest.TestCase):
         cex = bmc.find_bug(2, True)
         self.assertTrue(cex is None)
 
+    def test_duplicate_specs(self):
+        """ The same spec read twice (e.g. from two spec files) is
+        encoded once """
+        ctrace = TestGrounding.get_cb_trace([("void m1()", ["void m3()", "void m2()"])])
+        spec_str = "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()"
+        spec_list = Spec.get_specs_from_string(spec_str + "; " + spec_str)
+        self.assertEqual(len(spec_list), 2)
+
+        ts_enc = TSEncoder(ctrace, spec_list)
+        self.assertEqual(len(ts_enc.get_ground_spec()), 1)
+        bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                  ts_enc.error_prop)
+        self.assertTrue(bmc.find_bug(4) is not None)
+
 
     def test_multiple_single_cb(self):
         spec_list = Spec.get_specs_from_string("SPEC FALSE[*] |- [CB] [ENTRY] [l] void m3(); SPEC FALSE[*] |- [CI] [ENTRY] [l] void m4()")
@@ -945,3 +970,280 @@ class TestEnc(unittest.TestCase):
 
 
 
+
+    def test_coi(self):
+        """ The cone of influence reduction preserves the reachability of
+        the error and removes variables """
+        def get_trace():
+            return TestGrounding.get_cb_trace([("void m1()", ["void m2()", "void m3()"]),
+                                                 ("void m4()", ["void m5()"])])
+
+        def check(spec_str, has_bug):
+            spec_list = Spec.get_specs_from_string(spec_str)
+            results = []
+            for coi in [False, True]:
+                ts_enc = TSEncoder(get_trace(), spec_list, coi=coi)
+                ts = ts_enc.get_ts_encoding()
+                bmc = BMC(ts_enc.helper, ts, ts_enc.error_prop)
+                self.assertEqual(bmc.find_bug(10) is not None, has_bug)
+                results.append(ts_enc)
+            return results
+
+        # m2 is disabled after m4
+        (ts_enc, ts_enc_coi) = check("SPEC TRUE[*]; [CB] [ENTRY] [l] void m4() |- [CI] [ENTRY] [l] void m2();" +
+                                     "SPEC TRUE[*]; [CB] [ENTRY] [l] void m1() |+ [CI] [ENTRY] [l] void m5()",
+                                     True)
+        self.assertTrue(len(ts_enc_coi.encoded_specs) == 1)
+        self.assertTrue(len(ts_enc_coi.state_msgs) == 1)
+        self.assertTrue(ts_enc_coi.trace_length < ts_enc.trace_length)
+        self.assertTrue(len(ts_enc_coi.ts.state_vars) < len(ts_enc.ts.state_vars))
+        self.assertTrue(len(ts_enc_coi.ts.input_vars) <= len(ts_enc.ts.input_vars))
+
+        # m4 is never followed by m1 (m5 is always in between)
+        check("SPEC TRUE[*]; [CB] [ENTRY] [l] void m4(); [CB] [ENTRY] [l] void m1() |- [CI] [ENTRY] [l] void m2()",
+              False)
+        check("SPEC TRUE[*]; [CB] [ENTRY] [l] void m4(); [CI] [ENTRY] [l] void m5() |- [CI] [ENTRY] [l] void m2()",
+              True)
+        # m2 is disabled by m3 and enabled again by m4
+        check("SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+              "SPEC TRUE[*]; [CB] [ENTRY] [l] void m4() |+ [CI] [ENTRY] [l] void m2()",
+              True)
+        check("SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+              "SPEC TRUE[*]; [CB] [EXIT] [l] void m1() |+ [CI] [ENTRY] [l] void m2()",
+              False)
+
+    def test_large_block(self):
+        """ The large block encoding finds the same bugs in a number
+        of steps equal to the number of top-level callbacks """
+        def get_trace():
+            return TestGrounding.get_cb_trace([("void m1()", ["void m2()", "void m3()"]),
+                                                 ("void m4()", ["void m5()", "void m2()"]),
+                                                 ("void m6()", [])])
+
+        def check(spec_str, coi=False):
+            spec_list = Spec.get_specs_from_string(spec_str)
+            ts_enc = TSEncoder(get_trace(), spec_list, coi=coi)
+            bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                      ts_enc.error_prop)
+            has_bug = bmc.find_bug(16) is not None
+            (step, trace, _) = bmc.simulate(ts_enc.get_trace_encoding())
+            can_simulate = trace is not None
+
+            ts_enc = TSEncoder(get_trace(), spec_list, coi=coi,
+                               large_block=True)
+            bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                      ts_enc.error_prop)
+            cex = bmc.find_bug(4)
+            self.assertEqual(cex is not None, has_bug)
+
+            # one step for each top-level callback in the simulation
+            trace_enc = ts_enc.get_trace_encoding()
+            if not coi:
+                self.assertEqual(len(trace_enc), 3)
+            (step, trace, _) = bmc.simulate(trace_enc)
+            self.assertEqual(trace is not None, can_simulate)
+            return (ts_enc, cex, has_bug)
+
+        specs = ["SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m4() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m1() |+ [CI] [ENTRY] [l] void m5()",
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m6() |- [CI] [ENTRY] [l] void m5();" +
+                 "SPEC TRUE[*]; [CB] [EXIT] [l] void m1() |+ [CI] [ENTRY] [l] void m5()",
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m6() |- [CI] [ENTRY] [l] void m5();" +
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m2() |+ [CI] [ENTRY] [l] void m5()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m2() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CB] [EXIT] [l] void m1() |+ [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m2() |- [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m1() |+ [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()",
+                 "SPEC [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()"]
+        results = []
+        for spec_str in specs:
+            for coi in [False, True]:
+                results.append(check(spec_str, coi)[2])
+        self.assertTrue(True in results and False in results)
+
+        # the error is reported on the disabled callin inside the block
+        (ts_enc, cex, has_bug) = check(specs[0])
+        bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                  ts_enc.error_prop)
+        cex = bmc.find_bug(4, True)
+        self.assertEqual(len(cex), 3)
+        stringio = StringIO()
+        printer = CexPrinter(ts_enc.mapback, cex, stringio)
+        printer.print_cex()
+        io_string = stringio.getvalue()
+        self.assertTrue("[CI] [ENTRY] void m2() (1) \n" \
+                        "    Reached an error state in step 2" in io_string)
+
+    def test_explicit_labels(self):
+        """ The explicit (and BDD) labels find the same bugs of the
+        SAT labels """
+        ctrace = TestGrounding.get_cb_trace([("void m1()", ["void m2()", "void m3()"]),
+                                            ("void m4()", ["void m5()", "void m2()"])])
+
+        specs = ["SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m1() |+ [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()",
+                 "SPEC (! [CB] [ENTRY] [l] void m4())[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m5()",
+                 "SPEC [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()"]
+        all_labels = [AutoEnv.SAT_LABELS, AutoEnv.EXPLICIT_LABELS]
+        try:
+            from pysmt.solvers.bdd import BddSolver
+            all_labels.append(AutoEnv.BDD_LABELS)
+        except SolverAPINotFound:
+            pass
+
+        results = []
+        for spec_str in specs:
+            spec_list = Spec.get_specs_from_string(spec_str)
+            for coi in [False, True]:
+                has_bug = []
+                for labels in all_labels:
+                    ts_enc = TSEncoder(ctrace, spec_list, coi=coi,
+                                       labels=labels)
+                    bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                              ts_enc.error_prop)
+                    has_bug.append(bmc.find_bug(10) is not None)
+                for res in has_bug[1:]:
+                    self.assertEqual(has_bug[0], res)
+                results.append(has_bug[0])
+        self.assertTrue(True in results and False in results)
+
+    def test_merge_automata(self):
+        """ The merged automata find the same bugs of the separate
+        automata """
+        ctrace = TestGrounding.get_cb_trace([("void m1()", ["void m2()", "void m3()"]),
+                                            ("void m4()", ["void m5()", "void m2()"])])
+
+        specs = ["SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m4() |- [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m4() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m1() |+ [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()",
+                 "SPEC (! [CB] [ENTRY] [l] void m4())[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m5();" +
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m2(); [CI] [ENTRY] [l] void m2() |- [CI] [ENTRY] [l] void m5()"]
+
+        results = []
+        for spec_str in specs:
+            spec_list = Spec.get_specs_from_string(spec_str)
+            for (coi, large_block) in [(False, False), (True, False),
+                                       (False, True)]:
+                has_bug = []
+                for (merge, max_states) in [(False, TSEncoder.MERGE_MAX_STATES),
+                                            (True, TSEncoder.MERGE_MAX_STATES),
+                                            (True, 1)]:
+                    ts_enc = TSEncoder(ctrace, spec_list, coi=coi,
+                                       large_block=large_block,
+                                       merge_automata=merge,
+                                       merge_max_states=max_states)
+                    bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                              ts_enc.error_prop)
+                    has_bug.append(bmc.find_bug(10) is not None)
+                    if merge and max_states == 1:
+                        # the union is too large
+                        self.assertEqual(len(ts_enc.pc2auto),
+                                         len(ts_enc.regexp2ts))
+                for res in has_bug[1:]:
+                    self.assertEqual(has_bug[0], res)
+                results.append(has_bug[0])
+        self.assertTrue(True in results and False in results)
+
+        # a single automaton for the two disabling specifications
+        spec_list = Spec.get_specs_from_string(specs[1])
+        ts_enc = TSEncoder(ctrace, spec_list, merge_automata=True)
+        ts = ts_enc.get_ts_encoding()
+        self.assertEqual(len(ts_enc.pc2auto), 2)
+        bmc = BMC(ts_enc.helper, ts, ts_enc.error_prop)
+        cex = bmc.find_bug(10)
+        self.assertTrue(cex is not None)
+        stringio = StringIO()
+        printer = CexPrinter(ts_enc.mapback, cex, stringio)
+        printer.print_cex()
+        self.assertTrue("Reached an error state" in stringio.getvalue())
+
+    def test_add_specs(self):
+        """ Adding the specifications incrementally finds the same
+        bugs of the encoding of all the specifications """
+        ctrace = TestGrounding.get_cb_trace([("void m1()", ["void m2()", "void m3()"]),
+                                            ("void m4()", ["void m5()", "void m2()"])])
+
+        # the second specs disallow a new message, the third one
+        # removes the bug
+        specs = ["SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CB] [ENTRY] [l] void m1() |+ [CI] [ENTRY] [l] void m2()"]
+        expected = [False, True, False]
+
+        for (large_block, merge) in [(False, False), (True, False),
+                                     (False, True)]:
+            spec_list = Spec.get_specs_from_string(specs[0])
+            inc_enc = TSEncoder(ctrace, spec_list,
+                                large_block=large_block,
+                                merge_automata=merge)
+            all_specs = []
+            for i in range(len(specs)):
+                spec_list = Spec.get_specs_from_string(specs[i])
+                all_specs.extend(spec_list)
+                if i > 0:
+                    new_specs = inc_enc.add_specs(spec_list)
+                    self.assertEqual(len(new_specs), 1)
+
+                ts_enc = TSEncoder(ctrace, all_specs,
+                                   large_block=large_block,
+                                   merge_automata=merge)
+                for enc in [inc_enc, ts_enc]:
+                    bmc = BMC(enc.helper, enc.get_ts_encoding(),
+                              enc.error_prop)
+                    cex = bmc.find_bug(10)
+                    self.assertEqual(expected[i], cex is not None)
+                self.assertEqual(len(inc_enc.get_ground_spec()),
+                                 len(ts_enc.get_ground_spec()))
+
+            # the ground specifications are added once
+            spec_list = Spec.get_specs_from_string(specs[0])
+            self.assertEqual(len(inc_enc.add_specs(spec_list)), 0)
+
+        # the cone of influence depends on the specifications
+        spec_list = Spec.get_specs_from_string(specs[0])
+        ts_enc = TSEncoder(ctrace, spec_list, coi=True)
+        with self.assertRaises(Exception):
+            ts_enc.add_specs(Spec.get_specs_from_string(specs[1]))
+
+    def test_error_keys(self):
+        """ The errors of each disallowed message are checked
+        independently """
+        ctrace = TestGrounding.get_cb_trace([("void m1()", ["void m2()", "void m3()"]),
+                                            ("void m4()", ["void m5()", "void m2()"])])
+
+        # m2 can be disallowed, m5 is enabled again before it is called
+        spec_list = Spec.get_specs_from_string("SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+                                               "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m5();" +
+                                               "SPEC TRUE[*]; [CB] [ENTRY] [l] void m4() |+ [CI] [ENTRY] [l] void m5()")
+
+        for (coi, large_block) in [(False, False), (True, False),
+                                   (False, True)]:
+            ts_enc = TSEncoder(ctrace, spec_list, coi=coi,
+                               large_block=large_block)
+            error_keys = ts_enc.get_error_keys()
+            self.assertEqual(len(error_keys), 2)
+
+            for (error_key, has_bug) in [(None, True),
+                                         (error_keys[0], "m2" in error_keys[0]),
+                                         (error_keys[1], "m2" in error_keys[1]),
+                                         (None, True)]:
+                if error_key is None:
+                    ts_enc.set_error_keys(None)
+                else:
+                    ts_enc.set_error_keys(set([error_key]))
+                bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                          ts_enc.error_prop)
+                cex = bmc.find_bug(10)
+                self.assertEqual(has_bug, cex is not None)
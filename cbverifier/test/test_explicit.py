@@ -0,0 +1,180 @@
+""" Test the explicit-state reachability engine
+
+"""
+
+import logging
+import unittest
+
+from cStringIO import StringIO
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from cbverifier.encoding.encoder import TSEncoder
+from cbverifier.encoding.cex_printer import CexPrinter
+from cbverifier.specs.spec import Spec
+from cbverifier.bmc.bmc import BMC
+from cbverifier.bmc.explicit import ExplicitReachability
+
+from pysmt.logics import QF_BOOL
+from pysmt.shortcuts import Solver
+from pysmt.shortcuts import Not
+
+from cbverifier.test.test_grounding import TestGrounding
+
+
+# specifications used to compare the verification engines
+ENGINE_SPECS = ["SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()",
+                "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()",
+                "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+                "SPEC TRUE[*]; [CB] [ENTRY] [l] void m1() |+ [CI] [ENTRY] [l] void m2();" +
+                "SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()",
+                "SPEC (! [CB] [ENTRY] [l] void m4())[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m5();" +
+                "SPEC TRUE[*]; [CI] [ENTRY] [l] void m2(); [CI] [ENTRY] [l] void m2() |- [CI] [ENTRY] [l] void m5()"]
+
+def get_trace():
+    return TestGrounding.get_cb_trace([("void m1()", ["void m2()", "void m3()"]),
+                                       ("void m4()", ["void m5()", "void m2()"])])
+
+def get_encoders(ctrace):
+    """ Returns the encoders of ENGINE_SPECS on ctrace (with and
+    without the cone of influence and the merge of the automata) """
+    encoders = []
+    for spec_str in ENGINE_SPECS:
+        spec_list = Spec.get_specs_from_string(spec_str)
+        for (coi, merge) in [(False, False), (True, False),
+                             (False, True)]:
+            encoders.append(TSEncoder(ctrace, spec_list, coi=coi,
+                                      merge_automata=merge))
+    return encoders
+
+def is_path(ts_enc, cex, to_error=True):
+    """ True if cex is a path of the transition system of ts_enc
+    (that ends in an error state if to_error is True) """
+    ts = ts_enc.get_ts_encoding()
+    bmc = BMC(ts_enc.helper, ts, ts_enc.error_prop)
+    solver = Solver(name='z3', logic=QF_BOOL)
+    k = len(cex) - 1
+    for i in range(k + 1):
+        solver.add_assertion(bmc.get_ts_enc_at_i(i))
+    if to_error:
+        solver.add_assertion(bmc.helper.get_formula_at_i(bmc.all_vars,
+                                                         ts_enc.error_prop,
+                                                         k))
+    for i in range(len(cex)):
+        for (var, value) in cex[i].iteritems():
+            var_i = bmc.helper.get_var_at_time(var, i)
+            if value:
+                solver.add_assertion(var_i)
+            else:
+                solver.add_assertion(Not(var_i))
+    return solver.solve()
+
+def is_error_cex(ts_enc, cex):
+    """ True if cex is a path to an error state that can be printed """
+    if not is_path(ts_enc, cex):
+        return False
+    stringio = StringIO()
+    printer = CexPrinter(ts_enc.mapback, cex, stringio)
+    printer.print_cex()
+    return "Reached an error state" in stringio.getvalue()
+
+def check_engine(test_case, check):
+    """ Checks the engine check(ts_enc), which returns a pair
+    (verdict, cex), on the encoders of get_encoders.
+
+    A SAFE or UNSAFE verdict must be the one of BMC (the systems are
+    small, 10 steps explore all their states), and the cex of an
+    UNSAFE verdict must be a path to an error state that can be
+    printed. The engine must prove and disprove some systems.
+    """
+    verdicts = []
+    for ts_enc in get_encoders(get_trace()):
+        bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                  ts_enc.error_prop)
+        has_bug = bmc.find_bug(10) is not None
+
+        (verdict, cex) = check(ts_enc)
+        if verdict == ExplicitReachability.UNSAFE:
+            test_case.assertTrue(has_bug)
+            test_case.assertTrue(is_error_cex(ts_enc, cex))
+        else:
+            if verdict == ExplicitReachability.SAFE:
+                test_case.assertFalse(has_bug)
+            test_case.assertTrue(cex is None)
+        verdicts.append(verdict)
+    test_case.assertTrue(ExplicitReachability.SAFE in verdicts)
+    test_case.assertTrue(ExplicitReachability.UNSAFE in verdicts)
+
+
+class TestExplicit(unittest.TestCase):
+
+    def test_explicit(self):
+        def check(ts_enc):
+            (res, cex) = ExplicitReachability(ts_enc).find_bug()
+            # the explicit engine always finds a verdict
+            self.assertTrue(res != ExplicitReachability.UNKNOWN)
+            return (res, cex)
+        check_engine(self, check)
+
+    def test_max_depth(self):
+        ctrace = get_trace()
+        spec_list = Spec.get_specs_from_string("SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()")
+        ts_enc = TSEncoder(ctrace, spec_list)
+
+        engine = ExplicitReachability(ts_enc)
+        (res, cex) = engine.find_bug(1)
+        self.assertEqual(res, ExplicitReachability.UNKNOWN)
+        self.assertTrue(cex is None)
+
+        (res, cex) = engine.find_bug()
+        self.assertEqual(res, ExplicitReachability.UNSAFE)
+        # the shortest path to the error
+        bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                  ts_enc.error_prop)
+        self.assertTrue(bmc.find_bug(len(cex) - 2) is None)
+
+    def test_simulate(self):
+        ctrace = get_trace()
+        # the trace can be simulated, the simulation gets stuck on
+        # the first message (the entry of m1) and on a later message
+        specs = ["SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*] |- [CB] [ENTRY] [l] void m1()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m5()"]
+
+        steps = []
+        for spec_str in specs:
+            spec_list = Spec.get_specs_from_string(spec_str)
+            for (coi, simplify) in [(False, False), (True, False),
+                                    (False, True)]:
+                ts_enc = TSEncoder(ctrace, spec_list, simplify, coi=coi)
+                for cb_sequence in [None, [ctrace.children[0].message_id]]:
+                    bmc = BMC(ts_enc.helper, ts_enc.get_ts_encoding(),
+                              ts_enc.error_prop)
+                    (step, trace, _) = bmc.simulate(ts_enc.get_trace_encoding(cb_sequence))
+
+                    engine = ExplicitReachability(ts_enc)
+                    trace_steps = ts_enc.get_trace_steps(cb_sequence)
+                    (explicit_step, explicit_trace, _) = engine.simulate(trace_steps)
+                    self.assertEqual(step, explicit_step)
+                    self.assertEqual(trace is None, explicit_trace is None)
+                    if explicit_trace is not None:
+                        self.assertEqual(len(trace), len(explicit_trace))
+                        self.assertTrue(is_path(ts_enc, explicit_trace,
+                                                False))
+                        stringio = StringIO()
+                        printer = CexPrinter(ts_enc.mapback, explicit_trace,
+                                             stringio)
+                        printer.print_cex()
+                    steps.append((step, trace is None))
+        self.assertTrue((1, True) in steps)
+        self.assertTrue(len(set(steps)) > 2)
+
+    def test_large_block(self):
+        ctrace = get_trace()
+        spec_list = Spec.get_specs_from_string("SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()")
+        ts_enc = TSEncoder(ctrace, spec_list, large_block=True)
+        with self.assertRaises(Exception):
+            ExplicitReachability(ts_enc)
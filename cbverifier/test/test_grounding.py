@@ -779,21 +779,42 @@ class TestGrounding(unittest.TestCase):
 
         return trace
 
+    @staticmethod
+    def get_cb_trace(cb_list):
+        """ Returns a trace with a top-level callback for each
+        (callback name, list of callin names) in cb_list, where the
+        callbacks call the callins in order (all the messages have
+        the same receiver) """
+        trace = CTrace()
+        for (cb_name, ci_names) in cb_list:
+            cb = CCallback(1, 1, "", cb_name,
+                           [TestGrounding._get_obj("1","string")],
+                           None,
+                           [TestGrounding._get_fmwkov("", cb_name, False)])
+            trace.add_msg(cb)
+            for ci_name in ci_names:
+                ci = CCallin(1, 1, "", ci_name,
+                             [TestGrounding._get_obj("1","string")],
+                             None)
+                cb.add_msg(ci)
+        return trace
+
     @staticmethod
     def check_sg(test):
         (r, t, expected_specs_str) = test
 
         trace = TestGrounding.get_trace(t)
 
-        gs = GroundSpecs(trace)
-        specs = Spec.get_specs_from_string(r)
-        ground_specs = gs.ground_spec(specs[0])
-
-        expected_ground_specs = Spec.get_specs_from_string(expected_specs_str)
+        # all the grounding engines must produce the same specs
+        for engine in GroundSpecs.ENGINES:
+            gs = GroundSpecs(trace, engine=engine)
+            specs = Spec.get_specs_from_string(r)
+            ground_specs = gs.ground_spec(specs[0])
 
-        if expected_ground_specs is None:
-            expected_ground_specs = []
-        assert(TestGrounding._eq_specs(ground_specs, expected_ground_specs))
+            expected_ground_specs = Spec.get_specs_from_string(expected_specs_str)
+            if expected_ground_specs is None:
+                expected_ground_specs = []
+            assert(TestGrounding._eq_specs(ground_specs, expected_ground_specs))
 
     def test_sg(self):
         simple = [("SPEC FALSE |- FALSE", "", ""),
@@ -871,3 +892,163 @@ class TestGrounding(unittest.TestCase):
 
         for test in multiv: TestGrounding.check_sg(test)
 
+
+    def test_join_grounding(self):
+        """ The join and the sat engines produce the same specs """
+        def check_engines(trace, spec_str):
+            spec = Spec.get_specs_from_string(spec_str)[0]
+            sat_specs = GroundSpecs(trace, engine=GroundSpecs.SAT_ENGINE).ground_spec(spec)
+            join_specs = GroundSpecs(trace, engine=GroundSpecs.JOIN_ENGINE).ground_spec(spec)
+            self.assertTrue(TestGrounding._eq_specs(join_specs, sat_specs))
+
+        trace = TestGrounding.get_trace("doA(1);doA(2);doA(3);doC(1);doC(3);doB(1);doB(2)")
+        specs = ["SPEC [CB] [ENTRY] [1] void doA(x : int); [CB] [ENTRY] [1] void doC(x : int) |- [CB] [ENTRY] [1] void doB(x : int)",
+                 "SPEC [CB] [ENTRY] [1] void doA(x : int); [CB] [ENTRY] [1] void doA(y : int) |- [CB] [ENTRY] [1] void doB(y : int)",
+                 "SPEC ! ([CB] [ENTRY] [1] void doA(x : int)) |- [CB] [ENTRY] [1] void doB(x : int)",
+                 "SPEC ([CB] [ENTRY] [1] void doC(x : int))[*] |- [CB] [ENTRY] [1] void doB(x : int)",
+                 "SPEC [CB] [ENTRY] [1] void doA(x : int) | [CB] [ENTRY] [1] void doC(y : int) |- [CB] [ENTRY] [1] void doB(y : int)",
+                 "SPEC [CB] [ENTRY] [1] void doA(x : int) & ! [CB] [ENTRY] [1] void doC(x : int) |- [CB] [ENTRY] [1] void doB(1 : int)",
+                 "SPEC [CB] [ENTRY] [1] void doA(# : int) |- [CB] [ENTRY] [1] void doB(x : int)"]
+        for spec_str in specs:
+            check_engines(trace, spec_str)
+
+        # specs with receivers and multiple parameters
+        trace = CTrace()
+        cb1 = CCallback(1, 1, "", "void doSomethingCb()",
+                        [TestGrounding._get_obj("1","string")],
+                        None,
+                        [TestGrounding._get_fmwkov("",
+                                                  "void doSomethingCb()", False)])
+        trace.add_msg(cb1)
+        for (receiver, param) in [("1","2"),("1","4"),("2","4")]:
+            cb1.add_msg(CCallin(1, 1, "", "void doSomethingCi(string)",
+                                [TestGrounding._get_obj(receiver,"string"),
+                                 TestGrounding._get_obj(param,"string")],
+                                None))
+            cb1.add_msg(CCallin(1, 1, "", "void otherCi(string)",
+                                [TestGrounding._get_obj(param,"string"),
+                                 TestGrounding._get_obj(receiver,"string")],
+                                None))
+        specs = ["SPEC [CI] [ENTRY] [l] void doSomethingCi(z : string) |- [CI] [ENTRY] [z] void otherCi(f : string)",
+                 "SPEC [CI] [ENTRY] [l] void doSomethingCi(z : string) |- [CI] [ENTRY] [z] void otherCi(l : string)",
+                 "SPEC [CI] [ENTRY] [l] void doSomethingCi(# : string) |- [CI] [ENTRY] [#] void otherCi(# : string)",
+                 "SPEC [CB] [ENTRY] [l] void doSomethingCb() |- [CI] [ENTRY] [#] void otherCi(l : string)",
+                 "SPEC [CB] [ENTRY] [l] void doSomethingCb(); ! [CI] [ENTRY] [l] void doSomethingCi(z : string) |- [CI] [ENTRY] [z] void otherCi(l : string)"]
+        for spec_str in specs:
+            check_engines(trace, spec_str)
+
+    def test_parallel_grounding(self):
+        """ Grounding the specs in parallel gives the same specs, in the
+        same order """
+        def get_spec_strings(ground_specs):
+            res = []
+            for spec in ground_specs:
+                stringio = StringIO()
+                spec.print_spec(stringio)
+                res.append(stringio.getvalue())
+            return res
+
+        trace = TestGrounding.get_trace("doA(1);doA(2);doA(3);doC(1);doC(3);doB(1);doB(2)")
+        specs = Spec.get_specs_from_string("SPEC [CB] [ENTRY] [1] void doA(x : int); [CB] [ENTRY] [1] void doC(x : int) |- [CB] [ENTRY] [1] void doB(x : int);" +
+                                           "SPEC [CB] [ENTRY] [1] void doA(x : int) |- [CB] [ENTRY] [1] void doB(y : int);" +
+                                           "SPEC [CB] [ENTRY] [1] void doD(x : int) |- [CB] [ENTRY] [1] void doB(x : int);" +
+                                           "SPEC ! ([CB] [ENTRY] [1] void doA(x : int)) |- [CB] [ENTRY] [1] void doB(x : int)")
+
+        gs = GroundSpecs(trace)
+        seq_specs = gs.ground_spec_list(specs)
+        self.assertTrue(len(seq_specs) > 0)
+
+        for jobs in [2, 4]:
+            gs = GroundSpecs(trace)
+            par_specs = gs.ground_spec_list(specs, jobs)
+            self.assertEqual(get_spec_strings(seq_specs),
+                             get_spec_strings(par_specs))
+            # the ground specs are mapped to the original specs
+            for par_spec in par_specs:
+                self.assertTrue(gs.get_source_spec(par_spec) in specs)
+
+    def test_relevance_prefilter(self):
+        trace = TestGrounding.get_trace("doA(1);doC(1);doB(1)")
+
+        # (spec, is_relevant)
+        tests = [("SPEC [CB] [ENTRY] [1] void doA(x : int) |- [CB] [ENTRY] [1] void doB(x : int)", True),
+                 # rhs not in the trace
+                 ("SPEC [CB] [ENTRY] [1] void doA(x : int) |- [CB] [ENTRY] [1] void doD(x : int)", False),
+                 # wrong arity
+                 ("SPEC [CB] [ENTRY] [1] void doA(x : int) |- [CB] [ENTRY] [1] void doB()", False),
+                 # regexp cannot match
+                 ("SPEC [CB] [ENTRY] [1] void doA(x : int); [CB] [ENTRY] [1] void doD(x : int) |- [CB] [ENTRY] [1] void doB(x : int)", False),
+                 ("SPEC [CB] [ENTRY] [1] void doD(x : int) & TRUE |- [CB] [ENTRY] [1] void doB(x : int)", False),
+                 ("SPEC FALSE |- [CB] [ENTRY] [1] void doB(x : int)", False),
+                 # the regexp can match
+                 ("SPEC [CB] [ENTRY] [1] void doD(x : int) | [CB] [ENTRY] [1] void doC(x : int) |- [CB] [ENTRY] [1] void doB(x : int)", True),
+                 ("SPEC ! [CB] [ENTRY] [1] void doD(x : int) |- [CB] [ENTRY] [1] void doB(x : int)", True),
+                 ("SPEC ([CB] [ENTRY] [1] void doD(x : int))[*] |- [CB] [ENTRY] [1] void doB(x : int)", True)]
+
+        specs = []
+        for (spec_str, relevant) in tests:
+            spec = Spec.get_specs_from_string(spec_str)[0]
+            specs.append(spec)
+            gs = GroundSpecs(trace)
+            self.assertEqual(gs.is_relevant(spec), relevant)
+            # the pruned specs have no ground specs
+            if not relevant:
+                self.assertTrue(len(gs.ground_spec(spec)) == 0)
+
+        gs = GroundSpecs(trace)
+        gs.ground_spec_list(specs)
+        self.assertEqual(gs.pruned_specs,
+                         len([t for t in tests if not t[1]]))
+
+    def test_value_index(self):
+        """ The lookups with constants and bound variables use the
+        indexes on the parameter values """
+        def get_messages(aset):
+            res = set()
+            for a in aset:
+                for (fvar, fval) in a.assignments.iteritems():
+                    if get_node_type(fvar) != ID and fval != bottom_value:
+                        res.add(fval.message_id)
+            return res
+
+        def get_call(spec_str):
+            spec = Spec.get_specs_from_string(spec_str)[0]
+            return get_regexp_node(spec.ast)
+
+        trace = TestGrounding.get_trace("doA(1,2);doA(2,2);doA(1,3);doA(3,1)")
+        tmap = TraceMap(trace)
+
+        call = get_call("SPEC [CB] [ENTRY] [l] void doA(1 : int, y : int) |- [CB] [ENTRY] [l] void doA(1 : int, y : int)")
+        self.assertEqual(get_messages(tmap.lookup_assignments(call)), set([1,3]))
+
+        call = get_call("SPEC [CB] [ENTRY] [l] void doA(1 : int, 3 : int) |- [CB] [ENTRY] [l] void doA(1 : int, y : int)")
+        self.assertEqual(get_messages(tmap.lookup_assignments(call)), set([3]))
+
+        call = get_call("SPEC [CB] [ENTRY] [l] void doA(4 : int, y : int) |- [CB] [ENTRY] [l] void doA(1 : int, y : int)")
+        self.assertEqual(get_messages(tmap.lookup_assignments(call)), set())
+
+        call = get_call("SPEC [CB] [ENTRY] [l] void doA(x : int, y : int) |- [CB] [ENTRY] [l] void doA(1 : int, y : int)")
+        self.assertEqual(get_messages(tmap.lookup_assignments(call)), set([1,2,3,4]))
+        bindings = {new_id("y") : TestGrounding._get_int(2)}
+        self.assertEqual(get_messages(tmap.lookup_assignments(call, bindings)),
+                         set([1,2]))
+        bindings = {new_id("x") : TestGrounding._get_int(1),
+                    new_id("y") : TestGrounding._get_int(2)}
+        self.assertEqual(get_messages(tmap.lookup_assignments(call, bindings)),
+                         set([1]))
+
+        # the join grounding looks up the messages with the values of
+        # the variables already joined
+        spec = Spec.get_specs_from_string("SPEC [CB] [ENTRY] [l] void doA(x : int, 2 : int) |- [CB] [ENTRY] [l] void doA(3 : int, x : int)")[0]
+        gs = GroundSpecs(trace, engine=GroundSpecs.JOIN_ENGINE)
+        lookups = []
+        lookup_assignments = gs.trace_map.lookup_assignments
+        def lookup(call_node, bindings=None):
+            lookups.append(bindings)
+            return lookup_assignments(call_node, bindings)
+        gs.trace_map.lookup_assignments = lookup
+        join_specs = gs.ground_spec(spec)
+        self.assertTrue(len([b for b in lookups if b is not None]) > 0)
+
+        sat_specs = GroundSpecs(trace).ground_spec(spec)
+        self.assertTrue(TestGrounding._eq_specs(join_specs, sat_specs))
@@ -0,0 +1,68 @@
+""" Test the native implementation of IC3
+
+"""
+
+import unittest
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from cbverifier.encoding.encoder import TSEncoder
+from cbverifier.specs.spec import Spec
+from cbverifier.bmc.ic3 import IC3
+
+from pysmt.shortcuts import FALSE, Not
+
+from cbverifier.test.test_explicit import get_trace, check_engine
+
+
+class TestIC3(unittest.TestCase):
+
+    def test_ic3(self):
+        def check(ts_enc):
+            ic3 = IC3(ts_enc.helper, ts_enc.get_ts_encoding(),
+                      ts_enc.error_prop)
+            (res, cex) = ic3.prove(50)
+            # the systems are small, 50 frames are enough
+            self.assertTrue(res != IC3.UNKNOWN)
+
+            stats = ic3.get_stats()
+            self.assertEqual(stats["lemmas"], sum(stats["frame_lemmas"]))
+            self.assertEqual(stats["frames"], len(stats["frame_lemmas"]))
+            return (res, cex)
+        check_engine(self, check)
+
+    def test_invariants(self):
+        ctrace = get_trace()
+        specs = ["SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()",
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2();" +
+                 "SPEC TRUE[*]; [CI] [ENTRY] [l] void m5() |+ [CI] [ENTRY] [l] void m2()"]
+
+        safe = 0
+        for spec_str in specs:
+            spec_list = Spec.get_specs_from_string(spec_str)
+            ts_enc = TSEncoder(ctrace, spec_list)
+            ts = ts_enc.get_ts_encoding()
+
+            ic3 = IC3(ts_enc.helper, ts, ts_enc.error_prop)
+            (res, cex) = ic3.prove(50)
+            if res != IC3.SAFE:
+                continue
+            safe = safe + 1
+            lemmas = ic3.get_lemmas()
+
+            # the lemmas of the invariant are accepted as seeds
+            seeded = IC3(ts_enc.helper, ts, ts_enc.error_prop, lemmas)
+            (res, cex) = seeded.prove(50)
+            self.assertEqual(res, IC3.SAFE)
+            self.assertEqual(seeded.get_stats()["invariants"], len(lemmas))
+
+            # the invariants that do not hold are discarded
+            seeded = IC3(ts_enc.helper, ts, ts_enc.error_prop,
+                         [FALSE()] + [Not(l) for l in lemmas])
+            (res, cex) = seeded.prove(50)
+            self.assertEqual(res, IC3.SAFE)
+            self.assertEqual(seeded.get_stats()["invariants"], 0)
+        self.assertTrue(safe > 0)
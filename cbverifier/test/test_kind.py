@@ -0,0 +1,52 @@
+""" Test the k-induction engine
+
+"""
+
+import unittest
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from cbverifier.encoding.encoder import TSEncoder
+from cbverifier.specs.spec import Spec
+from cbverifier.bmc.kind import KInduction
+from cbverifier.bmc.explicit import ExplicitReachability
+
+from cbverifier.test.test_explicit import get_trace, check_engine
+
+
+class TestKInduction(unittest.TestCase):
+
+    def test_kind(self):
+        def check(ts_enc):
+            kind = KInduction(ts_enc.helper, ts_enc.get_ts_encoding(),
+                              ts_enc.error_prop)
+            return kind.prove(20)
+        check_engine(self, check)
+
+    def test_bound(self):
+        ctrace = get_trace()
+        spec_list = Spec.get_specs_from_string("SPEC TRUE[*]; [CI] [ENTRY] [l] void m3() |- [CI] [ENTRY] [l] void m2()")
+        ts_enc = TSEncoder(ctrace, spec_list)
+
+        # the explicit engine finds the shortest path to the error
+        (_, explicit_cex) = ExplicitReachability(ts_enc).find_bug()
+        self.assertTrue(explicit_cex is not None)
+        depth = len(explicit_cex) - 1
+
+        # the error is not reachable in less than depth steps, and
+        # the property is not inductive
+        kind = KInduction(ts_enc.helper, ts_enc.get_ts_encoding(),
+                          ts_enc.error_prop)
+        (res, cex) = kind.prove(depth - 1)
+        self.assertEqual(res, KInduction.UNKNOWN)
+        self.assertTrue(cex is None)
+
+        # the shortest path to the error
+        kind = KInduction(ts_enc.helper, ts_enc.get_ts_encoding(),
+                          ts_enc.error_prop)
+        (res, cex) = kind.prove(depth)
+        self.assertEqual(res, KInduction.UNSAFE)
+        self.assertEqual(len(cex), len(explicit_cex))
@@ -1,6 +1,7 @@
 """ Test the construction of the automaton from a regexp """
 
 import logging
+import sys
 import unittest
 
 try:
@@ -23,7 +24,11 @@ from pysmt.shortcuts import Not, And, Or, Implies, Iff, ExactlyOne
 class TestRegExpToAuto(unittest.TestCase):
 
     def test_regexptoauto(self):
-        auto_env = AutoEnv.get_global_auto_env()
+        self._test_regexptoauto_aux(AutoEnv.get_global_auto_env())
+        self._test_regexptoauto_aux(AutoEnv(get_env(),
+                                            labels=AutoEnv.EXPLICIT_LABELS))
+
+    def _test_regexptoauto_aux(self, auto_env):
         # auto_env = AutoEnv(get_env(), True)
         cenc = CounterEnc(auto_env.pysmt_env)
         alphabet = set(["[CB]_[ENTRY]_void m1()(1)","[CI]_[ENTRY]_void m2()(1)",
@@ -130,3 +135,51 @@ class TestRegExpToAuto(unittest.TestCase):
         auto = r2a.get_from_regexp(regexp)
         res = Automaton.get_singleton(env.new_label(And(l_m1_entry, l_m1_exit)))
         self.assertTrue(auto.is_equivalent(res))
+
+    def test_regexptoauto_cache(self):
+        auto_env = AutoEnv.get_global_auto_env()
+        alphabet = set(["[CB]_[ENTRY]_void m1()(1)","[CI]_[ENTRY]_void m2()(1)"])
+
+        spec_list = Spec.get_specs_from_string("SPEC [CB] [ENTRY] [1] void m1()[*]; [CI] [ENTRY] [1] void m2() |- TRUE; " +
+                                               "SPEC ([CB] [ENTRY] [1] void m1()[*]; [CI] [ENTRY] [1] void m2())[*] |- TRUE")
+        regexp_1 = get_regexp_node(spec_list[0].ast)
+        regexp_2 = get_regexp_node(spec_list[1].ast)
+
+        r2a = RegExpToAuto(CounterEnc(auto_env.pysmt_env), alphabet,
+                           TSMapback(auto_env.pysmt_env, None, None),
+                           auto_env)
+        auto_1 = r2a.get_from_regexp(regexp_1)
+        self.assertEqual((0, 5), r2a.get_cache_stats())
+        # the same regexp is not converted again
+        self.assertTrue(auto_1 is r2a.get_from_regexp(regexp_1))
+        self.assertEqual((1, 5), r2a.get_cache_stats())
+        # regexp_1 is a sub-expression of regexp_2
+        auto_2 = r2a.get_from_regexp(regexp_2)
+        self.assertEqual((2, 7), r2a.get_cache_stats())
+
+        # the least recently used automata are evicted
+        r2a_lru = RegExpToAuto(CounterEnc(auto_env.pysmt_env), alphabet,
+                               TSMapback(auto_env.pysmt_env, None, None),
+                               auto_env, 2)
+        self.assertTrue(auto_2.is_equivalent(r2a_lru.get_from_regexp(regexp_2)))
+        self.assertEqual(2, len(r2a_lru.cache))
+        self.assertTrue(auto_1.is_equivalent(r2a_lru.get_from_regexp(regexp_1)))
+        self.assertEqual((0, 11), r2a_lru.get_cache_stats())
+
+    def test_regexptoauto_nested(self):
+        """ The conversion does not hit the recursion limit """
+        auto_env = AutoEnv(get_env(), labels=AutoEnv.EXPLICIT_LABELS)
+        alphabet = set(["[CB]_[ENTRY]_void m1()(1)"])
+        r2a = RegExpToAuto(CounterEnc(auto_env.pysmt_env), alphabet,
+                           TSMapback(auto_env.pysmt_env, None, None),
+                           auto_env)
+
+        spec_list = Spec.get_specs_from_string("SPEC [CB] [ENTRY] [1] void m1() |- TRUE")
+        atom = get_regexp_node(spec_list[0].ast)
+        regexp = atom
+        for i in range(sys.getrecursionlimit()):
+            regexp = new_or(regexp, atom)
+
+        auto = r2a.get_from_regexp(regexp)
+        res = r2a.get_from_regexp(atom)
+        self.assertTrue(auto.is_equivalent(res))
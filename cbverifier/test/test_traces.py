@@ -11,15 +11,27 @@ try:
 except ImportError:
     import unittest
 
+import bz2
+import gzip
 import io
+import json
 import os
+import shutil
+import StringIO
+import tempfile
 from google.protobuf.internal import encoder
+from google.protobuf.message import DecodeError
+from google.protobuf.json_format import Parse
 
 
 import cbverifier.test.examples
 import cbverifier.traces.tracemsg_pb2 as tracemsg_pb2
 from  cbverifier.traces.tracemsg_pb2 import TraceMsgContainer
 from cbverifier.traces.ctrace import CTraceSerializer, MalformedTraceException, FrameworkOverride, TraceConverter
+from cbverifier.traces.ctrace import CTraceDelimitedReader, CTraceJsonReader
+from cbverifier.traces.ctrace import lzma
+from cbverifier.traces.trace_cache import TraceCache
+from cbverifier.utils.stats import Stats
 
 
 class TestTraces(unittest.TestCase):
@@ -379,6 +391,225 @@ class TestTraces(unittest.TestCase):
             t2 = os.path.join(test_path, "trace_truncated_non_recoverable")
             trace = CTraceSerializer.read_trace_file_name(t2, False)
 
+    def test_compact_values(self):
+        cb_entry = self._get_cb_entry()
+        cb_exit = self._get_cb_exit()
+        ci_entry = self._get_ci_entry()
+        ci_exit = self._get_ci_exit()
+
+        trace = self.write_and_get([cb_entry, ci_entry, ci_exit, cb_exit,
+                                    cb_entry, cb_exit])
+        self.assertTrue(2 == len(trace.children))
+        cb1 = trace.children[0]
+        cb2 = trace.children[1]
+        ci = cb1.children[0]
+
+        # no __dict__ for the messages and the values
+        for obj in [cb1, ci, cb1.params[0]]:
+            with self.assertRaises(AttributeError):
+                obj.new_attribute = 1
+
+        # equal values are shared
+        self.assertTrue(cb1.params[0] is cb1.params[1])
+        self.assertTrue(cb1.params[0] is cb2.params[0])
+        self.assertTrue(cb1.params[0] is ci.params[0])
+        self.assertTrue(cb1.method_name is cb2.method_name)
+
+        # the copy has new messages with the same content
+        trace_copy = trace.copy()
+        self.assertTrue(2 == len(trace_copy.children))
+        cb1_copy = trace_copy.children[0]
+        self.assertFalse(cb1_copy is cb1)
+        self.assertTrue(cb1_copy.params == cb1.params)
+        self.assertTrue(3 == len(cb1_copy.fmwk_overrides))
+        self.assertTrue(trace.get_total_msg() == trace_copy.get_total_msg())
+
+    def test_delimited_reader_order(self):
+        def get_msgs(ids):
+            msgs = []
+            for i in ids:
+                cb_entry = self._get_cb_entry()
+                cb_entry.msg.message_id = i
+                msgs.append(cb_entry)
+            return msgs
+
+        def read_ids(buff, window, run_size=None):
+            buff.seek(0)
+            reader = CTraceDelimitedReader(buff, window, run_size)
+            ids = [m.msg.message_id for m in reader]
+            reader.close()
+            return (ids, reader.is_external)
+
+        ids = [2, 1, 3, 5, 4, 6, 0, 9, 8, 7]
+        msgs = get_msgs(ids)
+
+        f = io.BytesIO()
+        self.write_proto(f, msgs)
+
+        # the window is large enough
+        (res, is_external) = read_ids(f, len(ids))
+        self.assertFalse(is_external)
+        self.assertTrue(sorted(ids) == res)
+
+        # message 0 is out of the window
+        for run_size in [None, 1, 3, 100]:
+            (res, is_external) = read_ids(f, 2, run_size)
+            self.assertTrue(is_external)
+            self.assertTrue(sorted(ids) == res)
+
+        # read from a memory mapped file
+        tmp_file = tempfile.NamedTemporaryFile(delete=False)
+        try:
+            self.write_proto(tmp_file, msgs)
+            tmp_file.close()
+            with open(tmp_file.name, "rb") as trace_file:
+                (res, is_external) = read_ids(trace_file, 2, 3)
+                self.assertTrue(is_external)
+                self.assertTrue(sorted(ids) == res)
+        finally:
+            os.remove(tmp_file.name)
+
+        # closing the reader removes the runs of the external sort
+        f.seek(0)
+        reader = CTraceDelimitedReader(f, 2, 3)
+        runs = []
+        write_run = reader._write_run
+        def record_run(run):
+            run_file = write_run(run)
+            runs.append(run_file)
+            return run_file
+        reader._write_run = record_run
+        next(reader)
+        self.assertTrue(len(runs) > 0)
+        reader.close()
+        self.assertTrue(all(r.closed for r in runs))
+
+        # truncated stream
+        f = io.BytesIO()
+        self.write_proto(f, msgs)
+        data = f.getvalue()
+        f = io.BytesIO(data[:len(data) - 3])
+        reader = CTraceDelimitedReader(f, len(ids))
+        read = []
+        with self.assertRaises(DecodeError):
+            for m in reader:
+                read.append(m.msg.message_id)
+        self.assertTrue(sorted(ids[:-1]) == read)
+
+    def test_json_reader(self):
+        def read_all(data, chunk_size):
+            reader = CTraceJsonReader(io.BytesIO(data))
+            reader.CHUNK_SIZE = chunk_size
+            return [m.SerializeToString() for m in reader]
+
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+        for name in os.listdir(test_path):
+            if not name.endswith(".json") or not name.startswith("trace"):
+                continue
+            with open(os.path.join(test_path, name), "r") as f:
+                data = f.read()
+
+            expected = []
+            for json_msg in json.loads(data):
+                cont = tracemsg_pb2.TraceMsgContainer()
+                Parse(json.dumps(json_msg), cont)
+                expected.append(cont.SerializeToString())
+
+            # small chunks split the messages and the numbers
+            for chunk_size in [1, 3, 7, 1 << 16]:
+                self.assertTrue(expected == read_all(data, chunk_size))
+
+        self.assertTrue([] == read_all(" [ ] ", 1))
+        with self.assertRaises(ValueError):
+            read_all("[{\"msg\" : {}} {}]", 2)
+        with self.assertRaises(ValueError):
+            read_all("[{\"msg\" : {}}, {\"msg\"", 2)
+
+    def test_compressed_traces(self):
+        def get_trace_str(trace):
+            stream = StringIO.StringIO()
+            trace.print_trace(stream, True)
+            return stream.getvalue()
+
+        def compress(file_name, out_file, compression):
+            with open(file_name, "rb") as f:
+                data = f.read()
+            if compression == "gz":
+                out = gzip.GzipFile(out_file, "wb")
+            elif compression == "bz2":
+                out = bz2.BZ2File(out_file, "wb")
+            else:
+                out = lzma.LZMAFile(out_file, "wb")
+            out.write(data)
+            out.close()
+
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+        traces = [(os.path.join(test_path, "trace1.json"), True),
+                  (os.path.join(test_path, "trace_truncated_recoverable"), False)]
+
+        compressions = ["gz", "bz2"]
+        if lzma is not None:
+            compressions.append("xz")
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for (trace_file, is_json) in traces:
+                expected = get_trace_str(CTraceSerializer.read_trace_file_name(trace_file,
+                                                                               is_json))
+                for compression in compressions:
+                    out_file = os.path.join(tmp_dir, "trace." + compression)
+                    compress(trace_file, out_file, compression)
+                    trace = CTraceSerializer.read_trace_file_name(out_file,
+                                                                  is_json)
+                    self.assertTrue(expected == get_trace_str(trace))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_trace_cache(self):
+        test_path = os.path.dirname(cbverifier.test.examples.__file__)
+        t1 = os.path.join(test_path, "trace1.json")
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = TraceCache(cache_dir)
+            stats = Stats()
+            stats.enable()
+
+            trace = CTraceSerializer.read_trace_file_name(t1, True, True,
+                                                          cache, stats)
+            self.assertTrue(0 == stats.get_counter(Stats.TRACE_CACHE_HITS))
+            self.assertTrue(1 == stats.get_counter(Stats.TRACE_CACHE_MISSES))
+
+            cached = CTraceSerializer.read_trace_file_name(t1, True, True,
+                                                           cache, stats)
+            self.assertTrue(1 == stats.get_counter(Stats.TRACE_CACHE_HITS))
+            self.assertTrue(1 == stats.get_counter(Stats.TRACE_CACHE_MISSES))
+
+            self.assertFalse(trace is cached)
+            self.assertTrue(trace.get_total_msg() == cached.get_total_msg())
+            s1 = StringIO.StringIO()
+            trace.print_trace(s1, True)
+            s2 = StringIO.StringIO()
+            cached.print_trace(s2, True)
+            self.assertTrue(s1.getvalue() == s2.getvalue())
+
+            # different reader options
+            CTraceSerializer.read_trace_file_name(t1, True, False,
+                                                  cache, stats)
+            self.assertTrue(2 == stats.get_counter(Stats.TRACE_CACHE_MISSES))
+
+            # corrupted entry
+            key = TraceCache.get_key(t1, True, True, True)
+            with open(cache._get_file_name(key), "wb") as f:
+                f.write("corrupted")
+            self.assertTrue(cache.load(key) is None)
+            CTraceSerializer.read_trace_file_name(t1, True, True,
+                                                  cache, stats)
+            self.assertTrue(3 == stats.get_counter(Stats.TRACE_CACHE_MISSES))
+            self.assertTrue(cache.load(key) is not None)
+        finally:
+            shutil.rmtree(cache_dir)
+
     def test_missing_return(self):
         test_path = os.path.dirname(cbverifier.test.examples.__file__)
 
@@ -12,7 +12,24 @@ import logging
 import json # for reading the traces from file
 import re
 
+import bz2
 import copy
+import gzip
+import heapq
+import io
+import mmap
+import shutil
+import struct
+import tempfile
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        # xz compressed traces are not supported
+        lzma = None
 
 import StringIO
 
@@ -26,6 +43,13 @@ except ImportError as e:
     sys.stderr.write("We require at least protobuf version 3.0")
     raise e
 
+try:
+    from google.protobuf.json_format import ParseDict
+except ImportError:
+    # ParseDict is available from protobuf 3.2
+    def ParseDict(js_dict, msg):
+        return Parse(json.dumps(js_dict), msg)
+
 # Read a message from Java's writeDelimitedTo:
 import google.protobuf.internal.decoder as decoder
 
@@ -33,6 +57,9 @@ from google.protobuf import message
 
 import tracemsg_pb2
 
+from cbverifier.traces.trace_cache import TraceCache
+from cbverifier.utils.stats import Stats
+
 class MessageFilter:
     @staticmethod
     def typeFilterFrom(filter):
@@ -60,8 +87,14 @@ class TraceEndsInErrorException(Exception):
 
 class CMessage(object):
     """ Base class that represents a concrete message.
+
+    The messages use __slots__: a trace contains millions of messages
+    and a __dict__ for each of them dominates the memory.
     """
 
+    __slots__ = ("message_id", "thread_id", "class_name", "method_name",
+                 "params", "return_value", "exception", "children")
+
     def __init__(self,
                  message_id = -1,
                  thread_id = None,
@@ -211,6 +244,9 @@ class CMessage(object):
 class CCallback(CMessage):
     """ Represents a callback message
     """
+
+    __slots__ = ("fmwk_overrides",)
+
     def __init__(self,
                  message_id = -1,
                  thread_id = None,
@@ -241,6 +277,9 @@ class CCallback(CMessage):
 class CCallin(CMessage):
     """ Represents a callin message
     """
+
+    __slots__ = ()
+
     def __init__(self,
                  message_id = -1,
                  thread_id = None,
@@ -270,7 +309,14 @@ class AppInfo(object):
 class CValue(object):
     """ Represent the concrete value of an object recorded in a
     concrete trace
+
+    A value must not be changed after it is read from the trace
+    (the values are shared among messages, see CValuePool).
     """
+
+    __slots__ = ("is_null", "type", "fmwk_type", "object_id", "value",
+                 "_hash")
+
     def __init__(self, value_msg=None):
         self._hash = None
         if value_msg is not None:
@@ -360,6 +406,11 @@ class CValue(object):
 
         return self._hash
 
+    def __deepcopy__(self, memo):
+        # Values are not modified after reading the trace, and they
+        # can be shared by the copies of the messages
+        return self
+
     def __eq__(self, other):
         return (type(self) == type(other) and
                 self.is_null == other.is_null and
@@ -369,6 +420,39 @@ class CValue(object):
                 self.value == other.value)
 
 
+class CValuePool(object):
+    """ Shares the objects read from a single trace.
+
+    The values with the same content (e.g. the receiver of all the
+    callins of an activity) are represented by the same CValue
+    object, and the class, method and type names are stored once.
+    """
+
+    __slots__ = ("_values", "_strings")
+
+    def __init__(self):
+        self._values = {}
+        self._strings = {}
+
+    def intern(self, string):
+        """ Returns the shared copy of string """
+        if string is None:
+            return None
+        return self._strings.setdefault(string, string)
+
+    def get_value(self, value):
+        """ Returns the shared CValue equal to value """
+        value.type = self.intern(value.type)
+        value.fmwk_type = self.intern(value.fmwk_type)
+
+        key = (value.type, value.object_id, value.value,
+               value.is_null, value.fmwk_type)
+        return self._values.setdefault(key, value)
+
+    def __len__(self):
+        return len(self._values)
+
+
 class FrameworkOverride:
     """ Represents a class or interface in the framework that
     implements or defines a specific method."""
@@ -485,17 +569,97 @@ class CTraceSerializer:
     @staticmethod
     def read_trace_file_name(trace_file_name,
                              is_json=False,
-                             allow_exception=True):
-        if is_json:
-            trace_file = open(trace_file_name, "r")
+                             allow_exception=True,
+                             trace_cache=None,
+                             stats=None):
+        """ Read the trace from the file trace_file_name.
+
+        The trace is loaded from trace_cache, if the cache contains it.
+        If trace_cache is None, the cache in the CBVERIFIER_TRACE_CACHE
+        directory is used (if the variable is set).
+        """
+        ignore_non_ui_threads = True
+
+        if trace_cache is None:
+            trace_cache = TraceCache.get_default()
+
+        if trace_cache is not None:
+            key = TraceCache.get_key(trace_file_name, is_json,
+                                     ignore_non_ui_threads,
+                                     allow_exception)
+            trace = trace_cache.load(key)
+            if trace is not None:
+                if stats is not None:
+                    stats.inc_counter(Stats.TRACE_CACHE_HITS)
+                return trace
+            elif stats is not None:
+                stats.inc_counter(Stats.TRACE_CACHE_MISSES)
+
+        trace_file = CTraceSerializer.open_trace_file(trace_file_name,
+                                                      is_json)
+        try:
+            trace = CTraceSerializer.read_trace(trace_file,
+                                                is_json,
+                                                ignore_non_ui_threads,
+                                                allow_exception)
+        finally:
+            trace_file.close()
+
+        if trace_cache is not None:
+            trace_cache.store(key, trace)
+
+        return trace
+
+
+    # magic bytes of the compressed files
+    GZIP_MAGIC = "\x1f\x8b"
+    BZ2_MAGIC = "BZh"
+    XZ_MAGIC = "\xfd7zXZ\x00"
+
+    # size of the blocks decompressed at once
+    DECOMPRESS_CHUNK = 1 << 20
+
+    @staticmethod
+    def open_trace_file(trace_file_name, is_json=False):
+        """ Open the trace file, decompressing it if it is compressed
+        with gzip, bz2 or xz (the compression is detected from the
+        first bytes of the file).
+
+        The json reader reads directly the decompressed stream.
+        The delimited reader needs to access the trace twice, so the
+        decompressed stream is written block by block to an anonymous
+        temporary file (that is then memory mapped by the reader).
+        """
+        trace_file = open(trace_file_name, "rb")
+        magic = trace_file.read(len(CTraceSerializer.XZ_MAGIC))
+        trace_file.seek(0)
+
+        if magic.startswith(CTraceSerializer.GZIP_MAGIC):
+            stream = gzip.GzipFile(fileobj=trace_file, mode="rb")
+        elif magic.startswith(CTraceSerializer.BZ2_MAGIC):
+            trace_file.close()
+            stream = bz2.BZ2File(trace_file_name, "rb")
+        elif magic.startswith(CTraceSerializer.XZ_MAGIC):
+            if lzma is None:
+                trace_file.close()
+                raise Exception("Cannot read the xz compressed trace %s " \
+                                "(the lzma module is not available)" % trace_file_name)
+            stream = lzma.LZMAFile(trace_file, "rb")
         else:
-            trace_file = open(trace_file_name, "rb")
+            return trace_file
 
-        return CTraceSerializer.read_trace(trace_file,
-                                           is_json,
-                                           True,
-                                           allow_exception)
+        if is_json:
+            return stream
 
+        try:
+            spool = tempfile.TemporaryFile()
+            shutil.copyfileobj(stream, spool,
+                               CTraceSerializer.DECOMPRESS_CHUNK)
+            spool.seek(0)
+        finally:
+            stream.close()
+            trace_file.close()
+        return spool
 
     @staticmethod
     def read_trace(trace_file,
@@ -525,6 +689,9 @@ class CTraceSerializer:
                 logging.warning("Last callback truncated")
             else:
                 raise
+        finally:
+            if not is_json:
+                reader.close()
 
         return trace
 
@@ -534,6 +701,7 @@ class CTraceSerializer:
                          ignore_non_ui_threads=True,
                          allow_exception = True):
         message_stack = []
+        value_pool = CValuePool()
         for tm_container in reader:
             assert None != tm_container
 
@@ -551,7 +719,8 @@ class CTraceSerializer:
                     logging.debug("Ignored message:\n%s\n" % str(recorded_message))
             elif CTraceSerializer.is_entry_message(recorded_message):
                 # create the trace message
-                trace_message = CTraceSerializer.create_trace_message(recorded_message)
+                trace_message = CTraceSerializer.create_trace_message(recorded_message,
+                                                                      value_pool)
                 message_stack.append(trace_message)
             else:
                 assert (CTraceSerializer.is_exit_message(recorded_message) or
@@ -562,7 +731,8 @@ class CTraceSerializer:
                 # update trace_message with recorded_message
                 if (CTraceSerializer.is_exit_message(recorded_message)):
                     CTraceSerializer.update_trace_message(trace_message,
-                                                          recorded_message)
+                                                          recorded_message,
+                                                          value_pool)
                 else:
                     assert (CTraceSerializer.is_exception_message(recorded_message))
 
@@ -572,7 +742,8 @@ class CTraceSerializer:
                                                         "(the trace already reaches an error)")
 
                     CTraceSerializer.update_trace_message(trace_message,
-                                                          recorded_message)
+                                                          recorded_message,
+                                                          value_pool)
 
                 if (len(message_stack) == 0):
                     assert (isinstance(trace_message, CCallback))
@@ -613,9 +784,12 @@ class CTraceSerializer:
 
 
     @staticmethod
-    def create_trace_message(msg):
+    def create_trace_message(msg, value_pool=None):
         assert CTraceSerializer.is_entry_message(msg)
 
+        if value_pool is None:
+            value_pool = CValuePool()
+
         trace_msg = None
 
         if (TraceMsgContainer.TraceMsg.CALLIN_ENTRY == msg.type):
@@ -624,11 +798,13 @@ class CTraceSerializer:
 
             trace_msg.message_id = msg.message_id
             trace_msg.thread_id = msg.thread_id
-            trace_msg.class_name = ci.class_name
-            trace_msg.method_name = ci.method_name
+            trace_msg.class_name = value_pool.intern(ci.class_name)
+            trace_msg.method_name = value_pool.intern(ci.method_name)
 
             (ret_type, param_types) = CTraceSerializer.get_method_types(trace_msg.method_name)
-            trace_msg.params = CTraceSerializer.get_params(ci.param_list, param_types)
+            trace_msg.params = CTraceSerializer.get_params(ci.param_list,
+                                                           param_types,
+                                                           value_pool)
             trace_msg.return_value = None
 
         elif (TraceMsgContainer.TraceMsg.CALLBACK_ENTRY == msg.type):
@@ -637,11 +813,13 @@ class CTraceSerializer:
 
             trace_msg.message_id = msg.message_id
             trace_msg.thread_id = msg.thread_id
-            trace_msg.class_name = cb.class_name
-            trace_msg.method_name = cb.method_name
+            trace_msg.class_name = value_pool.intern(cb.class_name)
+            trace_msg.method_name = value_pool.intern(cb.method_name)
 
             (ret_type, param_types) = CTraceSerializer.get_method_types(trace_msg.method_name)
-            trace_msg.params = CTraceSerializer.get_params(cb.param_list, param_types)
+            trace_msg.params = CTraceSerializer.get_params(cb.param_list,
+                                                           param_types,
+                                                           value_pool)
             trace_msg.return_value = None
 
             overrides = []
@@ -649,14 +827,14 @@ class CTraceSerializer:
             # Issue 107 (link to 103)
             # Workaround for trace runner bug 17
             if ("<init>" in trace_msg.method_name):
-                trace_override = FrameworkOverride(cb.receiver_first_framework_super,
-                                                   cb.method_name,
+                trace_override = FrameworkOverride(value_pool.intern(cb.receiver_first_framework_super),
+                                                   trace_msg.method_name,
                                                    False)
                 overrides.append(trace_override)
 
             for override in cb.framework_overrides:
-                trace_override = FrameworkOverride(override.class_name,
-                                                   override.method,
+                trace_override = FrameworkOverride(value_pool.intern(override.class_name),
+                                                   value_pool.intern(override.method),
                                                    override.is_interface)
                 overrides.append(trace_override)
             trace_msg.fmwk_overrides = overrides
@@ -669,7 +847,7 @@ class CTraceSerializer:
 
 
     @staticmethod
-    def update_trace_message(trace_msg, msg):
+    def update_trace_message(trace_msg, msg, value_pool=None):
         """ Update trace_msg with the exit message msg.
 
         The function assumes that msg is either a callin exit or a
@@ -738,6 +916,9 @@ class CTraceSerializer:
         assert (CTraceSerializer.is_exit_message(msg) or
                 CTraceSerializer.is_exception_message(msg))
 
+        if value_pool is None:
+            value_pool = CValuePool()
+
         check_malformed_trace_msg(trace_msg, msg)
         if (TraceMsgContainer.TraceMsg.CALLIN_EXIT == msg.type):
             callinExit = msg.callinExit
@@ -745,13 +926,17 @@ class CTraceSerializer:
             if (callinExit.HasField("return_value")):
 
                 (ret_type, param_types) = CTraceSerializer.get_method_types(trace_msg.method_name)
-                trace_msg.return_value = CTraceSerializer.read_value_msg(callinExit.return_value, ret_type)
+                trace_msg.return_value = CTraceSerializer.read_value_msg(callinExit.return_value,
+                                                                         ret_type,
+                                                                         value_pool)
         elif (TraceMsgContainer.TraceMsg.CALLBACK_EXIT == msg.type):
             callbackExit = msg.callbackExit
             check_malformed_trace(trace_msg, callbackExit, CCallback, "CALLBACK_EXIT")
             if (callbackExit.HasField("return_value")):
                 (ret_type, param_types) = CTraceSerializer.get_method_types(trace_msg.method_name)
-                trace_msg.return_value = CTraceSerializer.read_value_msg(callbackExit.return_value, ret_type)
+                trace_msg.return_value = CTraceSerializer.read_value_msg(callbackExit.return_value,
+                                                                         ret_type,
+                                                                         value_pool)
             else:
                 # HACK FOR ISSUE # OF TRACERUNNER
                 # Tracerunner does not record the return value of a callback if it is NULL.
@@ -765,7 +950,7 @@ class CTraceSerializer:
                     v.is_null = True
                     v.type = ret_type
                     v.value = None
-                    trace_msg.return_value = v
+                    trace_msg.return_value = value_pool.get_value(v)
 
         elif (TraceMsgContainer.TraceMsg.CALLIN_EXEPION  == msg.type):
             # check_malformed_trace_exception(trace_msg, msg.callinException, CCallin, "CALLIN_EXCEPTION")
@@ -779,7 +964,7 @@ class CTraceSerializer:
 
 
     @staticmethod
-    def get_params(param_list, types_list = None):
+    def get_params(param_list, types_list = None, value_pool = None):
         new_param_list = []
 
         # -1: ignore the receiver, that is not in the types types
@@ -796,17 +981,23 @@ class CTraceSerializer:
             else:
                 param_type = None
 
-            param_value = CTraceSerializer.read_value_msg(param, param_type)
+            param_value = CTraceSerializer.read_value_msg(param,
+                                                          param_type,
+                                                          value_pool)
             new_param_list.append(param_value)
         return new_param_list
 
     @staticmethod
-    def read_value_msg(value_msg, value_type = None):
+    def read_value_msg(value_msg, value_type = None, value_pool = None):
         value = CValue(value_msg)
 
         if (value_type is not None):
             value = TraceConverter.convert_traceval(value, value_type)
 
+        # Share the value only after the conversion, that changes it
+        if value_pool is not None:
+            value = value_pool.get_value(value)
+
         return value
 
 
@@ -845,6 +1036,24 @@ class CTraceDelimitedReader(object):
     https://groups.google.com/forum/#!topic/protobuf/zjWySHr1L04
     parseDelimitedTo(),
 
+    The messages are returned ordered by message_id.
+
+    The reader does not load the trace in memory: the file is
+    memory-mapped (when possible) and each TraceMsgContainer is decoded
+    only when it is returned.
+    TraceRunner writes the messages almost in order, so the reader
+    keeps a heap of at most reorder_window decoded messages to fix
+    the messages that arrive out of order.
+
+    A first, cheap pass over the stream reads only the message ids
+    and checks if the window is large enough to sort the trace.
+    If it is not, the reader falls back to an external sort: it
+    sorts runs of (message_id, offset, size) on temporary files, merges
+    them, and then decodes the messages from their offsets.
+
+    If the trace is truncated, the reader returns all the messages
+    before the truncation point and then raises a DecodeError.
+
 
     USAGE:
     ifile = open(protofile, "rb")
@@ -853,74 +1062,262 @@ class CTraceDelimitedReader(object):
       m is the message
 
     """
-    def __init__(self,trace_file):
-        # ISSUE: read all the data at once
-        # limited by _DecodeVarint implementation
-        self.data = trace_file.read()
+
+    # Number of out-of-order messages buffered in memory
+    REORDER_WINDOW = 4096
+    # Number of index entries sorted in memory in the external sort
+    EXTERNAL_RUN_SIZE = 1 << 16
+
+    # (message_id, seq, offset, size) entries of the external sort
+    _RUN_ENTRY = struct.Struct("<QQQQ")
+
+    _MSG_FIELD = TraceMsgContainer.DESCRIPTOR.fields_by_name["msg"].number
+    _ID_FIELD = TraceMsgContainer.TraceMsg.DESCRIPTOR.fields_by_name["message_id"].number
+
+    def __init__(self, trace_file,
+                 reorder_window = None,
+                 external_run_size = None):
+        self.reorder_window = (CTraceDelimitedReader.REORDER_WINDOW
+                               if reorder_window is None else reorder_window)
+        self.external_run_size = (CTraceDelimitedReader.EXTERNAL_RUN_SIZE
+                                  if external_run_size is None
+                                  else external_run_size)
+        assert self.reorder_window >= 0
+        assert self.external_run_size > 0
+
+        self.data = None
+        self._mmap = None
+        try:
+            # fileno() of a decompressing stream is the fd of the
+            # compressed file
+            if not isinstance(trace_file, (file, io.FileIO, io.BufferedReader)):
+                raise ValueError("Not a file")
+            self._mmap = mmap.mmap(trace_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            self.data = self._mmap
+        except (AttributeError, IOError, OSError, ValueError,
+                io.UnsupportedOperation):
+            # Not a real file (e.g. an in-memory buffer or a
+            # decompressing stream) or an empty file, that cannot be
+            # mapped
+            self.data = trace_file.read()
         self.size = len(self.data)
-        self.position = 0
-        self.list_position = 0
-        self.pbufs = []
-        class ReadIter:
-            def __init__(self,v):
-                self.v = v
-            def __iter__(self):
-                return self
-            def next(self):
-                return self.v.inext()
-        ri = ReadIter(self)
-
-        for msg in ri:
-            self.pbufs.append(msg)
-
-        sortpbufs = sorted(self.pbufs, key=lambda m : m.msg.message_id)
-        self.pbufs = sortpbufs
 
-    def next(self):
-        list_position = self.list_position
-        self.list_position += 1
-        if list_position < len(self.pbufs):
-            return self.pbufs[list_position]
-        else:
-            raise StopIteration()
+        # Set by the first pass
+        self.end = self.size
+        self.truncated = False
+        self.is_external = False
+
+        in_window = self._scan_ids()
+        self.is_external = not in_window
 
+        if self.is_external:
+            logging.debug("Messages out of the reorder window, " \
+                          "using the external sort...")
+            self._iter = self._external_sort_iter()
+        else:
+            self._iter = self._window_iter()
 
     def __iter__(self):
         return self
 
-    def inext(self):
-        """ Read a single trace msg container object from the input
-        file.
+    def next(self):
+        return next(self._iter)
+
+    def close(self):
+        # closing the generator removes the runs of the external sort
+        self._iter.close()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self.data = None
+
+    def _frames(self):
+        """ Iterates through (seq, offset, size) of the delimited
+        messages, up to the end of the valid data """
+        position = 0
+        seq = 0
+        while position < self.end:
+            (size, position) = decoder._DecodeVarint(self.data, position)
+            yield (seq, position, size)
+            position = position + size
+            seq = seq + 1
+
+    def _parse(self, offset, size):
+        trace_msg_container = tracemsg_pb2.TraceMsgContainer()
+        trace_msg_container.ParseFromString(self.data[offset:offset + size])
+        return trace_msg_container
 
-        The input file is a fixed-size (?!) file, where each
-        fixed-sized message
+    def _peek_id(self, offset, size):
+        """ Read the message_id of the message, skipping all the
+        other fields without decoding them.
+
+        Returns None if the message cannot be scanned.
         """
+        data = self.data
+        end = offset + size
+        id_field = None
+        position = offset
 
-        if (self.position >= self.size):
-            raise StopIteration()
+        # find the msg field in the container, then the message_id
+        # field in msg
+        try:
+            for field in (CTraceDelimitedReader._MSG_FIELD,
+                          CTraceDelimitedReader._ID_FIELD):
+                found = None
+                while position < end:
+                    (tag, position) = decoder._DecodeVarint(data, position)
+                    wire_type = tag & 0x7
+                    if wire_type == 0:
+                        (value, position) = decoder._DecodeVarint(data, position)
+                    elif wire_type == 1:
+                        value = None
+                        position = position + 8
+                    elif wire_type == 2:
+                        (length, position) = decoder._DecodeVarint(data, position)
+                        value = (position, position + length)
+                        position = position + length
+                    elif wire_type == 5:
+                        value = None
+                        position = position + 4
+                    else:
+                        # groups are not used in the trace
+                        return None
+
+                    if (tag >> 3) == field:
+                        # the last occurrence of a field wins
+                        found = (wire_type, value)
+
+                if position != end or found is None:
+                    return None
+                if field == CTraceDelimitedReader._MSG_FIELD:
+                    if found[0] != 2:
+                        return None
+                    (position, end) = found[1]
+                else:
+                    if found[0] != 0:
+                        return None
+                    id_field = found[1]
+        except (message.DecodeError, IndexError):
+            return None
 
-        (size, self.position) = decoder._DecodeVarint(self.data, self.position)
+        return id_field
 
-        raw_data = self.data[self.position:self.position + size]
-        self.position = self.position + size
+    def _get_id(self, offset, size):
+        message_id = self._peek_id(offset, size)
+        if message_id is None:
+            # Slow path, and raise the DecodeError if the message
+            # is malformed
+            message_id = self._parse(offset, size).msg.message_id
+        return message_id
 
-        trace_msg_container = tracemsg_pb2.TraceMsgContainer()
-        try:
-            trace_msg_container.ParseFromString(raw_data)
-            pass
-        except message.DecodeError as e:
-            trace_msg_container == None
-            raise
+    def _scan_ids(self):
+        """ First pass on the trace.
 
-        if trace_msg_container == None:
-            raise StopIteration()
-        else:
-            return trace_msg_container
+        Finds the end of the valid data and checks if the messages can
+        be sorted with reorder_window buffered messages, simulating
+        the heap of _window_iter on the message ids.
+        """
+        heap = []
+        last = None
+        in_window = True
+
+        position = 0
+        seq = 0
+        while position < self.size:
+            try:
+                (size, next_pos) = decoder._DecodeVarint(self.data, position)
+                if next_pos + size > self.size:
+                    raise message.DecodeError("Truncated message")
+                message_id = self._get_id(next_pos, size)
+            except (message.DecodeError, IndexError):
+                self.truncated = True
+                break
+
+            position = next_pos + size
+            if in_window:
+                heapq.heappush(heap, (message_id, seq))
+                if len(heap) > self.reorder_window:
+                    key = heapq.heappop(heap)
+                    if last is not None and key < last:
+                        in_window = False
+                    last = key
+            seq = seq + 1
+
+        self.end = position
+        return in_window
+
+    def _window_iter(self):
+        heap = []
+        for (seq, offset, size) in self._frames():
+            msg = self._parse(offset, size)
+            heapq.heappush(heap, (msg.msg.message_id, seq, msg))
+            if len(heap) > self.reorder_window:
+                yield heapq.heappop(heap)[2]
+
+        while len(heap) > 0:
+            yield heapq.heappop(heap)[2]
+
+        self._end_of_trace()
+
+    def _external_sort_iter(self):
+        runs = []
+        try:
+            run = []
+            for (seq, offset, size) in self._frames():
+                run.append((self._get_id(offset, size), seq, offset, size))
+                if len(run) >= self.external_run_size:
+                    runs.append(self._write_run(run))
+                    run = []
+
+            if len(runs) == 0:
+                # everything fits in a single run
+                run.sort()
+                sorted_entries = iter(run)
+            else:
+                if len(run) > 0:
+                    runs.append(self._write_run(run))
+                run = None
+                sorted_entries = heapq.merge(*[self._read_run(r) for r in runs])
+
+            for (message_id, seq, offset, size) in sorted_entries:
+                yield self._parse(offset, size)
+        finally:
+            for r in runs:
+                r.close()
+
+        self._end_of_trace()
+
+    def _write_run(self, run):
+        run.sort()
+        run_file = tempfile.TemporaryFile()
+        entry = CTraceDelimitedReader._RUN_ENTRY
+        for e in run:
+            run_file.write(entry.pack(*e))
+        run_file.seek(0)
+        return run_file
+
+    def _read_run(self, run_file):
+        entry = CTraceDelimitedReader._RUN_ENTRY
+        while True:
+            data = run_file.read(entry.size)
+            if len(data) < entry.size:
+                break
+            yield entry.unpack(data)
+
+    def _end_of_trace(self):
+        if self.truncated:
+            raise message.DecodeError("Truncated message after offset %d" % self.end)
 
 class CTraceJsonReader(object):
     """
     Read the trace from a json file
 
+    The file contains an array of messages. The reader does not load
+    the whole file: it reads the array incrementally, decoding one
+    message at a time, and fills the TraceMsgContainer directly from
+    the decoded dictionary (without going back to the json text).
+
     USAGE:
     ifile = open(protofile, "r")
     reader = CTraceJsonReader(ifile)
@@ -928,22 +1325,109 @@ class CTraceJsonReader(object):
       m is the message
 
     """
+
+    CHUNK_SIZE = 1 << 16
+
+    _WS = re.compile(r'[ \t\n\r]*')
+
     def __init__(self,trace_file):
-        self.data = json.load(trace_file)
+        self.trace_file = trace_file
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
         self.position = 0
+        self.eof = False
+        # True after the opening [, False after the closing ]
+        self.in_array = None
+        self.first = True
 
     def __iter__(self):
         return self
 
+    def _read_more(self, size = None):
+        """ Read more data from the file, returns False at the end of
+        the file """
+        if self.eof:
+            return False
+        if size is None:
+            size = CTraceJsonReader.CHUNK_SIZE
+        data = self.trace_file.read(size)
+        if not data:
+            self.eof = True
+            return False
+        # drop the data that has been already decoded
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+        return True
+
+    def _next_char(self):
+        """ Skips the white spaces and returns the next character
+        (None at the end of the file) """
+        while True:
+            self.position = CTraceJsonReader._WS.match(self.buffer,
+                                                       self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            elif not self._read_more():
+                return None
+
+    def _expect(self, chars):
+        c = self._next_char()
+        if c is None or c not in chars:
+            found = "end of file" if c is None else c
+            raise ValueError("Malformed json trace: expected %s, " \
+                             "found %s" % (" or ".join(chars), found))
+        self.position += 1
+        return c
+
+    def _decode_value(self):
+        """ Decode the next json value in the array """
+        self._next_char()
+        size = CTraceJsonReader.CHUNK_SIZE
+        while True:
+            try:
+                (value, end) = self.decoder.raw_decode(self.buffer,
+                                                       self.position)
+                # a number may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            # the value is not complete, read more data
+            # (double the size to stay linear on big messages)
+            if not self._read_more(size):
+                # try the last time, raising the decode error
+                (value, end) = self.decoder.raw_decode(self.buffer,
+                                                       self.position)
+                self.position = end
+                return value
+            size = size * 2
+
     def next(self):
-        if (self.position >= len(self.data)):
+        if self.in_array is None:
+            self._expect(["["])
+            self.in_array = True
+
+        if not self.in_array:
             raise StopIteration()
 
-        trace_msg_container = tracemsg_pb2.TraceMsgContainer()
+        if self.first:
+            self.first = False
+            if self._next_char() == "]":
+                self.position += 1
+                self.in_array = False
+                raise StopIteration()
+        else:
+            c = self._expect([",", "]"])
+            if c == "]":
+                self.in_array = False
+                raise StopIteration()
 
-        json_str = json.dumps(self.data[self.position])
-        trace_msg_container = Parse(json_str, trace_msg_container)
-        self.position = self.position + 1
+        json_msg = self._decode_value()
+
+        trace_msg_container = tracemsg_pb2.TraceMsgContainer()
+        trace_msg_container = ParseDict(json_msg, trace_msg_container)
 
         return trace_msg_container
 
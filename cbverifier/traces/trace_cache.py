@@ -0,0 +1,102 @@
+""" On-disk cache of the parsed traces.
+
+Parsing a trace (decoding the protobuf messages, converting the values
+and building the message forest) is repeated every time the verifier
+runs on the same trace (e.g. with different specifications).
+
+The cache stores the parsed CTrace in a directory.
+The key of a trace is the SHA1 of the content of the trace file and of
+the options used to read it, so a trace is parsed again if its file or
+the reader options change.
+The trace is stored with the binary pickle protocol, that keeps the
+sharing of the values of the trace (see CValuePool).
+
+"""
+
+import cPickle
+import hashlib
+import logging
+import os
+import tempfile
+
+
+class TraceCache(object):
+    # Change the version when the representation of the trace changes
+    CACHE_VERSION = "1"
+
+    # Environment variable with the default cache directory
+    CACHE_DIR_ENV = "CBVERIFIER_TRACE_CACHE"
+
+    SUFFIX = ".ctrace"
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    @staticmethod
+    def get_default():
+        """ Returns the cache in the directory set in the
+        CBVERIFIER_TRACE_CACHE environment variable, None if the
+        variable is not set.
+        """
+        cache_dir = os.environ.get(TraceCache.CACHE_DIR_ENV)
+        if cache_dir is None or cache_dir == "":
+            return None
+        return TraceCache(cache_dir)
+
+    @staticmethod
+    def get_key(trace_file_name, is_json,
+                ignore_non_ui_threads, allow_exception):
+        """ Returns the key of the trace read with the given options """
+        sha = hashlib.sha1()
+        sha.update("%s:%s:%s:%s\n" % (TraceCache.CACHE_VERSION,
+                                      is_json,
+                                      ignore_non_ui_threads,
+                                      allow_exception))
+        with open(trace_file_name, "rb") as trace_file:
+            while True:
+                data = trace_file.read(1 << 20)
+                if not data:
+                    break
+                sha.update(data)
+        return sha.hexdigest()
+
+    def _get_file_name(self, key):
+        return os.path.join(self.cache_dir, key + TraceCache.SUFFIX)
+
+    def load(self, key):
+        """ Returns the trace stored for key, None if the trace is
+        not in the cache.
+        """
+        file_name = self._get_file_name(key)
+        if not os.path.isfile(file_name):
+            return None
+
+        try:
+            with open(file_name, "rb") as cache_file:
+                return cPickle.load(cache_file)
+        except Exception as e:
+            # stale or corrupted entry, parse the trace again
+            logging.warning("Cannot load the cached trace %s (%s)" % (file_name,
+                                                                      str(e)))
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
+            return None
+
+    def store(self, key, trace):
+        """ Store trace in the cache """
+        # Write to a temporary file and rename it, so that concurrent
+        # runs never read a partial entry
+        (fd, tmp_name) = tempfile.mkstemp(dir=self.cache_dir,
+                                          suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as cache_file:
+                cPickle.dump(trace, cache_file, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_name, self._get_file_name(key))
+        except Exception as e:
+            logging.warning("Cannot store the trace in the cache (%s)" % str(e))
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
@@ -14,9 +14,20 @@ class Stats:
     VERIFICATION_TIME="verification"
     SIMULATION_TIME="simulation"
 
+    TRACE_CACHE_HITS="trace_cache_hits"
+    TRACE_CACHE_MISSES="trace_cache_misses"
+    PRUNED_SPECS="pruned_specs"
+    AUTOMATA_CACHE_HITS="automata_cache_hits"
+    AUTOMATA_CACHE_MISSES="automata_cache_misses"
+    ENCODING_CACHE_HITS="encoding_cache_hits"
+    ENCODING_CACHE_MISSES="encoding_cache_misses"
+    IC3_FRAMES="ic3_frames"
+    IC3_LEMMAS="ic3_lemmas"
+
     def __init__(self):
         self.start_times = {}
         self.end_times = {}
+        self.counters = {}
         self.is_enabled = False
 
     def _diff_times(self, start_time, end_time):
@@ -58,6 +69,44 @@ class Stats:
         stream.write("%s - System time: %f\n" % (timer_name, time_tuple[1]))
         stream.flush()
 
+    def write_elapsed_time(self, stream, timer_name):
+        """ Write the real time elapsed in timer_name """
+        if (not self.is_enabled): return
+
+        time_tuple = self._diff_times(self.start_times[timer_name],
+                                      self.end_times[timer_name])
+
+        stream.write("%s - Elapsed time: %f\n" % (timer_name, time_tuple[4]))
+        stream.flush()
+
+    def inc_counter(self, counter_name, value=1):
+        if (not self.is_enabled): return
+
+        self.counters[counter_name] = self.get_counter(counter_name) + value
+
+    def get_counter(self, counter_name):
+        try:
+            return self.counters[counter_name]
+        except KeyError:
+            return 0
+
+    def write_counter(self, stream, counter_name):
+        if (not self.is_enabled): return
+
+        stream.write("%s: %d\n" % (counter_name, self.get_counter(counter_name)))
+        stream.flush()
+
+    def write_hit_rate(self, stream, hits_counter, misses_counter):
+        """ Write the rate of hits_counter over the sum of the
+        hits_counter and misses_counter """
+        if (not self.is_enabled): return
+
+        hits = self.get_counter(hits_counter)
+        total = hits + self.get_counter(misses_counter)
+        rate = float(hits) / total if total > 0 else 0.0
+        stream.write("%s rate: %.2f\n" % (hits_counter, rate))
+        stream.flush()
+
     def enable(self):
         self.is_enabled = True
 